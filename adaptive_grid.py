@@ -0,0 +1,126 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from analysis_result import AnalysisResult
+from grid_sharding import RANGE_COLUMNS, SHARD_PARALLELISM, grid_ranges, grid_size, point_batches
+from power_engine import run_power_study, stream_power_study
+
+# args key switching an analysis to the adaptive search, e.g. {"steps": 5, "maxEvaluations": 100}
+ADAPTIVE_KEY = "adaptiveSearch"
+# args key turning an analysis into a target power search (target_power.py),
+# e.g. {"target": 0.8, "dimension": "totalBudget"}
+TARGET_KEY = "targetPower"
+ADAPTIVE_MAX_EVALUATIONS = int(os.environ.get("SCPOWER_ADAPTIVE_MAX_EVALUATIONS", "100"))
+# The search stops once the lattice spacing is at most this many units in both dimensions
+ADAPTIVE_TOLERANCE = float(os.environ.get("SCPOWER_ADAPTIVE_TOLERANCE", "1"))
+LEVEL_COLUMN = "refinementLevel"
+POWER_COLUMN = "Detection.power"
+
+
+# Function to get the integer lattice of `steps` values between lo and hi, as the app builds its ranges
+def lattice(lo, hi, steps):
+    return np.unique(np.round(np.linspace(lo, hi, max(steps, 2))).astype(int)).tolist()
+
+
+# Function to get the steps per dimension, evaluation budget and tolerance of an
+# adaptive search. The coarse level evaluates steps x steps points, so the steps are
+# capped to keep it within the budget.
+def adaptive_options(args):
+    options = args.get(ADAPTIVE_KEY) or {}
+    max_evaluations = int(options.get("maxEvaluations") or ADAPTIVE_MAX_EVALUATIONS)
+    steps = max(min(int(options.get("steps") or 5), math.isqrt(max_evaluations)), 3)
+    return steps, max_evaluations, float(options.get("tolerance") or ADAPTIVE_TOLERANCE)
+
+
+def dense_points(bounds, step):
+    return int(round((bounds[1] - bounds[0]) / step)) + 1
+
+
+# Function to get the number of grid points an analysis evaluates at most; for a
+# target power search, the number of probes it is planned with
+def planned_points(args):
+    if args.get(TARGET_KEY):
+        from target_power import planned_probes
+        return planned_probes(args)
+    if args.get(ADAPTIVE_KEY):
+        return adaptive_options(args)[1]
+    return grid_size(args)
+
+
+# Generator of the coarse-to-fine search: evaluates a coarse lattice over the
+# args ranges, then repeatedly a finer lattice spanning one step around the best
+# point so far, until the spacing reaches the tolerance or the next level would
+# exceed the evaluation budget. Each level is yielded as soon as it is done, with
+# a refinementLevel column and the search summary so far in its metadata.
+def stream_adaptive_search(args, timeout=None, cancel_event=None):
+    steps, max_evaluations, tolerance = adaptive_options(args)
+    args = {key: value for key, value in args.items() if key != ADAPTIVE_KEY}
+    ranges = grid_ranges(args)
+    if len(ranges) != 2:
+        yield from stream_power_study(args, timeout, cancel_event=cancel_event)
+        return
+    (x_key, x_values), (y_key, y_values) = ranges
+    x_column, y_column = RANGE_COLUMNS[x_key], RANGE_COLUMNS[y_key]
+    x_bounds, y_bounds = (min(x_values), max(x_values)), (min(y_values), max(y_values))
+
+    x_range, y_range = x_bounds, y_bounds
+    evaluated = set()
+    best = None
+    summary = {"levels": [], "evaluations": 0, "max_evaluations": max_evaluations}
+    for level in range(64):
+        xs, ys = lattice(*x_range, steps), lattice(*y_range, steps)
+        points = [(x, y) for y in ys for x in xs if (x, y) not in evaluated]
+        if level > 0 and (not points or len(evaluated) + len(points) > max_evaluations):
+            break
+
+        batches = point_batches(args, points)
+        with ThreadPoolExecutor(max_workers=max(1, min(SHARD_PARALLELISM, len(batches)))) as executor:
+            results = list(executor.map(lambda batch: run_power_study(batch, timeout, cancel_event=cancel_event),
+                                        batches))
+        level_frame = AnalysisResult.concat(results).frame.assign(**{LEVEL_COLUMN: level})
+        evaluated.update(points)
+
+        level_best = level_frame.loc[level_frame[POWER_COLUMN].idxmax()] if len(level_frame) else None
+        if level_best is not None and (best is None or level_best[POWER_COLUMN] > best[POWER_COLUMN]):
+            best = level_best
+
+        # A dimension that reached the tolerance keeps a window of one tolerance around the optimum
+        x_step = max((x_range[1] - x_range[0]) / (steps - 1), tolerance)
+        y_step = max((y_range[1] - y_range[0]) / (steps - 1), tolerance)
+        summary["levels"].append({"level": level, x_column: [float(v) for v in x_range],
+                                  y_column: [float(v) for v in y_range], "points": len(points)})
+        summary["evaluations"] = len(evaluated)
+        if best is not None:
+            summary["optimum"] = {x_column: int(best[x_column]), y_column: int(best[y_column]),
+                                  POWER_COLUMN: float(best[POWER_COLUMN])}
+        # Points a uniform grid with the finest spacing reached would have needed
+        summary["dense_evaluations"] = dense_points(x_bounds, x_step) * dense_points(y_bounds, y_step)
+        yield AnalysisResult(level_frame, {"adaptive": dict(summary, levels=list(summary["levels"]))})
+
+        if best is None or (x_step <= tolerance and y_step <= tolerance):
+            break
+        # Zoom in on one step around the best point, clipped to the original ranges
+        x_range = (max(x_bounds[0], best[x_column] - x_step), min(x_bounds[1], best[x_column] + x_step))
+        y_range = (max(y_bounds[0], best[y_column] - y_step), min(y_bounds[1], best[y_column] + y_step))
+
+
+# Function to run the adaptive search and merge its levels into one result
+def adaptive_power_study(args, timeout=None, cancel_event=None):
+    levels = list(stream_adaptive_search(args, timeout, cancel_event))
+    return AnalysisResult.concat(levels, levels[-1].metadata if levels else None)
+
+
+# Generator used by the job scheduler: the target power or adaptive search when the
+# args ask for it, otherwise the full grid. target_power imports this module, so it
+# is imported when a search is run.
+def stream_analysis(args, timeout=None, cancel_event=None):
+    if args.get(TARGET_KEY):
+        from target_power import stream_target_power
+        yield from stream_target_power(args, timeout, cancel_event)
+    elif args.get(ADAPTIVE_KEY):
+        yield from stream_adaptive_search(args, timeout, cancel_event)
+    else:
+        yield from stream_power_study(args, timeout, cancel_event=cancel_event)
@@ -0,0 +1,176 @@
+import numpy as np
+
+# Args built by perform_analysis() when every widget is left at its initial value
+# ("samples - cells per sample" grid with 5 steps)
+DEFAULT_ARGS = {
+    "totalBudget": 50000,
+    "type": "de",
+    "ct": "10x 5' v1_blood_CD16-negative, CD56-bright natural killer cell, human",
+    "ct.freq": 0.1,
+    "costKit": 5600,
+    "costFlowCell": 14032,
+    "readsPerFlowcell": 4100000000,
+    "ref.study.name": "Blueprint (CLL) iCLL-mCLL",
+    "cellsPerLane": 8000,
+    "nSamplesRange": [10, 20, 30, 40, 50],
+    "nCellsRange": [2000, 4000, 6000, 8000, 10000],
+    "readDepthRange": None,
+    "mappingEfficiency": 0.8,
+    "multipletRate": 7.67e-06,
+    "multipletFactor": 1.82,
+    "min.UMI.counts": 3,
+    "perc.indiv.expr": 0.5,
+    "samplingMethod": "quantiles",
+    "sign.threshold": 0.05,
+    "MTmethod": "FDR",
+    "useSimulatedPower": False,
+    "speedPowerCalc": False,
+    "indepSNPs": [10],
+    "ssize.ratio.de": 1.0,
+    "reactionsPerKit": 6,
+}
+
+
+# Function to turn the numpy values the widgets return into plain JSON types
+def json_safe(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, (np.int_, np.intc, np.intp, np.int8, np.int16, np.int32, np.int64, np.uint8, np.uint16, np.uint32, np.uint64)):
+        return int(obj)
+    elif isinstance(obj, (np.float_, np.float16, np.float32, np.float64)):
+        return float(obj)
+    elif isinstance(obj, (np.bool_)):
+        return bool(obj)
+    elif isinstance(obj, (np.string_, np.unicode_)):
+        return str(obj)
+    elif isinstance(obj, dict):
+        return {str(k): json_safe(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [json_safe(i) for i in obj]
+    return obj
+
+
+# Keys that switch an analysis from the full grid to another mode: the adaptive search
+# (adaptive_grid.py) or the target power search (target_power.py)
+MODE_ARGS = ["adaptiveSearch", "targetPower"]
+TARGET_DIMENSIONS = ["totalBudget", "sampleSize"]
+
+
+# Function to complete a scenario (a partial args dict) with the app defaults
+def scenario_args(overrides):
+    unknown = sorted(set(overrides) - set(DEFAULT_ARGS) - set(MODE_ARGS))
+    if unknown:
+        raise ValueError(f"Unknown analysis parameters: {', '.join(unknown)}")
+    return json_safe(dict(DEFAULT_ARGS, **overrides))
+
+
+NUMBER_ARGS = ["totalBudget", "ct.freq", "costKit", "costFlowCell", "readsPerFlowcell", "cellsPerLane",
+               "mappingEfficiency", "multipletRate", "multipletFactor", "min.UMI.counts", "perc.indiv.expr",
+               "sign.threshold", "ssize.ratio.de", "reactionsPerKit"]
+FRACTION_ARGS = ["ct.freq", "mappingEfficiency", "perc.indiv.expr", "sign.threshold"]
+BOOL_ARGS = ["useSimulatedPower", "speedPowerCalc"]
+CHOICE_ARGS = {"type": ["de", "eqtl"], "MTmethod": ["FDR", "FWER", "None"], "samplingMethod": ["quantiles"]}
+RANGE_ARGS = ["nSamplesRange", "nCellsRange", "readDepthRange"]
+# Used only by the final DE/eQTL power stage of scPower; analyses that differ only in
+# these share the memoized design and expression stages of an R worker
+POWER_STAGE_ARGS = ["sign.threshold", "MTmethod", "indepSNPs", "useSimulatedPower", "speedPowerCalc",
+                    "ssize.ratio.de"]
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+# Function to check a complete args dict before it is sent to R; returns a list of
+# problems, empty when the args are valid
+def validate_args(args, max_grid_points=None):
+    errors = [f"Missing parameter: {name}" for name in DEFAULT_ARGS if name not in args]
+    errors += [f"Unknown parameter: {name}" for name in args if name not in DEFAULT_ARGS and name not in MODE_ARGS]
+
+    for name in NUMBER_ARGS:
+        if name in args and (not is_number(args[name]) or args[name] < 0):
+            errors.append(f"{name} must be a non-negative number")
+    for name in FRACTION_ARGS:
+        if is_number(args.get(name)) and not 0 <= args[name] <= 1:
+            errors.append(f"{name} must be between 0 and 1")
+    for name in BOOL_ARGS:
+        if name in args and not isinstance(args[name], bool):
+            errors.append(f"{name} must be true or false")
+    for name, choices in CHOICE_ARGS.items():
+        if name in args and args[name] not in choices:
+            errors.append(f"{name} must be one of {', '.join(choices)}")
+    # The number of independent SNPs is a count; the app sends it as a one-element list
+    if "indepSNPs" in args:
+        snps = args["indepSNPs"] if isinstance(args["indepSNPs"], list) else [args["indepSNPs"]]
+        if len(snps) != 1 or not (is_whole_number(snps[0]) and snps[0] > 0):
+            errors.append("indepSNPs must be a positive integer")
+    for name in ["ct", "ref.study.name"]:
+        if name in args and not (isinstance(args[name], str) and args[name]):
+            errors.append(f"{name} must be a non-empty string")
+
+    grid_points = 1
+    ranges = [name for name in RANGE_ARGS if args.get(name) is not None]
+    for name in ranges:
+        values = args[name] if isinstance(args[name], list) else [args[name]]
+        if not values or not all(is_number(value) and value > 0 for value in values):
+            errors.append(f"{name} must be a list of positive numbers or null")
+        grid_points *= len(values)
+    if len(ranges) != 2:
+        errors.append(f"Exactly two of {', '.join(RANGE_ARGS)} must be given")
+    elif max_grid_points is not None and grid_points > max_grid_points:
+        errors.append(f"The grid has {grid_points} points, at most {max_grid_points} are allowed")
+
+    adaptive = args.get("adaptiveSearch")
+    if adaptive is not None and not isinstance(adaptive, dict):
+        errors.append("adaptiveSearch must be an object such as {\"steps\": 5, \"maxEvaluations\": 100}")
+    elif adaptive is not None:
+        errors += validate_adaptive_search(adaptive)
+
+    target = args.get("targetPower")
+    if target is not None and not isinstance(target, dict):
+        errors.append("targetPower must be an object such as {\"target\": 0.8, \"dimension\": \"totalBudget\"}")
+    elif target is not None:
+        errors += validate_target_power(target, args)
+        if adaptive is not None:
+            errors.append("adaptiveSearch and targetPower cannot be combined")
+    return errors
+
+
+def is_whole_number(value):
+    return is_number(value) and float(value).is_integer()
+
+
+# Function to check the options of the adaptive search. The coarse level evaluates at
+# least 3 x 3 points, so a smaller evaluation budget cannot be kept.
+def validate_adaptive_search(options):
+    errors = [f"Unknown adaptiveSearch option: {name}" for name in options
+              if name not in ("steps", "maxEvaluations", "tolerance")]
+    steps, max_evaluations, tolerance = options.get("steps"), options.get("maxEvaluations"), options.get("tolerance")
+    if steps is not None and not (is_whole_number(steps) and steps > 0):
+        errors.append("adaptiveSearch.steps must be a positive integer")
+    if max_evaluations is not None and not (is_whole_number(max_evaluations) and max_evaluations >= 9):
+        errors.append("adaptiveSearch.maxEvaluations must be an integer of at least 9")
+    if tolerance is not None and not (is_number(tolerance) and tolerance > 0):
+        errors.append("adaptiveSearch.tolerance must be a positive number")
+    return errors
+
+
+# Function to check the options of the target power search
+def validate_target_power(options, args):
+    errors = [f"Unknown targetPower option: {name}" for name in options
+              if name not in ("target", "dimension", "low", "high", "tolerance", "probes")]
+    target, dimension = options.get("target"), options.get("dimension", "totalBudget")
+    if not (is_number(target) and 0 < target <= 1):
+        errors.append("targetPower.target must be a detection power between 0 and 1")
+    if dimension not in TARGET_DIMENSIONS:
+        errors.append(f"targetPower.dimension must be one of {', '.join(TARGET_DIMENSIONS)}")
+    elif dimension == "sampleSize" and args.get("nSamplesRange") is None:
+        errors.append("A sample size search needs a grid with a sample size range")
+    for name in ("low", "high", "tolerance"):
+        if options.get(name) is not None and not (is_number(options[name]) and options[name] > 0):
+            errors.append(f"targetPower.{name} must be a positive number")
+    if is_number(options.get("low")) and is_number(options.get("high")) and options["low"] > options["high"]:
+        errors.append("targetPower.low must not be above targetPower.high")
+    if options.get("probes") is not None and not (is_whole_number(options["probes"]) and options["probes"] > 0):
+        errors.append("targetPower.probes must be a positive integer")
+    return errors
@@ -0,0 +1,721 @@
+import streamlit as st
+import logging
+import os
+import numpy as np
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from http_api import API_URL, get_analysis_backend
+from single_flight import get_single_flight
+from metrics import span
+from result_cache import get_result_cache
+from point_store import get_point_store, snap_to_lattice
+from celltype_catalog import load_celltype_catalog
+from plots import (create_scatter_plot, create_influence_plot, create_target_power_plot, create_celltype_comparison_plot,
+                   create_sensitivity_heatmap, create_sensitivity_small_multiples)
+from adaptive_grid import ADAPTIVE_KEY, POWER_COLUMN, TARGET_KEY
+from celltype_comparison import COMPARISON_MAX_CELLTYPES, celltype_args, rank_celltypes, summarize_celltype
+from sensitivity import (SENSITIVITY_MAX_PARAMS, SENSITIVITY_PARAMS, merge_sweep, sweep_args, sweep_combinations,
+                         validate_sweep)
+from grid_sharding import RANGE_COLUMNS, grid_ranges
+from analysis_result import AnalysisResult, session_memory_usage
+from analysis_args import json_safe, validate_target_power
+
+# Seconds between status polls while a submitted analysis is queued or running
+JOB_POLL_INTERVAL = float(os.environ.get("SCPOWER_JOB_POLL_INTERVAL", "0.5"))
+# Rows of a result shown in the JSON view; all rows are in the CSV download
+JSON_PREVIEW_ROWS = 1000
+# Bounds and step of the sweep range slider of every parameter, as on the sliders above
+SWEEP_SLIDERS = {
+    "ct.freq": (0.0, 1.0, 0.05),
+    "ssize.ratio.de": (0.0, 50.0, 0.05),
+    "mappingEfficiency": (0.0, 1.0, 0.05),
+    "multipletRate": (0.0, 1e-4, 1e-6),
+    "multipletFactor": (1.0, 5.0, 0.1),
+    "min.UMI.counts": (1, 20, 1),
+    "perc.indiv.expr": (0.0, 1.0, 0.05),
+    "sign.threshold": (0.0, 1.0, 0.01),
+}
+
+
+# Function to build the cell type catalog once per process
+@st.cache_resource
+def get_celltype_catalog():
+    return load_celltype_catalog()
+
+# Function to identify the browser session that submits a job
+def session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "anonymous"
+
+# Callback functions to update session state
+def update_assay():
+    st.session_state.tissue = "All"
+
+
+def perform_analysis():
+    st.title("Detect DE/eQTL genes")
+    scatter_file_id   = "1NkBP3AzLWuXKeYwgtVdTYxrzLjCuqLkR"
+    influence_file_id = "1viAH5OEyhSoQjdGHi2Cm0_tFHrr1Z3GQ"
+
+    if 'assay' not in st.session_state:
+        st.session_state.assay = "All"
+    if 'tissue' not in st.session_state:
+        st.session_state.tissue = "All"
+
+    # Custom CSS for the hover effect
+    st.markdown("""
+        <style>
+        .hover-text {
+            position: relative;
+            display: inline-block;
+            cursor: help;
+        }
+
+        .hover-text .hover-content {
+            visibility: hidden;
+            width: 510px;
+            background-color: #1E2A3A;
+            color: #fff;
+            text-align: left;
+            border-radius: 6px;
+            padding: 10px;
+            position: absolute;
+            z-index: 1;
+            top: 0;
+            left: 0;
+            opacity: 0;
+            transition: opacity 0.3s;
+            transform: translateX(-570px);
+        }
+
+        .hover-text:hover .hover-content {
+            visibility: visible;
+            opacity: 1;
+        }
+        </style>
+                
+
+        <script>
+            var elements = document.getElementsByClassName('hover-text');
+            for (var i = 0; i < elements.length; i++) {
+                elements[i].addEventListener('touchstart', function() {
+                    var content = this.getElementsByClassName('hover-content')[0];
+                    content.style.visibility = content.style.visibility === 'visible' ? 'hidden' : 'visible';
+                    content.style.opacity = content.style.opacity === '1' ? '0' : '1';
+                });
+            }
+        </script>
+        """, unsafe_allow_html=True)
+    
+    # Initialize session state
+    if 'analysis_result' not in st.session_state:
+        st.session_state.analysis_result = None
+    if 'success_message' not in st.session_state:
+        st.session_state.success_message = st.empty()
+
+    catalog = get_celltype_catalog()
+
+    # Create scatter plot
+    with st.expander("General Parameters", expanded=True):
+        study_type = st.radio(
+            "Study type:",
+            ["de", "eqtl"])
+        organism = st.selectbox("Organisms", ["Homo sapiens", "Mus musculus"])
+        selected_assay = st.selectbox("Assays", ["All"] + catalog.assays, key='assay', on_change=update_assay)
+
+        selected_tissue = st.selectbox("Tissues", ["All"] + catalog.tissues_for(selected_assay), key='tissue')
+
+        filtered_celltypes = catalog.celltypes_for(selected_assay, selected_tissue)
+        celltype = st.selectbox("Cell Types", filtered_celltypes)
+    
+    with st.expander("Advanced Options", expanded=False):
+        col1, col2 = st.columns([3, 3])
+        
+        with col1:
+            ct_freq_slider = st.slider("Cell Type Frequency", 0.0, 1.0, 0.1, step = 0.05, help="Frequency of the cell type of interest.")
+            sample_size_ratio_slider = st.slider("Sample Size Ratio", 0.0, 50.0, 1.0, step = 0.05, help="ratio between sample size of group 0 (control group) and group 1 (Ratio=1 in case of balanced design)")
+            ref_study = st.selectbox("Reference Study", ["Blueprint (CLL) iCLL-mCLL", "Blueprint (CLL) mCLL-uCLL", "Blueprint (CLL) uCLL-iCLL", "Moreno-Moral (Macrophages)", "Nicodemus-Johnson_AEC", "Pancreas_alphabeta", "Pancreas_ductacinar", "Custom"])
+            total_budget = st.slider("Total Budget", step=500,min_value =0,value = 50000, help="The total budget available for the sequencing")
+        
+        with col2:
+            parameter_grid = st.selectbox("Parameter Grid", ["samples - cells per sample", "samples - reads per cell", "cells per sample - reads per cell"])
+            rangeX_min = st.slider("Sample size (min)", value=10, step=1, help="Minimal value of the tested ranges for the parameter on the x-Axis.")
+            rangeX_max = st.slider("Sample size (max)", value=50, step=1, help="Maximum value of the tested ranges for the parameter on the x-Axis.")
+            
+            rangeY_min = st.slider("Cells (min)",value=2000, step=1),
+            rangeY_max = st.slider("Cells (max)",value=10000, step=1),
+            
+            steps = st.slider("Steps", min_value=0, value=5, step=1, help= "number of values in the parameter ranges for the parameter grid")
+            snap_grid = st.checkbox("Snap grid to round values", value=False, help="Use multiples of 1, 2, 2.5 or 5 times a power of ten as grid values, so that reruns with changed ranges or steps reuse the grid points computed before")
+            adaptive_search = st.checkbox("Adaptive search around the optimum", value=False, help="Evaluate the grid coarsely and then refine it around the best detection power instead of evaluating every grid point")
+            adaptive_budget = st.slider("Maximal number of evaluations", min_value=10, max_value=1000, value=100, step=10, disabled=not adaptive_search, help="Number of grid points the adaptive search evaluates at most")
+
+    with st.expander("Cost and Experimental Parameters", expanded=False):
+        col1, col2 = st.columns([3, 3])
+        with col1:
+            cost_10x_kit = st.slider("Cost 10X kit", value = 5600, step=100,min_value=0, help="Cost for one 10X Genomics kit")     
+            cost_flow_cell = st.slider("Cost Flow Cell", value = 14032, step=100,min_value=0, help="Cost for one flow cell")
+            reads_per_flow_cell = st.slider("Number of reads per flow cell", value = 4100000000, step=10000,min_value=0)   
+            cells_per_lane = st.slider("Cells per lane", value = 8000, step=500,min_value=0, help="Number of cells meassured on one 10X lane (dependent on the parameter \"Reactions Per Kit\")")
+            
+        with col2: 
+            reactions_per_kit = st.slider("Reactions Per Kit", value = 6, step = 1, min_value= 1, help="Number of reactions/lanes on one 10X kit (different kit versions possible)")
+            p_value = st.slider("P-value", value=0.05,step=0.01,min_value=0.0,max_value=1.0, help="Significance threshold")
+            multiple_testing_method = st.selectbox("Multiple testing method", ["FDR", "FWER", "None"])
+            indepsnps = st.slider("Independent SNPs", value=10, min_value=1, step=1),
+    
+    with st.expander("Mapping and Multiplet estimation", expanded=False):
+        col1, col2 = st.columns([3, 3])
+        with col1:
+            mapping_efficiency = st.slider("Mapping efficiency", value = 0.8,step=0.05,min_value=0.0,max_value=1.0)
+            multiplet_rate = st.slider("Multiplet Rate", value = 7.67e-06,step=1e-6,min_value=0.0, help="Rate factor to calculate the number of multiplets dependent on the number of cells loaded per lane. We assume a linear relationship of multiplet fraction = cells per lane * multiplet rate.")
+            multiplet_factor = st.slider("Multiplet Factor", value = 1.82, step=0.1,min_value=1.0, help="Multiplets have a higher fraction of reads per cell than singlets, the multiplet factor shows the ratio between the reads.")
+        
+        with col2:
+            min_num_UMI_per_gene = st.slider("Minimal number of UMI per gene", value = 3, step=1,min_value=1)
+            fraction_of_indiv = st.slider("Fraction of individuals", value = 0.5,step=0.05,min_value=0.0,max_value=1.0)
+            skip_power = st.checkbox("Skip power for lowly expressed genes", value=False)
+            use_simulated = st.checkbox("Use simulated power for eQTLs", value=False)
+
+    if snap_grid:
+        rangeX = snap_to_lattice(rangeX_min, rangeX_max, steps)
+        rangeY = snap_to_lattice(rangeY_min[0], rangeY_max[0], steps)
+    else:
+        rangeX = np.round(np.linspace(rangeX_min, rangeX_max, steps)).astype(int)
+        rangeY = np.round(np.linspace(rangeY_min[0], rangeY_max[0], steps)).astype(int)
+
+    selected_pair = parameter_grid
+
+    if selected_pair == "samples - cells per sample":
+        sample_range = rangeX
+        cells_range = rangeY
+        read_range = None
+    elif selected_pair == "samples - reads per cell":
+        sample_range = rangeX
+        cells_range = None
+        read_range = rangeY
+    else:  # "cells per sample - reads per cell"
+        sample_range = None
+        cells_range = rangeX
+        read_range = rangeY
+    
+    args = {
+        "totalBudget" : total_budget,
+        "type" : study_type,
+        "ct" : celltype, 
+        "ct.freq" : ct_freq_slider,
+        "costKit" : cost_10x_kit,
+        "costFlowCell" : cost_flow_cell,
+        "readsPerFlowcell" : reads_per_flow_cell,
+        "ref.study.name" : ref_study,
+        "cellsPerLane" : cells_per_lane,
+        "nSamplesRange" : sample_range.tolist() if sample_range is not None else None,
+        "nCellsRange" : cells_range.tolist() if cells_range is not None else None,
+        "readDepthRange" : read_range.tolist() if read_range is not None else None,
+        "mappingEfficiency" : mapping_efficiency,
+        "multipletRate" : multiplet_rate,
+        "multipletFactor" : multiplet_factor,
+        "min.UMI.counts" : min_num_UMI_per_gene,
+        "perc.indiv.expr" : fraction_of_indiv,
+        "samplingMethod" : "quantiles",
+        "sign.threshold" : p_value,
+        "MTmethod" : multiple_testing_method,
+        "useSimulatedPower" : use_simulated,
+        "speedPowerCalc" : skip_power,
+        "indepSNPs" : indepsnps,
+        "ssize.ratio.de" : sample_size_ratio_slider,
+        "reactionsPerKit" : reactions_per_kit
+    }
+
+    # Only adaptive runs carry the key, so full-grid args keep their cache and atlas keys
+    if adaptive_search:
+        args["adaptiveSearch"] = {"steps": steps, "maxEvaluations": adaptive_budget}
+
+    args = json_safe(args)
+
+    # The in-process scheduler, or the HTTP service at SCPOWER_API_URL
+    scheduler = get_analysis_backend()
+
+    show_target_power_search(args, scheduler)
+
+    show_celltype_comparison(args, filtered_celltypes, scheduler)
+    show_sensitivity_sweep(args, scheduler)
+
+    if st.button("Run analysis"):
+
+        logging.debug("Analysis args: %s", args)
+
+        # One job per session: a new run replaces the previous one
+        if st.session_state.get('job_id'):
+            scheduler.cancel(st.session_state.job_id)
+        st.session_state.job_id = scheduler.submit(args, user=session_id())
+        st.session_state.analysis_result = None
+
+    if st.session_state.get('job_id'):
+        job_id = st.session_state.job_id
+        status = scheduler.status(job_id)
+
+        if status is None:
+            st.session_state.job_id = None
+            st.warning("The analysis job expired. Please run the analysis again.")
+        elif status['state'] in ("queued", "running"):
+            show_job_progress(scheduler, job_id)
+        else:
+            st.session_state.job_id = None
+            if status['state'] == "done":
+                # One typed result object shared by the JSON view, both plots and the download
+                st.session_state.analysis_result = scheduler.result(job_id)
+
+                # The cache and single-flight counters live in the API process when it is used
+                if not API_URL:
+                    cache_stats = get_result_cache().stats()
+                    st.caption(f"Result cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits "
+                               f"({cache_stats['disk_hits']} from disk), {cache_stats['misses']} misses")
+                    flight_stats = get_single_flight().stats()
+                    st.caption(f"Shared analyses: {flight_stats['coalesced']} computations saved by joining "
+                               f"an identical running analysis, {flight_stats['computations']} started")
+                    point_store = get_point_store()
+                    if point_store is not None:
+                        point_stats = point_store.stats()
+                        st.caption(f"Grid points: {point_stats['reused']} reused from earlier runs, "
+                                   f"{point_stats['computed']} computed")
+            elif status['state'] == "failed":
+                st.error(f"Power analysis failed: {status['error']}")
+            else:
+                st.warning("The analysis was cancelled.")
+
+    result = st.session_state.analysis_result
+    if result is not None:
+        st.session_state.success_message.empty() # clear the success messages shown in the UI
+        show_result_view(result)
+
+
+# Progress of the session's queued or running job. Only this fragment reruns while the
+# job is polled; once the job has finished, the whole page reruns to show its outcome.
+@st.experimental_fragment(run_every=JOB_POLL_INTERVAL)
+def show_job_progress(scheduler, job_id):
+    status = scheduler.status(job_id)
+    if status is None or status['state'] not in ("queued", "running"):
+        st.rerun()
+
+    if st.button("Cancel analysis"):
+        scheduler.cancel(job_id)
+        st.session_state.job_id = None
+        st.rerun()
+
+    if status['state'] == "queued":
+        st.info(f"Waiting in queue: position {status['queue_position']} of {status['queue_length']} "
+                f"({status['running']} analyses running)")
+    else:
+        # Show grid points in the scatter plot as they arrive
+        received, total_points = status['received_points'], status['total_points']
+        st.progress(min(received / max(total_points, 1), 1.0),
+                    text=f"{received} of {total_points} grid points evaluated")
+        partial = scheduler.partial_result(job_id)
+        if partial is not None:
+            fig = create_scatter_plot(partial, "sampleSize", "totalCells", "Detection.power")
+            if fig is not None:
+                st.plotly_chart(fig)
+
+
+# Section comparing the parameters above across all filtered cell types: one job per
+# cell type on the scheduler, so they share its queue, the result cache and the worker
+# pool. Finished cell types enter the ranked table and the combined plot on every poll.
+def show_celltype_comparison(args, celltypes, scheduler):
+    comparison = st.session_state.get('comparison')
+    with st.expander(f"Compare all filtered cell types ({len(celltypes)})", expanded=comparison is not None):
+        if len(celltypes) > COMPARISON_MAX_CELLTYPES:
+            st.info(f"Narrow the assay and tissue filters to at most {COMPARISON_MAX_CELLTYPES} cell types "
+                    f"to compare them.")
+        elif st.button("Compare cell types"):
+            if comparison is not None:
+                for job_id in comparison['jobs'].values():
+                    scheduler.cancel(job_id)
+            (x_key, _), _ = grid_ranges(args)
+            comparison = {
+                'args': args,
+                'x_column': RANGE_COLUMNS[x_key],
+                'jobs': {celltype: scheduler.submit(ct_args, user=session_id())
+                         for celltype, ct_args in celltype_args(args, celltypes).items()},
+                'rows': {},
+                'curves': {},
+            }
+            st.session_state.comparison = comparison
+
+        if comparison is None:
+            return
+
+        update_comparison(comparison, scheduler)
+        if comparison['jobs']:
+            show_comparison_progress(scheduler)
+        else:
+            show_comparison_view(comparison)
+
+
+# Function to move the comparison's finished jobs into its rows and curves
+def update_comparison(comparison, scheduler):
+    for celltype, job_id in list(comparison['jobs'].items()):
+        status = scheduler.status(job_id)
+        if status is None or status['state'] in ("failed", "cancelled"):
+            error = status['error'] if status is not None and status['error'] else "cancelled or expired"
+            comparison['rows'][celltype] = {"celltype": celltype, POWER_COLUMN: None, "error": error}
+        elif status['state'] == "done":
+            row, curve = summarize_celltype(celltype, comparison['args'], scheduler.result(job_id))
+            comparison['rows'][celltype] = row
+            comparison['curves'][celltype] = curve
+        else:
+            continue
+        del comparison['jobs'][celltype]
+
+
+# Progress of the session's comparison, polled like show_job_progress(); the page
+# reruns once the last cell type has finished
+@st.experimental_fragment(run_every=JOB_POLL_INTERVAL)
+def show_comparison_progress(scheduler):
+    comparison = st.session_state.comparison
+    update_comparison(comparison, scheduler)
+    if not comparison['jobs']:
+        st.rerun()
+
+    if st.button("Cancel comparison"):
+        for job_id in comparison['jobs'].values():
+            scheduler.cancel(job_id)
+        st.rerun()
+
+    done, total = len(comparison['rows']), len(comparison['rows']) + len(comparison['jobs'])
+    st.progress(done / total, text=f"{done} of {total} cell types evaluated")
+    show_comparison_view(comparison)
+
+
+# Function to show the ranked table and the combined plot of the finished cell types
+def show_comparison_view(comparison):
+    table = rank_celltypes(comparison['rows'].values())
+    if not table.empty:
+        st.dataframe(table, hide_index=True, use_container_width=True)
+    fig = create_celltype_comparison_plot(comparison['curves'], comparison['x_column'])
+    if fig is not None:
+        st.plotly_chart(fig)
+
+
+# Function to get the values of one swept parameter: `steps` values from lo to hi, on
+# the slider step so that they hit the result cache of single runs
+def sweep_values(name, lo, hi, steps):
+    step = SWEEP_SLIDERS[name][2]
+    values = np.round(np.linspace(lo, hi, steps) / step) * step
+    if isinstance(step, int):
+        return sorted(set(int(value) for value in values))
+    return sorted(set(float(round(value, 10)) for value in values))
+
+
+# Section sweeping one or two scalar parameters over the design grid: one job per
+# parameter combination on the scheduler, merged into one long-format result once
+# all are done.
+def show_sensitivity_sweep(args, scheduler):
+    sweep_state = st.session_state.get('sensitivity')
+    with st.expander("Sensitivity sweep", expanded=sweep_state is not None):
+        params = st.multiselect("Swept parameters", list(SENSITIVITY_PARAMS), format_func=SENSITIVITY_PARAMS.get,
+                                max_selections=SENSITIVITY_MAX_PARAMS,
+                                help="Evaluate the design grid for every combination of the values of these parameters; the values set above are used for the others")
+        sweep = {}
+        for name in params:
+            low, high, step = SWEEP_SLIDERS[name]
+            value = args[name]
+            default = (max(low, round(value / 2 / step) * step), min(high, round(value * 2 / step) * step))
+            col1, col2 = st.columns([4, 2])
+            with col1:
+                lo, hi = st.slider(f"{SENSITIVITY_PARAMS[name]} range", min_value=low, max_value=high,
+                                   value=default, step=step, key=f"sweep_range_{name}")
+            with col2:
+                steps = st.slider(f"{SENSITIVITY_PARAMS[name]} steps", min_value=2, max_value=10, value=3,
+                                  key=f"sweep_steps_{name}")
+            sweep[name] = sweep_values(name, lo, hi, steps)
+
+        if params and st.button("Run sweep"):
+            errors = validate_sweep(sweep)
+            if errors:
+                for error in errors:
+                    st.error(error)
+            else:
+                if sweep_state is not None:
+                    for _, job_id in sweep_state['jobs'].values():
+                        scheduler.cancel(job_id)
+                sweep_state = {
+                    'args': args,
+                    'sweep': sweep,
+                    'jobs': {index: (combination, scheduler.submit(sweep_args(args, combination), user=session_id()))
+                             for index, combination in enumerate(sweep_combinations(sweep))},
+                    'results': [],
+                    'errors': [],
+                }
+                st.session_state.sensitivity = sweep_state
+                st.session_state.sensitivity_result = None
+
+        if sweep_state is None:
+            return
+
+        update_sweep(sweep_state, scheduler)
+        if sweep_state['jobs']:
+            show_sweep_progress(scheduler)
+            return
+
+        for error in sweep_state['errors']:
+            st.error(f"Sweep combination failed: {error}")
+        if st.session_state.get('sensitivity_result') is None and sweep_state['results']:
+            st.session_state.sensitivity_result = merge_sweep(sweep_state['args'], sweep_state['sweep'],
+                                                              sweep_state['results'])
+        result = st.session_state.get('sensitivity_result')
+        if result is not None:
+            show_sensitivity_view(result)
+
+
+# Function to move the sweep's finished jobs into its results and errors
+def update_sweep(sweep_state, scheduler):
+    for index, (combination, job_id) in list(sweep_state['jobs'].items()):
+        status = scheduler.status(job_id)
+        if status is None or status['state'] in ("failed", "cancelled"):
+            error = status['error'] if status is not None and status['error'] else "cancelled or expired"
+            sweep_state['errors'].append(f"{combination}: {error}")
+        elif status['state'] == "done":
+            sweep_state['results'].append((combination, scheduler.result(job_id)))
+        else:
+            continue
+        del sweep_state['jobs'][index]
+
+
+# Progress of the session's sensitivity sweep, polled like show_job_progress(); the
+# page reruns to merge and show the result once the last combination has finished
+@st.experimental_fragment(run_every=JOB_POLL_INTERVAL)
+def show_sweep_progress(scheduler):
+    sweep_state = st.session_state.sensitivity
+    update_sweep(sweep_state, scheduler)
+    if not sweep_state['jobs']:
+        st.rerun()
+
+    if st.button("Cancel sweep"):
+        for _, job_id in sweep_state['jobs'].values():
+            scheduler.cancel(job_id)
+        st.rerun()
+
+    done = len(sweep_state['results']) + len(sweep_state['errors'])
+    total = done + len(sweep_state['jobs'])
+    st.progress(done / total, text=f"{done} of {total} parameter combinations evaluated")
+
+
+# Function to build the figures of a sweep result once per result and held value of
+# the second parameter, so that moving the slider only looks them up
+def sensitivity_view_data(result, fixed):
+    view = st.session_state.get('sensitivity_view')
+    if view is None or view['result'] is not result:
+        view = {'result': result, 'heatmap': create_sensitivity_heatmap(result), 'parquet': result.to_parquet(),
+                'multiples': {}}
+        st.session_state.sensitivity_view = view
+    if fixed not in view['multiples']:
+        with span("sensitivity_plot"):
+            view['multiples'][fixed] = create_sensitivity_small_multiples(result, fixed)
+    return view
+
+
+# The sweep view reruns on its own when the held value changes; it only slices the
+# stored result and never starts R
+@st.experimental_fragment
+def show_sensitivity_view(result):
+    sensitivity = result.metadata["sensitivity"]
+    params = sensitivity["params"]
+    st.caption(f"{sensitivity['combinations']} parameter combinations, {len(result)} rows")
+
+    fixed = None
+    if len(params) == 2:
+        fixed = st.select_slider(f"Held {SENSITIVITY_PARAMS[params[1]]} for the design grids",
+                                 options=sensitivity["values"][params[1]])
+    view = sensitivity_view_data(result, fixed)
+
+    if view['heatmap'] is not None:
+        st.plotly_chart(view['heatmap'])
+    if view['multiples'][fixed] is not None:
+        st.plotly_chart(view['multiples'][fixed])
+    st.download_button("Download sweep (Parquet)", view['parquet'], file_name="sensitivity_sweep.parquet",
+                       mime="application/octet-stream")
+
+
+# Section solving for the smallest budget or sample size that reaches a target power
+# with the parameters above. The search is a job on the scheduler like a grid analysis;
+# its probes go through the result cache and the worker pool.
+def show_target_power_search(args, scheduler):
+    active = st.session_state.get('target_job') or st.session_state.get('target_solution')
+    with st.expander("Target power search", expanded=bool(active)):
+        col1, col2 = st.columns([3, 3])
+        with col1:
+            target = st.slider("Target detection power", min_value=0.05, max_value=0.99, value=0.8, step=0.01)
+            dimension = st.selectbox("Search for the minimal", ["totalBudget", "sampleSize"],
+                                     format_func=lambda name: {"totalBudget": "Total budget", "sampleSize": "Sample size"}[name],
+                                     help="The sample size search keeps the budget and evaluates the other grid range for every sample size")
+        with col2:
+            if dimension == "totalBudget":
+                search_range = st.slider("Budget search range", min_value=1000, max_value=2000000,
+                                         value=(args["totalBudget"] // 4, args["totalBudget"] * 4), step=1000)
+            else:
+                search_range = st.slider("Sample size search range", min_value=2, max_value=2000, value=(2, 200), step=1)
+
+        if st.button("Find minimum"):
+            options = {"target": target, "dimension": dimension, "low": search_range[0], "high": search_range[1]}
+            search_args = {key: value for key, value in args.items() if key != ADAPTIVE_KEY}
+            errors = validate_target_power(options, search_args)
+            if errors:
+                st.error("; ".join(errors))
+            else:
+                if st.session_state.get('target_job'):
+                    scheduler.cancel(st.session_state.target_job)
+                st.session_state.target_job = scheduler.submit(dict(search_args, **{TARGET_KEY: options}),
+                                                               user=session_id())
+                st.session_state.target_solution = None
+
+        job_id = st.session_state.get('target_job')
+        if job_id:
+            status = scheduler.status(job_id)
+            if status is None:
+                st.session_state.target_job = None
+                st.warning("The target power search expired. Please start it again.")
+            elif status['state'] in ("queued", "running"):
+                show_target_progress(scheduler, job_id)
+            else:
+                st.session_state.target_job = None
+                if status['state'] == "done":
+                    st.session_state.target_solution = scheduler.result(job_id).metadata[TARGET_KEY]
+                elif status['state'] == "failed":
+                    st.error(f"Target power search failed: {status['error']}")
+                else:
+                    st.warning("The target power search was cancelled.")
+
+        solution = st.session_state.get('target_solution')
+        if solution is not None:
+            if solution["reachable"]:
+                st.success(f"{solution['dimension']} {solution['value']} reaches detection power "
+                           f"{solution['power']:.3f} (target {solution['target']}) with {solution['computed']} "
+                           f"computed probes")
+                st.json(solution["design"], expanded=False)
+                if solution.get("atLowerBound"):
+                    st.info(f"The target is already reached at the lower end of the search range; lower it to "
+                            f"find the minimal {solution['dimension']}.")
+            else:
+                st.warning(f"The target power {solution['target']} was not reached; the best probe reached "
+                           f"{solution['power']:.3f}. Widen the search range.")
+            if not solution["monotonic"]:
+                st.caption("Detection power did not grow monotonically over the probes; the answer may not be the minimum.")
+            fig = create_target_power_plot(solution)
+            if fig is not None:
+                st.plotly_chart(fig)
+
+
+# Progress of the session's target power search, polled like show_job_progress()
+@st.experimental_fragment(run_every=JOB_POLL_INTERVAL)
+def show_target_progress(scheduler, job_id):
+    status = scheduler.status(job_id)
+    if status is None or status['state'] not in ("queued", "running"):
+        st.rerun()
+
+    if st.button("Cancel search"):
+        scheduler.cancel(job_id)
+        st.session_state.target_job = None
+        st.rerun()
+
+    if status['state'] == "queued":
+        st.info(f"Waiting in queue: position {status['queue_position']} of {status['queue_length']} "
+                f"({status['running']} analyses running)")
+    else:
+        st.info(f"Searching... ({status['elapsed']:.0f} s)")
+
+
+# Function to build the parts of the result view that only depend on the result, once
+# per result: changing an axis then only rebuilds the scatter plot
+def result_view_data(result):
+    view = st.session_state.get('result_view')
+    if view is None or view['result'] is not result:
+        influence_fig = None
+        if len(result):
+            parameter_vector = ["sc", 1000, 100, 200, 400000000, "eqtl"]
+            with span("influence_plot"):
+                influence_fig = create_influence_plot(result, parameter_vector)
+        # Only a preview of the rows is kept as JSON text; the CSV is built on request
+        view = {'result': result, 'json': AnalysisResult(result.frame.head(JSON_PREVIEW_ROWS)).to_json(), 'csv': None,
+                'influence_plot': influence_fig, 'scatter_axes': None, 'scatter_plot': None}
+        st.session_state.result_view = view
+    return view
+
+
+# The result view reruns on its own when an axis is changed, without the rest of the page
+@st.experimental_fragment
+def show_result_view(result):
+    session_bytes = session_memory_usage(st.session_state)
+    st.caption(f"Session results: {len(result)} rows, {session_bytes / 1024:.1f} KiB in memory")
+    adaptive = result.metadata.get("adaptive")
+    if adaptive:
+        st.caption(f"Adaptive search: {adaptive['evaluations']} evaluations in {len(adaptive['levels'])} levels "
+                   f"instead of {adaptive['dense_evaluations']} for a uniform grid at the finest spacing")
+    logging.debug("Session result memory: %d bytes", session_bytes)
+    view = result_view_data(result)
+
+    st.markdown("<br>", unsafe_allow_html=True)
+
+    # data shown as json as well
+    if len(result) > JSON_PREVIEW_ROWS:
+        st.write(f"Data in json format (first {JSON_PREVIEW_ROWS} of {len(result)} items):")
+    else:
+        st.write(f"Data in json format ({len(result)} items):")
+    st.json(view['json'], expanded=False)
+    if view['csv'] is None:
+        if st.button("Prepare CSV download"):
+            view['csv'] = result.to_csv()
+    if view['csv'] is not None:
+        st.download_button("Download results (CSV)", view['csv'], file_name="power_results.csv", mime="text/csv")
+
+    st.markdown("<br>", unsafe_allow_html=True)
+
+    st.markdown("""
+    <div class="hover-text">
+        <h3>Scatter Plot</h3>
+        <div class="hover-content">
+            <p>Detection power depending on <em>cells per individual</em>, <em>read depth</em> and <em>sample size</em>.</p>
+            <p><strong>How to use this scatter plot:</strong></p>
+            <ul style="padding-left: 20px;">
+                <li>Select the variables for X-axis, Y-axis, and Size from the dropdowns below.</li>
+                <li>The plot will update automatically based on your selections.</li>
+                <li>Use the plot tools to zoom, pan, or save the image.</li>
+            </ul>
+            <p><em>Tip: Try different combinations to discover interesting patterns in your data!</em></p>
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+    keys = sorted(result.columns)
+
+    x_axis = st.selectbox("Select X-axis", options=keys, index=keys.index("sampleSize"))
+    y_axis = st.selectbox("Select Y-axis", options=keys, index=keys.index("totalCells"))
+    size_axis = st.selectbox("Select Size-axis", options=keys, index=keys.index("Detection.power"))
+
+    if view['scatter_axes'] != (x_axis, y_axis, size_axis):
+        with span("scatter_plot"):
+            view['scatter_plot'] = create_scatter_plot(result, x_axis, y_axis, size_axis)
+        view['scatter_axes'] = (x_axis, y_axis, size_axis)
+    if view['scatter_plot'] is not None:
+        st.plotly_chart(view['scatter_plot'])
+
+    # Add the new influence plot
+    if len(result):
+
+        st.markdown("""
+        <div class="hover-text">
+            <h3>Influence Plot</h3>
+            <div class="hover-content">
+                <ul>
+                    <li>The overall detection power is the result of expression probability (probability that the DE/eQTL genes are detected) and DE power (probability that the DE/eQTL genes are found significant).</p>
+                    <li>The plots show the influence of the y axis (left) and x axis (right) parameter of the upper plot onto the power of the selected study, while keeping the second parameter constant.</p>
+                    <li>The dashed lines shows the location of the selected study.</p>
+                </ul>
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+
+        if view['influence_plot'] is not None:
+            st.plotly_chart(view['influence_plot'])
+    else:
+        st.warning("No influence data available. Please check your data source.")
@@ -0,0 +1,132 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+CATEGORICAL_COLUMNS = ['name']
+# Arrow schema metadata key holding the result metadata as JSON
+ARROW_METADATA_KEY = b'scpower'
+
+
+# Function to store the result columns compactly: categorical study names and int32
+# integer columns where the values fit. Narrower integers would overflow in derived
+# quantities such as sampleSize * totalCells, and float columns stay float64 because
+# the collector reports up to 10 significant digits.
+def compact_frame(df):
+    df = df.reset_index(drop=True)
+    int32 = np.iinfo(np.int32)
+    for col in df.columns:
+        if col in CATEGORICAL_COLUMNS:
+            df[col] = df[col].astype('category')
+        elif pd.api.types.is_integer_dtype(df[col]) and df[col].dtype != np.int32 and len(df[col]) \
+                and int32.min <= df[col].min() and df[col].max() <= int32.max:
+            df[col] = df[col].astype(np.int32)
+    return df
+
+
+# Function to turn float columns holding only whole numbers into int64. R keeps
+# counts such as sampleSize as doubles; toJSON writes them as whole numbers, so
+# this gives results read from R's Arrow output the dtypes of the JSON path.
+def integral_floats_to_int(df):
+    for col in df.columns:
+        if pd.api.types.is_float_dtype(df[col]):
+            values = df[col].to_numpy()
+            if len(values) and np.isfinite(values).all() and (values == np.round(values)).all():
+                df[col] = values.astype(np.int64)
+    return df
+
+
+# One typed, columnar result per analysis run. The same object is handed to both
+# plots, the JSON view, exports and the result cache, so it must not be modified.
+class AnalysisResult:
+    def __init__(self, frame, metadata=None):
+        self.frame = frame
+        self.metadata = metadata or {}
+
+    @classmethod
+    def from_records(cls, records, metadata=None):
+        return cls(compact_frame(pd.DataFrame.from_records(records)), metadata)
+
+    @classmethod
+    def from_json(cls, text, metadata=None):
+        return cls.from_records(json.loads(text), metadata)
+
+    @classmethod
+    def from_arrow(cls, table, metadata=None):
+        if metadata is None and ARROW_METADATA_KEY in (table.schema.metadata or {}):
+            metadata = json.loads(table.schema.metadata[ARROW_METADATA_KEY])
+        return cls(compact_frame(table.to_pandas()), metadata)
+
+    @classmethod
+    def from_arrow_stream(cls, data):
+        return cls.from_arrow(pa.ipc.open_stream(data).read_all())
+
+    @classmethod
+    def concat(cls, results, metadata=None):
+        frames = [result.frame for result in results if len(result)]
+        if not frames:
+            return cls(pd.DataFrame(), metadata)
+        return cls(compact_frame(pd.concat(frames, ignore_index=True)), metadata)
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def columns(self):
+        return list(self.frame.columns)
+
+    def to_json(self):
+        return self.frame.to_json(orient='records')
+
+    def to_csv(self):
+        return self.frame.to_csv(index=False)
+
+    def to_records(self):
+        return json.loads(self.to_json())
+
+    def to_arrow(self):
+        table = pa.Table.from_pandas(self.frame, preserve_index=False)
+        if self.metadata:
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                                   ARROW_METADATA_KEY: json.dumps(self.metadata)})
+        return table
+
+    # Function to serialize the result as an Arrow IPC stream, the columnar format of the HTTP API
+    def to_arrow_stream(self):
+        table = self.to_arrow()
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    # Function to serialize the result as a Parquet file, the format of downloads and sweep outputs
+    def to_parquet(self):
+        sink = pa.BufferOutputStream()
+        pq.write_table(self.to_arrow(), sink)
+        return sink.getvalue().to_pybytes()
+
+    def memory_usage(self):
+        return int(self.frame.memory_usage(deep=True).sum())
+
+
+# Function to accept an AnalysisResult, a DataFrame or a list of records
+def as_frame(data):
+    if isinstance(data, AnalysisResult):
+        return data.frame
+    if isinstance(data, pd.DataFrame):
+        return data
+    return pd.DataFrame(data)
+
+
+# Function to sum the memory held by the results stored in a session state mapping,
+# including the text and files prepared from them in the views' state dicts
+def session_memory_usage(session_state):
+    total = 0
+    for value in session_state.values():
+        if isinstance(value, AnalysisResult):
+            total += value.memory_usage()
+        elif isinstance(value, dict):
+            total += sum(len(item) for item in value.values() if isinstance(item, (str, bytes)))
+    return total
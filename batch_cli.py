@@ -0,0 +1,192 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from adaptive_grid import ADAPTIVE_KEY, TARGET_KEY, adaptive_power_study
+from analysis_args import scenario_args, validate_args
+from logging_setup import configure_logging
+from power_engine import run_power_study
+from r_worker_pool import POOL_SIZE, RAnalysisError, RWorkerError
+from result_cache import args_hash, get_result_cache
+from target_power import stream_target_power
+
+SCENARIO_SUFFIXES = ('.json', '.yaml', '.yml')
+FORMATS = ('parquet', 'csv')
+
+
+def read_spec(path):
+    with open(path) as file:
+        if path.endswith('.json'):
+            return json.load(file)
+        try:
+            import yaml
+        except ImportError:
+            raise SystemExit(f"Reading {path} needs PyYAML (pip install pyyaml)")
+        return yaml.safe_load(file)
+
+
+# Function to expand a sweep spec {"base": {...}, "sweep": {"param": [values, ...]}}
+# into the cartesian product of the swept values
+def expand_sweep(spec):
+    names = list(spec["sweep"])
+    for values in itertools.product(*(spec["sweep"][name] for name in names)):
+        yield dict(spec.get("base") or {}, **dict(zip(names, values)))
+
+
+# Function to list (source, args) for every scenario in the given files and directories.
+# A file holds one args dict, a list of them or a sweep spec, in the args schema of the app;
+# parameters left out take the app's default values. Every scenario is validated before
+# any of them runs.
+def load_scenarios(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.endswith(SCENARIO_SUFFIXES)))
+        else:
+            files.append(path)
+
+    scenarios = []
+    for file_name in files:
+        spec = read_spec(file_name)
+        if isinstance(spec, dict) and "sweep" in spec:
+            entries = list(expand_sweep(spec))
+        elif isinstance(spec, list):
+            entries = spec
+        else:
+            entries = [spec]
+        for index, overrides in enumerate(entries):
+            source = f"{file_name}#{index}"
+            if not isinstance(overrides, dict):
+                raise SystemExit(f"{source}: a scenario must be an object of analysis parameters")
+            try:
+                args = scenario_args(overrides)
+            except ValueError as e:
+                raise SystemExit(f"{source}: {e}")
+            errors = validate_args(args)
+            if errors:
+                raise SystemExit(f"{source}: {'; '.join(errors)}")
+            scenarios.append((source, args))
+    return scenarios
+
+
+# Result files live in <out>/results so that pd.read_parquet(f"{out}/results") reads them all
+def output_path(out, scenario_id, output_format):
+    return os.path.join(out, "results", f"{scenario_id}.{output_format}")
+
+
+# Function to write one scenario's rows next to the others, atomically so that an
+# interrupted run never leaves a file that resuming would take as finished
+def write_output(result, scenario_id, out, output_format):
+    frame = result.frame.assign(scenario=scenario_id)
+    path = output_path(out, scenario_id, output_format)
+    temp_path = f"{path}.tmp"
+    if output_format == 'parquet':
+        pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), temp_path)
+    else:
+        frame.to_csv(temp_path, index=False)
+    os.replace(temp_path, path)
+
+
+def run_batch(paths, out, output_format='parquet', workers=None, timeout=None, force=False):
+    all_scenarios = load_scenarios(paths)
+    os.makedirs(os.path.join(out, "results"), exist_ok=True)
+
+    # Scenarios are identified by their cache key, so identical scenarios run once
+    scenarios = {}
+    for source, args in all_scenarios:
+        scenarios.setdefault(args_hash(args)[:16], (source, args))
+    pending = {scenario_id: scenario for scenario_id, scenario in scenarios.items()
+               if force or not os.path.exists(output_path(out, scenario_id, output_format))}
+    skipped = len(scenarios) - len(pending)
+    logging.info(f"Batch: {len(all_scenarios)} scenarios, {len(scenarios)} distinct, "
+                 f"{skipped} already in {out}, {len(pending)} to run")
+
+    manifest_lock = threading.Lock()
+
+    def run_scenario(scenario_id, source, args):
+        start = time.monotonic()
+        if args.get(TARGET_KEY):
+            # One row per probe of the search
+            result = next(stream_target_power(args, timeout))
+        elif args.get(ADAPTIVE_KEY):
+            result = adaptive_power_study(args, timeout)
+        else:
+            result = run_power_study(args, timeout)
+        write_output(result, scenario_id, out, output_format)
+        elapsed = time.monotonic() - start
+        with manifest_lock, open(os.path.join(out, 'manifest.jsonl'), 'a') as manifest:
+            manifest.write(json.dumps({"scenario": scenario_id, "source": source, "rows": len(result),
+                                       "seconds": round(elapsed, 3), "args": args}) + "\n")
+        return len(result)
+
+    start = time.monotonic()
+    done = failed = points = 0
+    # Threads only dispatch: the analyses run on the shared R worker processes and
+    # go through the result cache
+    with ThreadPoolExecutor(max_workers=workers or max(POOL_SIZE, 1)) as executor:
+        futures = {executor.submit(run_scenario, scenario_id, *scenario): scenario
+                   for scenario_id, scenario in pending.items()}
+        for future in as_completed(futures):
+            try:
+                points += future.result()
+                done += 1
+            except (RAnalysisError, RWorkerError) as e:
+                logging.error(f"Batch: scenario {futures[future][0]} failed: {e}")
+                failed += 1
+            except Exception:
+                # Any other error is one failed scenario too; the rest of the batch goes on
+                logging.exception(f"Batch: scenario {futures[future][0]} failed")
+                failed += 1
+            if (done + failed) % 10 == 0:
+                logging.info(f"Batch: {done + failed} of {len(pending)} scenarios processed")
+
+    elapsed = time.monotonic() - start
+    cache_stats = get_result_cache().stats()
+    summary = {
+        "scenarios": len(scenarios),
+        "done": done,
+        "failed": failed,
+        "skipped": skipped,
+        "seconds": round(elapsed, 2),
+        "scenarios_per_minute": round(60 * done / elapsed, 1) if elapsed > 0 else None,
+        "grid_points_per_second": round(points / elapsed, 1) if elapsed > 0 else None,
+        "cache_hits": cache_stats["memory_hits"] + cache_stats["disk_hits"],
+    }
+    logging.info(f"Batch: {done} done, {failed} failed, {skipped} skipped in {elapsed:.1f} s "
+                 f"({summary['scenarios_per_minute']} scenarios/min, "
+                 f"{summary['grid_points_per_second']} grid points/s, {summary['cache_hits']} cache hits)")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many power analyses without the browser.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run = subparsers.add_parser('run', help="Run scenario files or sweep specs (resumable)")
+    run.add_argument('paths', nargs='+', help="JSON/YAML scenario files or directories holding them")
+    run.add_argument('--out', required=True, help="Directory for manifest.jsonl and results/ with one file per scenario")
+    run.add_argument('--format', choices=FORMATS, default='parquet', help="Result file format")
+    run.add_argument('--workers', type=int, default=None, help="Number of scenarios run in parallel")
+    run.add_argument('--timeout', type=float, default=None, help="Seconds allowed per R computation")
+    run.add_argument('--force', action='store_true', help="Recompute scenarios that already have a result file")
+    options = parser.parse_args()
+
+    configure_logging()
+    if options.command == 'run':
+        summary = run_batch(options.paths, options.out, options.format, options.workers, options.timeout,
+                            options.force)
+        print(json.dumps(summary))
+        if summary["failed"]:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# Cold start benchmark of the Streamlit app: import time of app.py and of the
+# analysis page (python -X importtime in a fresh interpreter), and the time of the
+# first full script run of each page in a fresh process (AppTest), which is what a
+# new session waits for before the page is painted.
+#
+#   python benchmarks/bench_imports.py [--repeat 5] [--top 15]
+#   python benchmarks/bench_imports.py --compare benchmarks/results/imports-<commit>.json
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from benchmarks.bench_pipeline import RESULTS_DIR, git_commit  # noqa: E402
+
+MODULES = ["app", "analysis_page"]
+PAGES = ["Home", "Description", "Tutorial", "License Statement", "Detect DE/eQTL Genes"]
+
+FIRST_RUN_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=120)
+at.session_state.page = sys.argv[1]
+at.run()
+if at.exception:
+    raise SystemExit(str(at.exception))
+print(time.perf_counter() - start)
+"""
+
+
+# Function to import a module in a fresh interpreter and read -X importtime's report:
+# the total in seconds and the slowest top-level imports by cumulative time
+def import_time(module, top):
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True,
+                             text=True, cwd=REPO_DIR, env=dict(os.environ, PYTHONPATH=REPO_DIR), check=True)
+    # Lines look like "import time: self [us] | cumulative | imported package", with two
+    # spaces of indentation per nesting level; a package is listed after its imports
+    entries = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name[1:].rstrip()
+        entries.append(((len(name) - len(name.lstrip())) // 2, name.strip(), int(cumulative)))
+
+    index = next(i for i, (depth, name, _) in enumerate(entries) if depth == 0 and name == module)
+    children = []
+    for depth, name, cumulative in reversed(entries[:index]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((name, cumulative))
+    children.sort(key=lambda entry: -entry[1])
+    return entries[index][2] / 1e6, {name: cumulative / 1e6 for name, cumulative in children[:top]}
+
+
+def first_run_time(page):
+    process = subprocess.run([sys.executable, "-c", FIRST_RUN_SCRIPT, page], capture_output=True, text=True,
+                             cwd=REPO_DIR, env=dict(os.environ, PYTHONPATH=REPO_DIR), check=True)
+    return float(process.stdout.strip().splitlines()[-1])
+
+
+def compare(report, baseline, threshold):
+    regressions = 0
+    print(f"\nCompared with {baseline['commit']}, median seconds:")
+    for section in ("imports", "first_run"):
+        for name, timing in report[section].items():
+            before = baseline.get(section, {}).get(name)
+            if before is None:
+                continue
+            ratio = timing["median"] / before["median"] if before["median"] > 0 else float('inf')
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  slower"
+                regressions += 1
+            print(f"{section:<10} {name:<22} {before['median']:>8.3f} {timing['median']:>8.3f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and first page run of the Streamlit app")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help="slowest imports listed per module")
+    parser.add_argument('--output', help="result file (default: benchmarks/results/imports-<commit>.json)")
+    parser.add_argument('--compare', help="earlier result file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative slowdown reported by --compare")
+    options = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": options.repeat,
+        "imports": {},
+        "slowest_imports": {},
+        "first_run": {},
+    }
+
+    for module in MODULES:
+        runs = [import_time(module, options.top) for _ in range(options.repeat)]
+        totals = [total for total, _ in runs]
+        report["imports"][module] = {"median": statistics.median(totals), "min": min(totals)}
+        report["slowest_imports"][module] = runs[-1][1]
+        print(f"import {module:<16} {report['imports'][module]['median']:.3f} s")
+        for name, seconds in runs[-1][1].items():
+            print(f"    {name:<36} {seconds:.3f} s")
+
+    for page in PAGES:
+        times = [first_run_time(page) for _ in range(options.repeat)]
+        report["first_run"][page] = {"median": statistics.median(times), "min": min(times)}
+        print(f"first run {page:<22} {report['first_run'][page]['median']:.3f} s")
+
+    output = options.output or os.path.join(RESULTS_DIR, f"imports-{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"\nResults written to {output}")
+
+    if options.compare:
+        with open(options.compare) as file:
+            baseline = json.load(file)
+        if compare(report, baseline, options.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
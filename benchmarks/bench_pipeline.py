@@ -0,0 +1,190 @@
+# Stage-level benchmark of the Detect DE/eQTL path: args and json_safe, the temp
+# file, process spawn, the R side (library startup, RData loads, scPower compute,
+# JSON serialization), stdout parsing and figure construction. The collector
+# reports its own stage timings on stderr when SCPOWER_TIMINGS is set.
+#
+#   python benchmarks/bench_pipeline.py [--sizes 25 400 2500] [--repeat 5]
+#   python benchmarks/bench_pipeline.py --real          # Rscript with scPower (SCPOWER_RSCRIPT)
+#   SCPOWER_TRANSPORT=json python benchmarks/bench_pipeline.py   # JSON instead of the Arrow transport
+#   python benchmarks/bench_pipeline.py --compare benchmarks/results/pipeline-<commit>-fake.json
+#
+# Without --real the deterministic benchmarks/fake_rscript.py stands in for R.
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from analysis_args import DEFAULT_ARGS, json_safe  # noqa: E402
+from analysis_result import AnalysisResult  # noqa: E402
+from plots import create_influence_plot, create_scatter_plot  # noqa: E402
+from power_engine import COLLECTOR_SCRIPT, result_transport  # noqa: E402
+from r_worker_pool import RSCRIPT  # noqa: E402
+
+FAKE_RSCRIPT = os.path.join(REPO_DIR, "benchmarks", "fake_rscript.py")
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "results")
+PARAMETER_VECTOR = ["sc", 1000, 100, 200, 400000000, "eqtl"]
+TIMING_PREFIX = "@@scpower-timing "
+
+STAGES = ["build_args", "write_temp_file", "spawn", "r_libraries", "r_load_reference_data", "r_compute",
+          "r_serialize", "parse_stdout", "scatter_plot", "influence_plot"]
+
+
+# Function to build args the way perform_analysis() does, with numpy ranges from the widgets
+def build_args(n_points):
+    side = max(1, int(round(np.sqrt(n_points))))
+    args = dict(DEFAULT_ARGS,
+                nSamplesRange=np.linspace(10, 500, side).round().astype(np.int64),
+                nCellsRange=np.linspace(2000, 20000, side).round().astype(np.int64),
+                readDepthRange=None)
+    return json_safe(args)
+
+
+# Function to read the stage timings the collector printed on stderr
+def collector_timings(stderr):
+    timings = {}
+    for line in stderr.splitlines():
+        if line.startswith(TIMING_PREFIX):
+            timing = json.loads(line[len(TIMING_PREFIX):])
+            timings[timing["stage"]] = timing.get("seconds", timing.get("epoch"))
+    return timings
+
+
+def run_once(rscript, n_points):
+    timings = {}
+
+    start = time.perf_counter()
+    args = build_args(n_points)
+    timings["build_args"] = time.perf_counter() - start
+
+    with result_transport(args) as (transport_args, read_transported):
+        start = time.perf_counter()
+        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as temp_file:
+            json.dump(transport_args, temp_file)
+            temp_file_path = temp_file.name
+        timings["write_temp_file"] = time.perf_counter() - start
+
+        try:
+            spawned = time.time()
+            process = subprocess.run([rscript, COLLECTOR_SCRIPT, temp_file_path], capture_output=True, text=True,
+                                     cwd=REPO_DIR, env=dict(os.environ, SCPOWER_TIMINGS="1"))
+        finally:
+            os.unlink(temp_file_path)
+        if process.returncode != 0:
+            raise RuntimeError(f"{rscript} exited with status {process.returncode}: {process.stdout}{process.stderr}")
+
+        r_timings = collector_timings(process.stderr)
+        timings["spawn"] = r_timings["started"] - spawned
+        for stage in ["libraries", "load_reference_data", "compute", "serialize"]:
+            timings[f"r_{stage}"] = r_timings[stage]
+
+        # Reading the Arrow transport file, or the JSON on stdout when R fell back to it
+        start = time.perf_counter()
+        result = read_transported()
+        if result is None:
+            result = AnalysisResult.from_json(process.stdout)
+        timings["parse_stdout"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    create_scatter_plot(result, "sampleSize", "totalCells", "Detection.power")
+    timings["scatter_plot"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    create_influence_plot(result, PARAMETER_VECTOR)
+    timings["influence_plot"] = time.perf_counter() - start
+
+    return len(result), timings
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=REPO_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(report, baseline, threshold):
+    regressions = 0
+    print(f"\nCompared with {baseline['commit']} ({baseline['mode']}), median seconds:")
+    print(f"{'points':>7} {'stage':<22} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for size, stages in report["results"].items():
+        if size not in baseline["results"]:
+            continue
+        for stage, timing in stages.items():
+            before = baseline["results"][size].get(stage)
+            if before is None:
+                continue
+            ratio = timing["median"] / before["median"] if before["median"] > 0 else float('inf')
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  slower"
+                regressions += 1
+            print(f"{size:>7} {stage:<22} {before['median']:>10.4f} {timing['median']:>10.4f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stage-level benchmark of the analysis pipeline")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[25, 400, 2500], help="grid points per run")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--real', action='store_true', help="run the real Rscript instead of the fake one")
+    parser.add_argument('--output', help="result file (default: benchmarks/results/pipeline-<commit>-<mode>.json)")
+    parser.add_argument('--compare', help="earlier result file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative slowdown reported by --compare")
+    options = parser.parse_args()
+
+    mode = "real" if options.real else "fake"
+    rscript = RSCRIPT if options.real else FAKE_RSCRIPT
+
+    report = {
+        "commit": git_commit(),
+        "mode": mode,
+        "transport": os.environ.get("SCPOWER_TRANSPORT", "arrow"),
+        "created": datetime.datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": options.repeat,
+        "results": {},
+    }
+
+    print(f"{'points':>7} " + " ".join(f"{stage:>12.12}" for stage in STAGES))
+    for size in options.sizes:
+        runs = [run_once(rscript, size) for _ in range(options.repeat)]
+        n_points = runs[0][0]
+        report["results"][str(n_points)] = {
+            stage: {
+                "median": statistics.median(timings[stage] for _, timings in runs),
+                "min": min(timings[stage] for _, timings in runs),
+            }
+            for stage in STAGES
+        }
+        medians = report["results"][str(n_points)]
+        print(f"{n_points:>7} " + " ".join(f"{medians[stage]['median']:>12.4f}" for stage in STAGES))
+
+    output = options.output or os.path.join(RESULTS_DIR, f"pipeline-{report['commit']}-{mode}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"\nResults written to {output}")
+
+    if options.compare:
+        with open(options.compare) as file:
+            baseline = json.load(file)
+        if compare(report, baseline, options.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
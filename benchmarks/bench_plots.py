@@ -0,0 +1,105 @@
+# Micro-benchmark of the figure builders in plots.py against the previous
+# per-row implementations (hover text built with df.apply / df.iterrows, SVG traces).
+#
+#   python benchmarks/bench_plots.py [--sizes 1000 10000 100000] [--repeat 3]
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.subplots as sp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plots import create_influence_plot, create_scatter_plot  # noqa: E402
+
+PARAMETER_VECTOR = ["sc", 1000, 100, 200, 400000000, "eqtl"]
+
+
+# Function to build a result frame shaped like the collector output with roughly n_points rows
+def synthetic_result(n_points, seed=0):
+    rng = np.random.default_rng(seed)
+    side = max(2, int(np.sqrt(n_points)))
+    samples, cells = np.meshgrid(np.linspace(10, 500, side).round(), np.linspace(1000, 20000, side).round())
+    n = samples.size
+    exp_probs = rng.uniform(0.5, 0.9, n).round(4)
+    power = rng.uniform(0.6, 1.0, n).round(4)
+    return pd.DataFrame({
+        "name": "Blueprint (CLL) iCLL-mCLL",
+        "Detection.power": (exp_probs * power).round(3),
+        "exp.probs": exp_probs,
+        "power": power,
+        "sampleSize": samples.ravel().astype(int),
+        "totalCells": cells.ravel().astype(int),
+        "readDepth": rng.integers(10000, 700000, n),
+    })
+
+
+def legacy_scatter_plot(data, x_axis, y_axis, size_axis):
+    df = pd.DataFrame(data)
+    for col in [x_axis, y_axis, size_axis, 'Detection.power']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df = df.dropna(subset=[x_axis, y_axis, size_axis, 'Detection.power'])
+    return go.Figure(go.Scatter(
+        x=df[x_axis], y=df[y_axis], mode='markers',
+        marker=dict(size=df[size_axis], sizemode='area', sizeref=2 * df[size_axis].max() / (40**2), sizemin=4,
+                    color=df['Detection.power'], colorscale='Viridis', showscale=True),
+        text=df.apply(lambda row: f"Sample size: {row.get('sampleSize', 'N/A')}<br>Cells per individuum: {row.get('totalCells', 'N/A')}<br>Read depth: {row.get('readDepth', 'N/A')}<br>Detection power: {row.get('Detection.power', 'N/A')}", axis=1),
+        hoverinfo='text'
+    ))
+
+
+def legacy_influence_plot(data):
+    df = pd.DataFrame(data)
+    max_study = df.loc[df['Detection.power'].idxmax()]
+    plot_columns = ['Detection.power', 'exp.probs', 'power']
+    fig = sp.make_subplots(rows=1, cols=2, shared_yaxes=True)
+    for subplot, (df_plot, x_column) in enumerate([(df[df['totalCells'] == max_study['totalCells']], 'sampleSize'),
+                                                   (df[df['sampleSize'] == max_study['sampleSize']], 'totalCells')], start=1):
+        for col in plot_columns:
+            fig.add_trace(go.Scatter(
+                x=df_plot[x_column], y=df_plot[col], mode='lines+markers', name=col,
+                text=[f'Sample size: {row.sampleSize}<br>Cells per individuum: {row.totalCells}<br>Read depth: {row.readDepth}<br>{col}: {row[col]:.3f}' for _, row in df_plot.iterrows()],
+                hoverinfo='text'
+            ), row=1, col=subplot)
+    return fig
+
+
+def best_time(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    options = parser.parse_args()
+
+    # Streamlit serializes every figure to JSON, so that is part of the measured cost
+    cases = [
+        ("scatter", lambda df: legacy_scatter_plot(df, "sampleSize", "totalCells", "Detection.power").to_json(),
+         lambda df: create_scatter_plot(df, "sampleSize", "totalCells", "Detection.power").to_json()),
+        ("influence", lambda df: legacy_influence_plot(df).to_json(),
+         lambda df: create_influence_plot(df, PARAMETER_VECTOR).to_json()),
+    ]
+
+    print(f"{'figure':<10} {'points':>8} {'legacy (s)':>11} {'vectorized (s)':>15} {'speedup':>8}")
+    for size in options.sizes:
+        df = synthetic_result(size)
+        for name, legacy, vectorized in cases:
+            legacy_time = best_time(lambda: legacy(df), options.repeat)
+            vectorized_time = best_time(lambda: vectorized(df), options.repeat)
+            print(f"{name:<10} {len(df):>8} {legacy_time:>11.4f} {vectorized_time:>15.4f} {legacy_time / vectorized_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# Deterministic stand-in for Rscript that speaks the protocols of
+# scpower_collector.R and scpower_worker.R without R or scPower installed.
+# Every grid point gets a row of scPower_shiny/power_study_plot.json (cycled)
+# with the design columns replaced by the requested grid values.
+#
+#   SCPOWER_RSCRIPT=benchmarks/fake_rscript.py streamlit run app.py
+#
+# Optional delays emulate the cost of the R side:
+#   FAKE_R_STARTUP            seconds before the script "starts" (R and library startup)
+#   FAKE_R_LOAD               seconds for load_reference_data()
+#   FAKE_R_SECONDS_PER_POINT  compute time per grid point
+
+import json
+import os
+import sys
+import time
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_FILE = os.path.join(REPO_DIR, "scPower_shiny", "power_study_plot.json")
+PROTOCOL_PREFIX = "@@scpower "
+
+STARTUP = float(os.environ.get("FAKE_R_STARTUP", "0"))
+LOAD = float(os.environ.get("FAKE_R_LOAD", "0"))
+SECONDS_PER_POINT = float(os.environ.get("FAKE_R_SECONDS_PER_POINT", "0"))
+
+
+def report_timing(stage, since):
+    if os.environ.get("SCPOWER_TIMINGS"):
+        print(f"@@scpower-timing {json.dumps({'stage': stage, 'seconds': time.time() - since})}", file=sys.stderr)
+
+
+# Function to list the values of a range argument; jsonlite unboxes one-element vectors
+def range_values(value):
+    if value is None:
+        return None
+    return value if isinstance(value, list) else [value]
+
+
+def power_study(args, template):
+    samples = range_values(args.get("nSamplesRange"))
+    cells = range_values(args.get("nCellsRange"))
+    reads = range_values(args.get("readDepthRange"))
+    if samples is None:
+        points = [(None, c, r) for r in reads for c in cells]
+    elif cells is None:
+        points = [(s, None, r) for r in reads for s in samples]
+    else:
+        points = [(s, c, None) for c in cells for s in samples]
+
+    time.sleep(SECONDS_PER_POINT * len(points))
+    rows = []
+    for i, (sample_size, total_cells, read_depth) in enumerate(points):
+        row = dict(template[i % len(template)], name=args.get("ref.study.name", "fake"))
+        if sample_size is not None:
+            row["sampleSize"] = sample_size
+        if total_cells is not None:
+            row["totalCells"] = total_cells
+        if read_depth is not None:
+            row["readDepth"] = read_depth
+        rows.append(row)
+    return rows
+
+
+# Like write_result_arrow() in scpower_engine.R: use the Arrow transport when offered
+def write_result_arrow(rows, args):
+    if pa is None or args.get("transport") != "arrow" or not args.get("transportPath"):
+        return False
+    with pa.OSFile(args["transportPath"], 'wb') as sink:
+        table = pa.Table.from_pylist(rows)
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return True
+
+
+def load_template():
+    started = time.time()
+    time.sleep(LOAD)
+    with open(TEMPLATE_FILE) as file:
+        template = json.load(file)
+    report_timing("load_reference_data", started)
+    return template
+
+
+def collector(args_file):
+    with open(args_file) as file:
+        args = json.load(file)
+    template = load_template()
+    if args.get("streamResults"):
+        for row in power_study(args, template):
+            print(json.dumps(row), flush=True)
+        return
+
+    started = time.time()
+    rows = power_study(args, template)
+    report_timing("compute", started)
+    started = time.time()
+    output = json.dumps({"transport": "arrow"}) if write_result_arrow(rows, args) else json.dumps(rows)
+    report_timing("serialize", started)
+    print(output)
+
+
+def reply(message):
+    print(PROTOCOL_PREFIX + json.dumps(message), flush=True)
+
+
+def worker():
+    template = load_template()
+    reply({"status": "ready", "pid": os.getpid(), "scpower_version": "fake"})
+    for line in sys.stdin:
+        request = json.loads(line)
+        if request["cmd"] == "quit":
+            break
+        if request["cmd"] == "ping":
+            reply({"id": request["id"], "status": "pong"})
+        elif request["cmd"] == "run":
+            rows = power_study(request["args"], template)
+            if write_result_arrow(rows, request["args"]):
+                reply({"id": request["id"], "status": "ok", "transport": "arrow"})
+            else:
+                reply({"id": request["id"], "status": "ok", "result": rows})
+        elif request["cmd"] == "stream":
+            # Like stream_power_study() in scpower_engine.R: one chunk per value of the first range
+            args = request["args"]
+            first_range = next(name for name in ("nSamplesRange", "nCellsRange", "readDepthRange")
+                               if args.get(name) is not None)
+            for value in range_values(args[first_range]):
+                chunk_args = dict(args, **{first_range: value})
+                reply({"id": request["id"], "status": "partial", "result": power_study(chunk_args, template)})
+            reply({"id": request["id"], "status": "ok"})
+        else:
+            reply({"id": request.get("id"), "status": "error", "message": f"Unknown command {request['cmd']}"})
+
+
+def main():
+    started = time.time()
+    time.sleep(STARTUP)
+    if os.environ.get("SCPOWER_TIMINGS"):
+        print(f"@@scpower-timing {json.dumps({'stage': 'started', 'epoch': started})}", file=sys.stderr)
+    report_timing("libraries", started)
+
+    # `Rscript -e ...` is how the scPower version is queried
+    if sys.argv[1:2] == ["-e"]:
+        print("fake", end="")
+    elif os.path.basename(sys.argv[1]) == "scpower_worker.R":
+        worker()
+    else:
+        collector(sys.argv[2])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+from reference_data import reference_celltypes
+
+ALL = "All"
+
+
+# Cell types are named "<assay>_<tissue>_<cell type>"; the catalog precomputes the
+# option lists for every assay/tissue selection so the selectboxes only do lookups
+class CellTypeCatalog:
+    def __init__(self, celltypes):
+        self.celltypes = list(celltypes)
+
+        by_assay_tissue = {}
+        for celltype in self.celltypes:
+            parts = celltype.split('_')
+            if len(parts) >= 3:
+                by_assay_tissue.setdefault(parts[0], {}).setdefault(parts[1], []).append(celltype)
+
+        self.assays = sorted(by_assay_tissue)
+        self.tissues = {ALL: sorted({tissue for tissues in by_assay_tissue.values() for tissue in tissues})}
+        self.filtered = {(ALL, ALL): self.celltypes}
+        for assay, tissues in by_assay_tissue.items():
+            self.tissues[assay] = sorted(tissues)
+            self.filtered[(assay, ALL)] = [ct for ct in self.celltypes if ct.split('_')[0] == assay]
+            for tissue, celltypes_in_tissue in tissues.items():
+                self.filtered[(assay, tissue)] = celltypes_in_tissue
+        for tissue in self.tissues[ALL]:
+            self.filtered[(ALL, tissue)] = [ct for ct in self.celltypes if ct.split('_')[1:2] == [tissue]]
+
+    def tissues_for(self, assay=ALL):
+        return self.tissues.get(assay or ALL, [])
+
+    def celltypes_for(self, assay=ALL, tissue=ALL):
+        return self.filtered.get((assay or ALL, tissue or ALL), [])
+
+
+# Function to build the catalog from the cell types in the dispersion fits
+def load_celltype_catalog():
+    return CellTypeCatalog(reference_celltypes())
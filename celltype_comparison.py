@@ -0,0 +1,44 @@
+import os
+
+import pandas as pd
+
+from adaptive_grid import POWER_COLUMN
+from grid_sharding import RANGE_COLUMNS, grid_ranges
+from target_power import best_design
+
+# Upper limit on the cell types compared in one go; narrow the assay and tissue filters for more
+COMPARISON_MAX_CELLTYPES = int(os.environ.get("SCPOWER_COMPARISON_MAX_CELLTYPES", "60"))
+
+
+# Function to get the args of every cell type: the same parameter set with only the cell type changed
+def celltype_args(args, celltypes):
+    return {celltype: dict(args, ct=celltype) for celltype in celltypes}
+
+
+# Function to reduce one cell type's result to what the comparison shows: its best
+# design as a table row, and the best power at every value of the grid's first range
+def summarize_celltype(celltype, args, result):
+    design = best_design(result)
+    row = {"celltype": celltype, POWER_COLUMN: design[POWER_COLUMN] if design is not None else None}
+    for column in RANGE_COLUMNS.values():
+        if design is not None and column in design:
+            row[column] = design[column]
+    curve = None
+    if design is not None:
+        (x_key, _), _ = grid_ranges(args)
+        x_column = RANGE_COLUMNS[x_key]
+        curve = result.frame.groupby(x_column)[POWER_COLUMN].max().reset_index()
+    return row, curve
+
+
+# Function to rank the compared cell types by the detection power of their best design;
+# cell types without a result (failed or no feasible design) come last
+def rank_celltypes(rows):
+    table = pd.DataFrame(list(rows))
+    if table.empty:
+        return table
+    if POWER_COLUMN not in table:
+        table[POWER_COLUMN] = None
+    table = table.sort_values(POWER_COLUMN, ascending=False, na_position='last', kind='stable').reset_index(drop=True)
+    table.insert(0, "rank", range(1, len(table) + 1))
+    return table
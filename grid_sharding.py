@@ -0,0 +1,120 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from analysis_result import AnalysisResult
+from r_worker_pool import POOL_SIZE
+
+SHARD_SIZE = int(os.environ.get("SCPOWER_SHARD_SIZE", "25"))
+SHARD_PARALLELISM = int(os.environ.get("SCPOWER_SHARD_PARALLELISM", str(max(POOL_SIZE, 1))))
+
+# Grid ranges in args and the result column holding each range's values
+RANGE_COLUMNS = {
+    "nSamplesRange": "sampleSize",
+    "nCellsRange": "totalCells",
+    "readDepthRange": "readDepth",
+}
+
+
+# Function to get the two (key, values) ranges that span the parameter grid
+def grid_ranges(args):
+    ranges = []
+    for key in RANGE_COLUMNS:
+        values = args.get(key)
+        if values is not None:
+            ranges.append((key, values if isinstance(values, list) else [values]))
+    return ranges
+
+
+def grid_size(args):
+    size = 1
+    for _, values in grid_ranges(args):
+        size *= len(values)
+    return size
+
+
+# Function to split the grid into args dicts of at most shard_size points each.
+# Shards take whole rows of the first range; the second range is only cut when
+# it alone is longer than a shard.
+def split_grid(args, shard_size=SHARD_SIZE):
+    ranges = grid_ranges(args)
+    if len(ranges) != 2:
+        return [args]
+    (x_key, x_values), (y_key, y_values) = ranges
+
+    y_chunk = max(1, min(len(y_values), shard_size))
+    x_chunk = max(1, shard_size // y_chunk)
+    shards = []
+    for i in range(0, len(x_values), x_chunk):
+        for j in range(0, len(y_values), y_chunk):
+            shards.append(dict(args, **{x_key: x_values[i:i + x_chunk], y_key: y_values[j:j + y_chunk]}))
+    return shards
+
+
+# Function to split a set of (x, y) points of the grid into rectangular batches:
+# x values that need the same y values share one R call
+def point_batches(args, points):
+    (x_key, _), (y_key, _) = grid_ranges(args)
+    ys_by_x = {}
+    for x, y in points:
+        ys_by_x.setdefault(x, []).append(y)
+    xs_by_ys = {}
+    for x, ys in ys_by_x.items():
+        xs_by_ys.setdefault(tuple(ys), []).append(x)
+    return [dict(args, **{x_key: xs, y_key: list(ys)}) for ys, xs in xs_by_ys.items()]
+
+
+# Function to merge shard results into one AnalysisResult in the row order of a
+# single run, where the first range varies fastest. Points outside the args
+# ranges (adaptive refinements) follow, ordered by value. Results without grid
+# columns, such as the probes of a target power search, keep their order.
+def merge_shards(args, shard_results):
+    metadata = {}
+    for result in shard_results:
+        metadata.update(result.metadata)
+    merged = AnalysisResult.concat(shard_results, metadata)
+    ranges = grid_ranges(args)
+    if len(ranges) != 2 or not len(merged):
+        return merged
+    (x_key, x_values), (y_key, y_values) = ranges
+    frame = merged.frame
+    x_column, y_column = RANGE_COLUMNS[x_key], RANGE_COLUMNS[y_key]
+    if x_column not in frame or y_column not in frame:
+        return merged
+    x_position = frame[x_column].map({value: i for i, value in enumerate(x_values)}).fillna(len(x_values))
+    y_position = frame[y_column].map({value: i for i, value in enumerate(y_values)}).fillna(len(y_values))
+
+    order = pd.DataFrame({"y": y_position, "x": x_position, "y_value": frame[y_column], "x_value": frame[x_column]}) \
+        .sort_values(["y", "x", "y_value", "x_value"], kind='stable').index
+    return AnalysisResult(frame.loc[order].reset_index(drop=True), merged.metadata)
+
+
+# Function to evaluate the grid shard by shard, running up to `parallelism` shards at once
+def run_sharded(args, run_shard, shard_size=SHARD_SIZE, parallelism=SHARD_PARALLELISM):
+    shards = split_grid(args, shard_size)
+    if len(shards) == 1:
+        return run_shard(shards[0])
+
+    with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(shards)))) as executor:
+        shard_results = list(executor.map(run_shard, shards))
+    return merge_shards(args, shard_results)
+
+
+# Generator yielding (batch, result) for args batches evaluated up to `parallelism` at
+# once, in completion order
+def stream_batches(batches, run_batch, parallelism=SHARD_PARALLELISM):
+    executor = ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(batches))))
+    try:
+        futures = {executor.submit(run_batch, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        # Batches that have not started yet are dropped when the consumer stops early
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Generator yielding shard results in completion order; merge them with merge_shards()
+def stream_sharded(args, run_shard, shard_size=SHARD_SIZE, parallelism=SHARD_PARALLELISM):
+    for _, result in stream_batches(split_grid(args, shard_size), run_shard, parallelism):
+        yield result
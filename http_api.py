@@ -0,0 +1,207 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import urllib.error
+import urllib.request
+
+import tornado.ioloop
+import tornado.web
+
+from analysis_args import scenario_args, validate_args
+from analysis_result import AnalysisResult
+from job_scheduler import FINISHED_STATES, get_job_scheduler
+from logging_setup import configure_logging
+
+API_HOST = os.environ.get("SCPOWER_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("SCPOWER_API_PORT", "8502"))
+# When set, the Streamlit page sends its analyses to this service instead of running them itself
+API_URL = os.environ.get("SCPOWER_API_URL")
+API_MAX_GRID_POINTS = int(os.environ.get("SCPOWER_API_MAX_GRID_POINTS", "10000"))
+API_POLL_INTERVAL = float(os.environ.get("SCPOWER_API_POLL_INTERVAL", "0.1"))
+ARROW_STREAM_TYPE = "application/vnd.apache.arrow.stream"
+
+
+# Function to serialize a result as JSON ({"metadata": ..., "rows": [...]}) or an Arrow IPC stream
+def serialize_result(result, output_format):
+    if output_format == "arrow":
+        return result.to_arrow_stream(), ARROW_STREAM_TYPE
+    body = f'{{"metadata": {json.dumps(result.metadata)}, "rows": {result.to_json()}}}'
+    return body.encode('utf-8'), "application/json"
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def write_error(self, status_code, **kwargs):
+        exception = kwargs.get("exc_info", (None, None))[1]
+        message = exception.log_message if isinstance(exception, tornado.web.HTTPError) and exception.log_message \
+            else self._reason
+        self.finish({"error": message})
+
+    def fail(self, status_code, message):
+        raise tornado.web.HTTPError(status_code, message)
+
+    # Function to read, complete and validate the args in the request body
+    def parse_args(self):
+        try:
+            overrides = json.loads(self.request.body or b"{}")
+        except json.JSONDecodeError as e:
+            self.fail(400, f"Request body is not valid JSON: {e}")
+        if not isinstance(overrides, dict):
+            self.fail(400, "Request body must be a JSON object with analysis parameters")
+        try:
+            args = scenario_args(overrides)
+        except ValueError as e:
+            self.fail(400, str(e))
+        errors = validate_args(args, API_MAX_GRID_POINTS)
+        if errors:
+            self.fail(400, "; ".join(errors))
+        return args
+
+    # Sessions of the Streamlit page pass their id, other clients are told apart by address
+    def user(self):
+        return self.request.headers.get("X-Scpower-User") or self.request.remote_ip
+
+    async def write_result(self, result):
+        output_format = self.get_query_argument("format", "json")
+        if output_format not in ("json", "arrow"):
+            self.fail(400, "format must be json or arrow")
+        # Serializing a large grid takes a while; keep the event loop free meanwhile
+        body, content_type = await tornado.ioloop.IOLoop.current().run_in_executor(
+            None, serialize_result, result, output_format)
+        self.set_header("Content-Type", content_type)
+        self.finish(body)
+
+
+# POST /analysis: run one analysis and answer with its result
+class AnalysisHandler(BaseHandler):
+    job_id = None
+
+    async def post(self):
+        args = self.parse_args()
+        scheduler = get_job_scheduler()
+        self.job_id = scheduler.submit(args, user=self.user())
+
+        while True:
+            status = scheduler.status(self.job_id)
+            if status is None or status["state"] in FINISHED_STATES:
+                break
+            await asyncio.sleep(API_POLL_INTERVAL)
+
+        if status is None or status["state"] == "cancelled":
+            self.fail(409, "The analysis was cancelled")
+        if status["state"] == "failed":
+            self.fail(500, status["error"])
+        await self.write_result(scheduler.result(self.job_id))
+
+    def on_connection_close(self):
+        # Nobody is waiting for the result any more
+        if self.job_id is not None:
+            get_job_scheduler().cancel(self.job_id)
+
+
+# POST /jobs: queue an analysis and answer with its job id right away
+class JobsHandler(BaseHandler):
+    def post(self):
+        args = self.parse_args()
+        job_id = get_job_scheduler().submit(args, user=self.user())
+        self.set_status(202)
+        self.finish({"id": job_id})
+
+
+# GET /jobs/<id>: job status, DELETE /jobs/<id>: cancel the job
+class JobHandler(BaseHandler):
+    def get(self, job_id):
+        status = get_job_scheduler().status(job_id)
+        if status is None:
+            self.fail(404, "Unknown job")
+        self.finish(status)
+
+    def delete(self, job_id):
+        self.finish({"cancelled": get_job_scheduler().cancel(job_id)})
+
+
+# GET /jobs/<id>/result[?partial=1]: the finished result, or the rows received so far
+class JobResultHandler(BaseHandler):
+    async def get(self, job_id):
+        scheduler = get_job_scheduler()
+        if scheduler.status(job_id) is None:
+            self.fail(404, "Unknown job")
+        if self.get_query_argument("partial", "0") == "1":
+            result = scheduler.partial_result(job_id) or AnalysisResult.from_records([])
+        else:
+            result = scheduler.result(job_id)
+            if result is None:
+                self.fail(409, "The job has no result yet")
+        await self.write_result(result)
+
+
+def make_app():
+    return tornado.web.Application([
+        (r"/analysis", AnalysisHandler),
+        (r"/jobs", JobsHandler),
+        (r"/jobs/([0-9a-f]+)", JobHandler),
+        (r"/jobs/([0-9a-f]+)/result", JobResultHandler),
+    ])
+
+
+# Client with the submit/status/cancel/result calls of the JobScheduler, so the
+# Streamlit page can use a running service in place of its own scheduler
+class ApiClient:
+    def __init__(self, base_url=API_URL, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, method, path, body=None, headers=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(f"{self.base_url}{path}", data=data, method=method,
+                                         headers=dict({"Content-Type": "application/json"}, **(headers or {})))
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.read()
+        except urllib.error.HTTPError as e:
+            if e.code in (404, 409):
+                return None
+            raise RuntimeError(f"{method} {path} failed: {e.read().decode('utf-8', errors='replace')}")
+
+    def submit(self, args, user="anonymous"):
+        return json.loads(self._request("POST", "/jobs", args, {"X-Scpower-User": user}))["id"]
+
+    def status(self, job_id):
+        body = self._request("GET", f"/jobs/{job_id}")
+        return json.loads(body) if body is not None else None
+
+    def cancel(self, job_id):
+        body = self._request("DELETE", f"/jobs/{job_id}")
+        return body is not None and json.loads(body)["cancelled"]
+
+    def result(self, job_id):
+        body = self._request("GET", f"/jobs/{job_id}/result?format=arrow")
+        return AnalysisResult.from_arrow_stream(body) if body is not None else None
+
+    def partial_result(self, job_id):
+        body = self._request("GET", f"/jobs/{job_id}/result?partial=1&format=arrow")
+        result = AnalysisResult.from_arrow_stream(body) if body is not None else None
+        return result if result is not None and len(result) else None
+
+
+# Function to get what the Streamlit page submits analyses to: the HTTP service
+# at SCPOWER_API_URL when configured, otherwise the in-process scheduler
+def get_analysis_backend():
+    return ApiClient(API_URL) if API_URL else get_job_scheduler()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP API for power analyses on the shared worker pool and cache.")
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    options = parser.parse_args()
+
+    configure_logging()
+    make_app().listen(options.port, options.host)
+    logging.info(f"Power analysis API listening on http://{options.host}:{options.port}")
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from adaptive_grid import planned_points
+from grid_sharding import merge_shards
+from metrics import REGISTRY, jobs_total
+from r_worker_pool import POOL_SIZE, REQUEST_TIMEOUT, RAnalysisError, RWorkerCancelled, RWorkerError, RWorkerTimeout
+from result_cache import args_hash
+from single_flight import get_single_flight
+
+MAX_CONCURRENT_JOBS = int(os.environ.get("SCPOWER_MAX_CONCURRENT_JOBS", str(max(POOL_SIZE, 1))))
+JOB_TIMEOUT = float(os.environ.get("SCPOWER_JOB_TIMEOUT", str(REQUEST_TIMEOUT)))
+# Finished jobs are kept this long so their session can pick up the result
+JOB_RETENTION = float(os.environ.get("SCPOWER_JOB_RETENTION", "600"))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class Job:
+    def __init__(self, args, user):
+        self.id = uuid.uuid4().hex
+        self.args = args
+        self.key = args_hash(args)
+        self.user = user
+        self.state = QUEUED
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.total_points = planned_points(args)
+        self.chunks = []
+        self.result = None
+        self.error = None
+        # Setting the event kills the R processes working on this job
+        self.cancel_event = threading.Event()
+        self.timed_out = False
+        # Followers attach to an identical running analysis and hold no slot
+        self.follower = False
+
+
+# Runs analyses in background threads. At most max_concurrent jobs run at once;
+# queued jobs are started round-robin across users so that one user's burst of
+# submissions cannot starve everybody else.
+class JobScheduler:
+    def __init__(self, max_concurrent=MAX_CONCURRENT_JOBS, timeout=JOB_TIMEOUT, retention=JOB_RETENTION,
+                 single_flight=None):
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.retention = retention
+        self.jobs = {}
+        # user -> deque of queued jobs; the first user is the next one to be served
+        self.queues = OrderedDict()
+        self.running = 0
+        self.lock = threading.Lock()
+        self.single_flight = single_flight or get_single_flight()
+
+    def submit(self, args, user="anonymous"):
+        job = Job(args, user)
+        with self.lock:
+            self._purge()
+            self.jobs[job.id] = job
+            self.queues.setdefault(user, deque()).append(job)
+            self._dispatch()
+        return job.id
+
+    def _purge(self):
+        cutoff = time.time() - self.retention
+        # A running job cancelled a moment ago has no finished_at until its thread has stopped
+        for job_id in [job.id for job in self.jobs.values()
+                       if job.state in FINISHED_STATES and job.finished_at is not None and job.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def _next_job(self):
+        # Serve the user at the head of the rotation, then move them to the back
+        while self.queues:
+            user, jobs = next(iter(self.queues.items()))
+            job = jobs.popleft()
+            if jobs:
+                self.queues.move_to_end(user)
+            else:
+                del self.queues[user]
+            if job.state == QUEUED:
+                return job
+        return None
+
+    def _start(self, job):
+        job.state = RUNNING
+        job.started_at = time.time()
+        if not job.follower:
+            self.running += 1
+        threading.Thread(target=self._run, args=(job,), daemon=True).start()
+
+    def _in_flight(self, key):
+        # A started job may not have registered its flight yet
+        return self.single_flight.in_flight(key) or \
+            any(job.key == key and job.state == RUNNING and not job.follower for job in self.jobs.values())
+
+    def _start_followers(self):
+        # Queued jobs identical to a running analysis start right away without a slot
+        for user, jobs in list(self.queues.items()):
+            for job in [job for job in jobs if job.state == QUEUED and self._in_flight(job.key)]:
+                jobs.remove(job)
+                job.follower = True
+                self._start(job)
+            if not jobs:
+                del self.queues[user]
+
+    def _dispatch(self):
+        self._start_followers()
+        while self.running < self.max_concurrent:
+            job = self._next_job()
+            if job is None:
+                return
+            self._start(job)
+            self._start_followers()
+
+    def _run(self, job):
+        # Hard timeout: the event kills every R process of the job, sharded or not
+        watchdog = threading.Timer(self.timeout, self._time_out, args=(job,))
+        watchdog.start()
+        try:
+            chunks = self.single_flight.stream(job.args, self.timeout, cancel_event=job.cancel_event, key=job.key)
+            for chunk in chunks:
+                job.chunks.append(chunk)
+            result = merge_shards(job.args, job.chunks)
+            state, error = DONE, None
+        except RWorkerCancelled:
+            result = None
+            state, error = (FAILED, f"Analysis exceeded the time limit of {self.timeout:g} seconds") \
+                if job.timed_out else (CANCELLED, None)
+        except RWorkerTimeout:
+            result, state, error = None, FAILED, f"Analysis exceeded the time limit of {self.timeout:g} seconds"
+        except (RAnalysisError, RWorkerError) as e:
+            result, state, error = None, FAILED, str(e)
+        except Exception as e:
+            logging.exception(f"Job {job.id} failed")
+            result, state, error = None, FAILED, str(e)
+        finally:
+            watchdog.cancel()
+
+        with self.lock:
+            # A job cancelled while finishing stays cancelled
+            if job.state == RUNNING:
+                job.state, job.result, job.error = state, result, error
+            jobs_total.inc(state=job.state)
+            job.finished_at = time.time()
+            if not job.follower:
+                self.running -= 1
+            self._dispatch()
+
+    def _time_out(self, job):
+        job.timed_out = True
+        job.cancel_event.set()
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.state in FINISHED_STATES:
+                return False
+            if job.state == QUEUED:
+                job.finished_at = time.time()
+                jobs_total.inc(state=CANCELLED)
+            job.state = CANCELLED
+            job.cancel_event.set()
+        return True
+
+    def queue_position(self, job):
+        # 1-based position in the order _next_job() will start the queued jobs
+        queues = [[queued for queued in jobs if queued.state == QUEUED] for jobs in self.queues.values()]
+        position = 0
+        for round_index in itertools.count():
+            if not any(round_index < len(jobs) for jobs in queues):
+                return None
+            for jobs in queues:
+                if round_index < len(jobs):
+                    position += 1
+                    if jobs[round_index] is job:
+                        return position
+
+    # Cancelled jobs stay in their user's queue until _next_job() reaches them; they are not counted
+    def _queue_depth(self):
+        return sum(1 for jobs in self.queues.values() for job in jobs if job.state == QUEUED)
+
+    def queue_depth(self):
+        with self.lock:
+            return self._queue_depth()
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            received = sum(len(chunk) for chunk in job.chunks)
+            return {
+                "id": job.id,
+                "state": job.state,
+                "queue_position": self.queue_position(job) if job.state == QUEUED else None,
+                "queue_length": self._queue_depth(),
+                "running": self.running,
+                "received_points": received,
+                "total_points": job.total_points,
+                "error": job.error,
+                "elapsed": (job.finished_at or time.time()) - (job.started_at or job.submitted_at),
+            }
+
+    # Function to get the partial results received so far, in grid order
+    def partial_result(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None or not job.chunks:
+            return None
+        return merge_shards(job.args, list(job.chunks))
+
+    def result(self, job_id):
+        job = self.jobs.get(job_id)
+        return job.result if job is not None and job.state == DONE else None
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+# Function to get the process-wide job scheduler
+def get_job_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = JobScheduler()
+            REGISTRY.callback("scpower_job_queue_depth", "Analysis jobs waiting for a slot",
+                              lambda: [({}, _scheduler.queue_depth())])
+            REGISTRY.callback("scpower_jobs_running", "Analysis jobs holding a slot",
+                              lambda: [({}, _scheduler.running)])
+        return _scheduler
@@ -0,0 +1,102 @@
+import atexit
+import hashlib
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+
+LOG_LEVEL = os.environ.get("SCPOWER_LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.environ.get("SCPOWER_LOG_FILE")
+LOG_FILE_BYTES = int(os.environ.get("SCPOWER_LOG_FILE_BYTES", str(10 * 1024 * 1024)))
+LOG_FILE_BACKUPS = int(os.environ.get("SCPOWER_LOG_FILE_BACKUPS", "3"))
+# Longer messages are cut and tagged with their length and hash
+LOG_MAX_MESSAGE = int(os.environ.get("SCPOWER_LOG_MAX_MESSAGE", "2000"))
+# Fraction of DEBUG records that are kept
+LOG_DEBUG_SAMPLE = float(os.environ.get("SCPOWER_LOG_DEBUG_SAMPLE", "1.0"))
+# Records are dropped rather than blocking the caller once this many are waiting
+LOG_QUEUE_SIZE = int(os.environ.get("SCPOWER_LOG_QUEUE_SIZE", "10000"))
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+# Function to describe a payload by its size and hash instead of its content
+def payload_summary(text):
+    data = text.encode('utf-8', errors='replace') if isinstance(text, str) else bytes(text)
+    return f"<{len(data)} bytes, sha256 {hashlib.sha256(data).hexdigest()[:12]}>"
+
+
+# Function to keep the start of a long text and summarize the rest
+def truncate(text, limit=LOG_MAX_MESSAGE):
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [truncated {payload_summary(text)}]"
+
+
+class DebugSampler(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+# Queue handler that formats nothing on the calling thread except the message
+# itself, caps its length and drops records when the queue is full
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue, max_message=LOG_MAX_MESSAGE):
+        super().__init__(log_queue)
+        self.max_message = max_message
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = truncate(record.getMessage(), self.max_message)
+        record.args = None
+        if record.exc_info:
+            # Tracebacks cannot cross the queue; render them here once
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+# Function to route all logging through a bounded queue to a background thread
+# that writes to stderr or a rotating SCPOWER_LOG_FILE. Safe to call repeatedly.
+def configure_logging(level=LOG_LEVEL, log_file=LOG_FILE, debug_sample=LOG_DEBUG_SAMPLE):
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+
+        if log_file:
+            target = logging.handlers.RotatingFileHandler(log_file, maxBytes=LOG_FILE_BYTES,
+                                                          backupCount=LOG_FILE_BACKUPS)
+        else:
+            target = logging.StreamHandler(sys.stderr)
+        target.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        handler = BoundedQueueHandler(log_queue)
+        handler.addFilter(DebugSampler(debug_sample))
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, target, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
@@ -0,0 +1,202 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.environ.get("SCPOWER_METRICS_PORT", "0"))
+METRICS_FILE = os.environ.get("SCPOWER_METRICS_FILE")
+METRICS_INTERVAL = float(os.environ.get("SCPOWER_METRICS_INTERVAL", "15"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000, 100000)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# Metrics are kept per label set; a label set is a sorted tuple of (name, value)
+# pairs so that recording only costs a dict lookup and an addition under a lock
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total) in self.values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    samples.append((f"{self.name}_bucket", key + (("le", str(bound)),), cumulative))
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, cumulative))
+        return samples
+
+
+# Gauge or counter whose samples are read from a callback at export time, for
+# values other modules already track (cache statistics, queue length, ...)
+class CallbackMetric:
+    def __init__(self, name, help_text, callback, metric_type="gauge"):
+        self.name = name
+        self.help = help_text
+        self.type = metric_type
+        self.callback = callback
+
+    def samples(self):
+        try:
+            return [(self.name, tuple(sorted(labels.items())), value) for labels, value in self.callback()]
+        except Exception as e:
+            logging.warning(f"Could not collect metric {self.name}: {e}")
+            return []
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric):
+        with self.lock:
+            # Modules may be re-imported by Streamlit; keep the first instance
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text):
+        return self._register(Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, buckets))
+
+    def callback(self, name, help_text, callback, metric_type="gauge"):
+        with self.lock:
+            metric = self.metrics[name] = CallbackMetric(name, help_text, callback, metric_type)
+        return metric
+
+    # Function to render every metric in the Prometheus text exposition format
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+stage_seconds = REGISTRY.histogram("scpower_stage_seconds", "Duration of one stage of the analysis path")
+analysis_seconds = REGISTRY.histogram("scpower_analysis_seconds", "End-to-end latency of an analysis request")
+result_rows = REGISTRY.histogram("scpower_result_rows", "Grid points in an analysis result", SIZE_BUCKETS)
+runs_total = REGISTRY.counter("scpower_r_runs_total", "Analyses computed by R")
+failures_total = REGISTRY.counter("scpower_r_failures_total", "Analyses that failed in R or timed out")
+requests_total = REGISTRY.counter("scpower_analysis_requests_total", "Analysis requests by where the result came from")
+jobs_total = REGISTRY.counter("scpower_jobs_total", "Finished analysis jobs by final state")
+
+
+# Context manager timing one stage of the analysis path
+@contextmanager
+def span(stage, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=stage, **labels)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to write the metrics file atomically every interval seconds
+def write_metrics_file(path, interval):
+    while True:
+        temp_path = f"{path}.tmp"
+        try:
+            with open(temp_path, 'w') as file:
+                file.write(REGISTRY.render())
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not write metrics file {path}: {e}")
+        time.sleep(interval)
+
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+# Function to start the configured exporters once per process: an HTTP endpoint
+# on SCPOWER_METRICS_PORT serving /metrics and/or a file rewritten periodically
+def start_exporters(port=METRICS_PORT, path=METRICS_FILE, interval=METRICS_INTERVAL):
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+
+    if port:
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+        except OSError as e:
+            logging.warning(f"Could not serve metrics on port {port}: {e}")
+        else:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            logging.info(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+    if path:
+        threading.Thread(target=write_metrics_file, args=(path, interval), daemon=True).start()
@@ -0,0 +1,267 @@
+import os
+
+import streamlit as st
+import plotly.graph_objects as go
+import plotly.subplots as sp
+import pandas as pd
+
+from analysis_result import as_frame
+
+# Above this many points per trace the figures switch from SVG to WebGL traces
+WEBGL_THRESHOLD = int(os.environ.get("SCPOWER_WEBGL_THRESHOLD", "5000"))
+
+DESIGN_COLUMNS = ['sampleSize', 'totalCells', 'readDepth']
+
+
+def scatter_class(n_points, webgl_threshold=WEBGL_THRESHOLD):
+    return go.Scattergl if n_points > webgl_threshold else go.Scatter
+
+
+# Function to get the hover columns as one customdata array, "N/A" for missing columns
+def hover_data(df, columns):
+    return pd.DataFrame({col: df[col] if col in df.columns else 'N/A' for col in columns}, index=df.index).to_numpy()
+
+
+def create_scatter_plot(data, x_axis, y_axis, size_axis, webgl_threshold=WEBGL_THRESHOLD):
+    data = as_frame(data)
+
+    # Convert columns to numeric once, replacing non-numeric values with NaN. The
+    # plotting frame is a new object, the shared result is never modified.
+    numeric_columns = list(dict.fromkeys([x_axis, y_axis, size_axis, 'Detection.power']))
+    hover_columns = [col for col in DESIGN_COLUMNS if col in data.columns and col not in numeric_columns]
+    df = data[numeric_columns].apply(pd.to_numeric, errors='coerce').join(data[hover_columns])
+
+    # Remove rows with NaN values
+    df = df.dropna(subset=numeric_columns)
+
+    if df.empty:
+        return None
+
+    # Calculate size reference
+    size_ref = 2 * df[size_axis].max() / (40**2)
+
+    fig = go.Figure(scatter_class(len(df), webgl_threshold)(
+        x=df[x_axis],
+        y=df[y_axis],
+        mode='markers',
+        marker=dict(
+            size=df[size_axis],
+            sizemode='area',
+            sizeref=size_ref,
+            sizemin=4,
+            color=df['Detection.power'],
+            colorscale='Viridis',
+            colorbar=dict(title="Detection power"),
+            showscale=True
+        ),
+        customdata=hover_data(df, DESIGN_COLUMNS + ['Detection.power']),
+        hovertemplate="Sample size: %{customdata[0]}<br>Cells per individuum: %{customdata[1]}<br>"
+                      "Read depth: %{customdata[2]}<br>Detection power: %{customdata[3]}<extra></extra>"
+    ))
+
+    fig.update_layout(
+        xaxis_title=x_axis,
+        yaxis_title=y_axis
+    )
+
+    return fig
+
+
+def create_influence_plot(data, parameter_vector, webgl_threshold=WEBGL_THRESHOLD):
+    df = as_frame(data)
+
+    selected_pair = parameter_vector[0]
+    study_type = parameter_vector[5]
+
+    # Set grid dependent on parameter choice
+    if selected_pair == "sc":
+        x_axis, x_axis_label = "sampleSize", "Sample size"
+        y_axis, y_axis_label = "totalCells", "Cells per sample"
+    elif selected_pair == "sr":
+        x_axis, x_axis_label = "sampleSize", "Sample size"
+        y_axis, y_axis_label = "readDepth", "Read depth"
+    else:
+        x_axis, x_axis_label = "totalCells", "Cells per sample"
+        y_axis, y_axis_label = "readDepth", "Read depth"
+
+    # Check if the required columns exist
+    required_columns = [x_axis, y_axis, 'sampleSize', 'totalCells', 'readDepth']
+    missing_columns = [col for col in required_columns if col not in df.columns]
+    if missing_columns:
+        st.error(f"Missing required columns: {', '.join(missing_columns)}")
+        return None
+
+    # Select study with the maximal values
+    power_column = next((col for col in df.columns if 'power' in col.lower()), None)
+    if not power_column:
+        st.error("No power column found in the data.")
+        return None
+
+    # Identify the columns for plotting
+    plot_columns = [col for col in df.columns if any(keyword in col.lower() for keyword in ['power', 'probability', 'prob'])]
+    if not plot_columns:
+        st.error("No suitable columns found for plotting.")
+        return None
+
+    numeric_columns = list(dict.fromkeys(DESIGN_COLUMNS + plot_columns))
+    df = df[numeric_columns].apply(pd.to_numeric, errors='coerce')
+    max_study = df.loc[df[power_column].idxmax()]
+
+    # Create subplots
+    fig = sp.make_subplots(rows=1, cols=2, shared_yaxes=True)
+
+    # Plot cells per person (left) and read depth (right); the hover text of every
+    # trace reads the design from customdata and the plotted value from y
+    df_plot1 = df[df[y_axis] == max_study[y_axis]]
+    df_plot2 = df[df[x_axis] == max_study[x_axis]]
+    for subplot, (df_plot, x_column) in enumerate([(df_plot1, x_axis), (df_plot2, y_axis)], start=1):
+        trace_class = scatter_class(len(df_plot), webgl_threshold)
+        customdata = df_plot[DESIGN_COLUMNS].to_numpy()
+        for col in plot_columns:
+            fig.add_trace(
+                trace_class(
+                    x=df_plot[x_column], y=df_plot[col],
+                    mode='lines+markers', name=col, showlegend=subplot == 1,
+                    customdata=customdata,
+                    hovertemplate="Sample size: %{customdata[0]}<br>Cells per individuum: %{customdata[1]}<br>"
+                                  f"Read depth: %{{customdata[2]}}<br>{col}: %{{y:.3f}}<extra></extra>"
+                ),
+                row=1, col=subplot
+            )
+
+    # Update layout
+    fig.update_layout(
+        xaxis_title=x_axis_label,
+        xaxis2_title=y_axis_label,
+        yaxis_title="Probability",
+        legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='right', x=1)
+    )
+
+    # Add vertical lines
+    fig.add_vline(x=max_study[x_axis], line_dash="dot", row=1, col=1)
+    fig.add_vline(x=max_study[y_axis], line_dash="dot", row=1, col=2)
+
+    return fig
+
+
+# Function to plot the probes of a target power search: detection power over the
+# searched dimension, with the target as a horizontal line and the answer marked
+def create_target_power_plot(solution):
+    trajectory = pd.DataFrame(solution["trajectory"])
+    if trajectory.empty:
+        return None
+    dimension = solution["dimension"]
+    curve = trajectory.sort_values(dimension)
+
+    fig = go.Figure(go.Scatter(
+        x=curve[dimension],
+        y=curve['Detection.power'],
+        mode='lines+markers',
+        marker=dict(color=curve['round'], colorscale='Viridis', colorbar=dict(title="Round"), size=9),
+        customdata=curve[['round', 'source']].to_numpy(),
+        hovertemplate=f"{dimension}: %{{x}}<br>Detection power: %{{y:.3f}}<br>"
+                      "Round: %{customdata[0]} (%{customdata[1]})<extra></extra>"
+    ))
+    fig.add_hline(y=solution["target"], line_dash="dot")
+    if solution["value"] is not None:
+        fig.add_vline(x=solution["value"], line_dash="dash")
+
+    fig.update_layout(
+        xaxis_title=dimension,
+        yaxis_title="Detection power"
+    )
+
+    return fig
+
+
+# Function to plot the best detection power over the first grid range for many cell
+# types at once. WebGL traces keep the figure responsive with dozens of them.
+def create_celltype_comparison_plot(curves, x_column):
+    curves = {celltype: curve for celltype, curve in curves.items() if curve is not None and len(curve)}
+    if not curves:
+        return None
+
+    fig = go.Figure()
+    for celltype, curve in curves.items():
+        fig.add_trace(go.Scattergl(
+            x=curve[x_column],
+            y=curve['Detection.power'],
+            mode='lines+markers',
+            name=celltype,
+            hovertemplate=f"{celltype}<br>{x_column}: %{{x}}<br>Detection power: %{{y:.3f}}<extra></extra>"
+        ))
+
+    fig.update_layout(
+        xaxis_title=x_column,
+        yaxis_title="Best detection power",
+        showlegend=len(curves) <= 20,
+        hovermode='closest'
+    )
+
+    return fig
+
+
+# Function to plot the best detection power of a sensitivity sweep as a heatmap: over
+# both swept parameters, or over the swept parameter and the first grid range when
+# only one parameter is swept
+def create_sensitivity_heatmap(result):
+    sensitivity = result.metadata["sensitivity"]
+    params, grid = sensitivity["params"], sensitivity["grid"]
+    if not len(result):
+        return None
+    x_column, y_column = (params[0], params[1]) if len(params) == 2 else (params[0], grid[0])
+    surface = result.frame.groupby([y_column, x_column])['Detection.power'].max().unstack(x_column)
+
+    fig = go.Figure(go.Heatmap(
+        x=[str(value) for value in surface.columns],
+        y=[str(value) for value in surface.index],
+        z=surface.to_numpy(),
+        zmin=0, zmax=1,
+        colorscale='Viridis',
+        colorbar=dict(title="Best power"),
+        hovertemplate=f"{x_column}: %{{x}}<br>{y_column}: %{{y}}<br>Best detection power: %{{z:.3f}}<extra></extra>"
+    ))
+    fig.update_layout(
+        xaxis_title=x_column,
+        yaxis_title=y_column
+    )
+
+    return fig
+
+
+# Function to plot the design grid of a sensitivity sweep as small multiples: one
+# detection power heatmap per value of the first swept parameter, with the second
+# swept parameter (if any) held at `fixed`. All panels share one color scale.
+def create_sensitivity_small_multiples(result, fixed=None, columns=4):
+    sensitivity = result.metadata["sensitivity"]
+    params, (x_column, y_column) = sensitivity["params"], sensitivity["grid"]
+    frame = result.frame
+    if len(params) == 2:
+        frame = frame[frame[params[1]] == fixed]
+    if frame.empty:
+        return None
+
+    panels = list(frame.groupby(params[0], sort=True))
+    rows = (len(panels) + columns - 1) // columns
+    fig = sp.make_subplots(rows=rows, cols=min(columns, len(panels)), shared_xaxes=True, shared_yaxes=True,
+                           subplot_titles=[f"{params[0]} = {value:g}" for value, _ in panels],
+                           horizontal_spacing=0.03, vertical_spacing=0.12 / max(rows, 1))
+    for i, (value, panel) in enumerate(panels):
+        surface = panel.pivot_table(index=y_column, columns=x_column, values='Detection.power', aggfunc='max')
+        fig.add_trace(go.Heatmap(
+            x=[str(column) for column in surface.columns],
+            y=[str(index) for index in surface.index],
+            z=surface.to_numpy(),
+            coloraxis="coloraxis",
+            hovertemplate=f"{params[0]} = {value:g}<br>{x_column}: %{{x}}<br>{y_column}: %{{y}}<br>"
+                          "Detection power: %{z:.3f}<extra></extra>"
+        ), row=i // columns + 1, col=i % columns + 1)
+
+    fig.update_layout(
+        coloraxis=dict(colorscale='Viridis', cmin=0, cmax=1, colorbar=dict(title="Detection power")),
+        height=max(300, 260 * rows)
+    )
+    fig.update_xaxes(title_text=x_column, row=rows)
+    fig.update_yaxes(title_text=y_column, col=1)
+
+    return fig
@@ -0,0 +1,177 @@
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from analysis_args import RANGE_ARGS
+from analysis_result import AnalysisResult
+from grid_sharding import RANGE_COLUMNS, grid_ranges
+from metrics import REGISTRY
+from result_cache import CACHE_DIR, args_hash, canonicalize
+
+# SQLite file holding one result row per grid point; "off" disables the store
+POINT_STORE = os.environ.get("SCPOWER_POINT_STORE", os.path.join(CACHE_DIR, "points.sqlite"))
+POINT_STORE_ROWS = int(os.environ.get("SCPOWER_POINT_STORE_ROWS", "1000000"))
+# Lattice step multipliers used by snap_to_lattice(), per power of ten
+LATTICE_STEPS = (1, 2, 2.5, 5)
+
+
+# Function to get the key of everything in args except the grid: points with equal
+# fixed parameters and coordinates have equal results, whatever grid they came from
+def family_key(args):
+    (x_key, _), (y_key, _) = grid_ranges(args)
+    fixed = {key: value for key, value in args.items() if key not in RANGE_ARGS}
+    return args_hash(dict(fixed, grid=[x_key, y_key]))
+
+
+def coordinate(value):
+    return json.dumps(canonicalize(value))
+
+
+# Function to get a "nice" step (1, 2, 2.5 or 5 times a power of ten) close to `raw`
+def lattice_step(raw):
+    if raw <= 1:
+        return 1
+    magnitude = 10 ** math.floor(math.log10(raw))
+    return min((multiplier * magnitude for multiplier in LATTICE_STEPS + (10,)),
+               key=lambda step: abs(math.log(step / raw)))
+
+
+# Function to build about `steps` grid values between lo and hi on a global lattice:
+# multiples of a nice step, so that widening a range or changing the number of steps
+# mostly lands on values that were evaluated before
+def snap_to_lattice(lo, hi, steps):
+    lo, hi = min(lo, hi), max(lo, hi)
+    if steps <= 1 or hi == lo:
+        return np.unique(np.round([lo, hi][:max(steps, 1)])).astype(int)
+    step = lattice_step((hi - lo) / (steps - 1))
+    first = math.ceil(lo / step) * step
+    if first > hi:
+        return np.unique(np.round([lo, hi])).astype(int)
+    values = first + step * np.arange(int((hi - first) // step) + 1)
+    return np.unique(np.round(values)).astype(int)
+
+
+# Store of single grid point results in SQLite. Points that R returned no row for
+# (e.g. a design over budget) are stored as such, so they are not asked for again.
+class PointStore:
+    def __init__(self, path=POINT_STORE, max_rows=POINT_STORE_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self.lock = threading.Lock()
+        self.reused = 0
+        self.computed = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # One connection shared by the threads of this process; WAL lets the batch CLI
+        # and the app use the same file
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS points (family TEXT, x TEXT, y TEXT, row TEXT, stored_at REAL, "
+                "PRIMARY KEY (family, x, y))")
+            # Probes of the target power solver (see target_power.py): the best power and
+            # design of one grid at one value of the searched dimension
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS probes (search TEXT, value REAL, power REAL, design TEXT, stored_at REAL, "
+                "PRIMARY KEY (search, value))")
+
+    # Function to split the grid of args into the stored result rows and the (x, y)
+    # points that still have to be computed
+    def lookup(self, args):
+        (_, x_values), (_, y_values) = grid_ranges(args)
+        family = family_key(args)
+        with self.lock:
+            stored = dict(((x, y), row) for x, y, row in self.connection.execute(
+                "SELECT x, y, row FROM points WHERE family = ?", (family,)))
+
+        rows, missing = [], []
+        for y in y_values:
+            for x in x_values:
+                point = (coordinate(x), coordinate(y))
+                if point in stored:
+                    if stored[point] is not None:
+                        rows.append(json.loads(stored[point]))
+                else:
+                    missing.append((x, y))
+        with self.lock:
+            self.reused += len(x_values) * len(y_values) - len(missing)
+        return AnalysisResult.from_records(rows), missing
+
+    # Function to store the rows of a computed result, one per grid point of args
+    def put(self, args, result):
+        (x_key, x_values), (y_key, y_values) = grid_ranges(args)
+        x_column, y_column = RANGE_COLUMNS[x_key], RANGE_COLUMNS[y_key]
+        family = family_key(args)
+        now = time.time()
+        entries = {(coordinate(x), coordinate(y)): None for y in y_values for x in x_values}
+        for row in result.to_records():
+            point = (coordinate(row[x_column]), coordinate(row[y_column]))
+            if point in entries:
+                entries[point] = json.dumps(row)
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO points (family, x, y, row, stored_at) VALUES (?, ?, ?, ?, ?)",
+                [(family, x, y, row, now) for (x, y), row in entries.items()])
+            self.computed += len(entries)
+            self._evict()
+
+    def _evict(self):
+        excess = self.connection.execute("SELECT COUNT(*) FROM points").fetchone()[0] - self.max_rows
+        if excess > 0:
+            self.connection.execute("DELETE FROM points WHERE rowid IN "
+                                    "(SELECT rowid FROM points ORDER BY stored_at LIMIT ?)", (excess,))
+
+    # Function to get the probes stored for a search as {value: (power, design)}
+    def probes(self, search):
+        with self.lock:
+            rows = self.connection.execute("SELECT value, power, design FROM probes WHERE search = ?",
+                                           (search,)).fetchall()
+        return {int(value) if float(value).is_integer() else value: (power, json.loads(design) if design else None)
+                for value, power, design in rows}
+
+    def put_probe(self, search, value, power, design):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO probes (search, value, power, design, stored_at) VALUES (?, ?, ?, ?, ?)",
+                (search, value, power, json.dumps(design) if design is not None else None, time.time()))
+
+    def invalidate(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM points")
+            self.connection.execute("DELETE FROM probes")
+
+    def stats(self):
+        with self.lock:
+            return {"reused": self.reused, "computed": self.computed}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# Function to get the process-wide point store, or None when SCPOWER_POINT_STORE=off
+def get_point_store():
+    global _store
+    if POINT_STORE == "off":
+        return None
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = PointStore()
+            except sqlite3.Error as e:
+                logging.error(f"Could not open the grid point store {POINT_STORE}: {e}")
+                return None
+            REGISTRY.callback("scpower_grid_points_total", "Grid points by whether they were reused or computed",
+                              grid_points, "counter")
+        return _store
+
+
+def grid_points():
+    stats = get_point_store().stats()
+    return [({"outcome": "reused"}, stats["reused"]), ({"outcome": "computed"}, stats["computed"])]
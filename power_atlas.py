@@ -0,0 +1,122 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pyarrow as pa
+
+from analysis_args import DEFAULT_ARGS
+from analysis_result import AnalysisResult
+from logging_setup import configure_logging
+from reference_data import reference_celltypes, reference_studies
+from result_cache import args_hash
+
+ATLAS_DIR = os.environ.get("SCPOWER_ATLAS_DIR", "power_atlas")
+STUDY_TYPES = ["de", "eqtl"]
+
+
+# Function to list the cell types and reference studies the atlas sweeps over
+def atlas_dimensions():
+    return reference_celltypes(), reference_studies()
+
+
+def standard_args(celltype, ref_study, study_type):
+    return dict(DEFAULT_ARGS, **{"ct": celltype, "ref.study.name": ref_study, "type": study_type})
+
+
+def atlas_path(key, directory=ATLAS_DIR):
+    return os.path.join(directory, key[:2], f"{key}.arrow")
+
+
+# Function to serve an exact match from the atlas; returns None when the args are not covered
+def lookup_atlas(key, directory=ATLAS_DIR):
+    path = atlas_path(key, directory)
+    if not os.path.exists(path):
+        return None
+    # Uncompressed Arrow IPC files are memory-mapped instead of read
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all()
+    return AnalysisResult.from_arrow(table)
+
+
+def write_atlas_entry(key, result, directory=ATLAS_DIR):
+    path = atlas_path(key, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(result.frame, preserve_index=False)
+    temp_path = f"{path}.tmp"
+    with pa.OSFile(temp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    # Entries appear atomically, so an interrupted build can simply be resumed
+    os.replace(temp_path, path)
+
+
+# Function to compute every cell type x reference study x study type on the standard grid.
+# Entries that already exist are skipped, which makes the build resumable.
+def build_atlas(directory=ATLAS_DIR, workers=None, study_types=STUDY_TYPES, limit=None):
+    from power_engine import compute_grid
+    from r_worker_pool import POOL_SIZE, RAnalysisError, RWorkerError
+
+    celltypes, ref_studies = atlas_dimensions()
+    jobs = []
+    for study_type in study_types:
+        for ref_study in ref_studies:
+            for celltype in celltypes:
+                args = standard_args(celltype, ref_study, study_type)
+                key = args_hash(args)
+                if not os.path.exists(atlas_path(key, directory)):
+                    jobs.append((key, args))
+    if limit is not None:
+        jobs = jobs[:limit]
+    logging.info(f"Power atlas: {len(jobs)} entries to compute in {directory}")
+
+    os.makedirs(directory, exist_ok=True)
+    manifest_lock = threading.Lock()
+
+    def build_entry(key, args):
+        result = compute_grid(args)
+        write_atlas_entry(key, result, directory)
+        with manifest_lock, open(os.path.join(directory, 'manifest.jsonl'), 'a') as manifest:
+            manifest.write(json.dumps({"key": key, "ct": args["ct"], "ref.study.name": args["ref.study.name"],
+                                       "type": args["type"], "rows": len(result)}) + "\n")
+
+    start = time.monotonic()
+    done = failed = 0
+    with ThreadPoolExecutor(max_workers=workers or max(POOL_SIZE, 1)) as executor:
+        futures = {executor.submit(build_entry, key, args): args for key, args in jobs}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                done += 1
+            except (RAnalysisError, RWorkerError) as e:
+                args = futures[future]
+                logging.error(f"Power atlas: {args['type']} / {args['ref.study.name']} / {args['ct']} failed: {e}")
+                failed += 1
+            if (done + failed) % 100 == 0:
+                logging.info(f"Power atlas: {done + failed} of {len(jobs)} entries processed")
+
+    elapsed = time.monotonic() - start
+    logging.info(f"Power atlas: {done} entries written, {failed} failed in {elapsed:.1f} s")
+    return done, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the power atlas for all cell types and reference studies.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help="Compute missing atlas entries (resumable)")
+    build.add_argument('--out', default=ATLAS_DIR, help="Atlas directory")
+    build.add_argument('--workers', type=int, default=None, help="Number of entries computed in parallel")
+    build.add_argument('--study-type', action='append', choices=STUDY_TYPES, help="Restrict to one study type")
+    build.add_argument('--limit', type=int, default=None, help="Compute at most this many entries")
+    options = parser.parse_args()
+
+    configure_logging()
+    if options.command == 'build':
+        build_atlas(options.out, options.workers, options.study_type or STUDY_TYPES, options.limit)
+
+
+if __name__ == "__main__":
+    main()
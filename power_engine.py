@@ -0,0 +1,317 @@
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import pyarrow as pa
+
+from analysis_args import POWER_STAGE_ARGS, RANGE_ARGS
+from analysis_result import AnalysisResult, compact_frame, integral_floats_to_int
+from r_worker_pool import (CANCEL_POLL_INTERVAL, POOL_SIZE, RSCRIPT, REQUEST_TIMEOUT, RAnalysisError,
+                           RWorkerCancelled, RWorkerTimeout, get_worker_pool, kill_process_tree)
+from result_cache import args_hash, get_result_cache
+from power_atlas import lookup_atlas
+from grid_sharding import (SHARD_SIZE, grid_ranges, grid_size, merge_shards, point_batches, run_sharded,
+                           stream_batches, stream_sharded)
+from point_store import get_point_store
+from logging_setup import payload_summary
+from metrics import analysis_seconds, failures_total, requests_total, result_rows, runs_total, span
+
+COLLECTOR_SCRIPT = "scpower_collector.R"
+# "arrow" offers R a columnar Arrow IPC file for the result, "json" always uses JSON text
+TRANSPORT = os.environ.get("SCPOWER_TRANSPORT", "arrow")
+# Shared memory keeps the transport file off the disk where available
+TRANSPORT_DIR = os.environ.get("SCPOWER_TRANSPORT_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else None)
+
+
+# Kills a collector process tree once its timeout passes or its request is cancelled
+class ProcessWatchdog:
+    def __init__(self, process, timeout, cancel_event=None):
+        self.process = process
+        self.timeout = timeout
+        self.cancel_event = cancel_event
+        self.reason = None
+        self.stopped = threading.Event()
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def _watch(self):
+        deadline = time.monotonic() + self.timeout
+        while not self.stopped.wait(CANCEL_POLL_INTERVAL):
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                self.reason = "cancelled"
+            elif time.monotonic() >= deadline:
+                self.reason = "timeout"
+            else:
+                continue
+            kill_process_tree(self.process)
+            return
+
+    def stop(self):
+        self.stopped.set()
+
+    def raise_if_fired(self):
+        if self.reason == "timeout":
+            raise RWorkerTimeout(f"Rscript did not finish within {self.timeout:g} seconds")
+        if self.reason == "cancelled":
+            raise RWorkerCancelled("Rscript run was cancelled")
+
+
+# Context manager counting one R computation and its failures and timing it as the r_run stage
+@contextmanager
+def measure_r_run(backend):
+    runs_total.inc(backend=backend)
+    try:
+        with span("r_run", backend=backend):
+            yield
+    except Exception as e:
+        failures_total.inc(backend=backend, reason=type(e).__name__)
+        raise
+
+
+# Function to read a result R wrote to an Arrow transport file, None if R answered in JSON
+def read_arrow_result(path):
+    if os.path.getsize(path) == 0:
+        return None
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all()
+    return AnalysisResult(compact_frame(integral_floats_to_int(table.to_pandas())))
+
+
+# Context manager offering R the Arrow transport through the args: yields the
+# args to send and a function returning the transported result or None. R falls
+# back to JSON when the arrow package is not installed.
+@contextmanager
+def result_transport(args):
+    if TRANSPORT != "arrow":
+        yield args, lambda: None
+        return
+    fd, path = tempfile.mkstemp(suffix='.arrow', dir=TRANSPORT_DIR)
+    os.close(fd)
+    try:
+        yield dict(args, transport="arrow", transportPath=path), lambda: read_arrow_result(path)
+    finally:
+        os.unlink(path)
+
+
+def start_collector(args):
+    with span("write_temp_file"):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as temp_file:
+            json.dump(args, temp_file)
+            temp_file_path = temp_file.name
+    with span("spawn"):
+        process = subprocess.Popen([RSCRIPT, COLLECTOR_SCRIPT, temp_file_path], stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, text=True, start_new_session=True)
+    return process, temp_file_path
+
+
+# Function to run one analysis in a fresh Rscript process (used when the worker pool is disabled)
+def run_collector(args, timeout=REQUEST_TIMEOUT, cancel_event=None):
+    with result_transport(args) as (transport_args, read_transported):
+        with measure_r_run("collector"):
+            process, temp_file_path = start_collector(transport_args)
+            watchdog = ProcessWatchdog(process, timeout, cancel_event)
+            try:
+                stdout, stderr = process.communicate()
+            finally:
+                watchdog.stop()
+                # Remove the temporary file
+                os.unlink(temp_file_path)
+            watchdog.raise_if_fired()
+
+            # The output can be megabytes for large grids; only its size and hash are logged
+            logging.debug("R script stdout: %s", payload_summary(stdout))
+            if stderr:
+                logging.error("R script stderr: %s", stderr)
+
+            if process.returncode != 0:
+                raise RAnalysisError(stdout.strip() or f"Rscript exited with status {process.returncode}")
+
+        with span("parse"):
+            result = read_transported()
+            return result if result is not None else AnalysisResult.from_json(stdout)
+
+
+# Function to read a pipe to its end in a background thread, so that a process filling
+# it cannot block; returns a function waiting for and returning the text read
+def drain_pipe(pipe):
+    chunks = []
+    thread = threading.Thread(target=lambda: chunks.append(pipe.read()), daemon=True)
+    thread.start()
+
+    def read():
+        thread.join()
+        return "".join(chunks)
+    return read
+
+
+# Generator yielding one-row results from a fresh Rscript process that streams NDJSON
+def stream_collector(args, timeout=REQUEST_TIMEOUT, cancel_event=None):
+    with measure_r_run("collector"):
+        process, temp_file_path = start_collector(dict(args, streamResults=True))
+        watchdog = ProcessWatchdog(process, timeout, cancel_event)
+        # Warnings of scPower and package loads can fill the stderr pipe while stdout is read
+        read_stderr = drain_pipe(process.stderr)
+        try:
+            messages = []
+            for line in process.stdout:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Error messages from the collector are plain text
+                    logging.error("R script stdout: %s", line.rstrip())
+                    messages.append(line.strip())
+                    continue
+                yield AnalysisResult.from_records([record])
+            stderr = read_stderr()
+            if stderr:
+                logging.error("R script stderr: %s", stderr)
+            if process.wait() != 0:
+                watchdog.raise_if_fired()
+                # The same message run_collector() reports
+                raise RAnalysisError("\n".join(message for message in messages if message) or
+                                     f"Rscript exited with status {process.returncode}")
+        finally:
+            watchdog.stop()
+            if process.poll() is None:
+                kill_process_tree(process)
+            os.unlink(temp_file_path)
+
+
+# Function to get the key R workers are picked by: analyses that differ only in the
+# power stage settings or the grid (shards, adaptive levels, axis tweaks) go to the
+# worker whose memoized design and expression stages they can reuse
+def stage_affinity_key(args):
+    excluded = set(POWER_STAGE_ARGS) | set(RANGE_ARGS)
+    return args_hash({key: value for key, value in args.items() if key not in excluded})
+
+
+# Function to compute one analysis, on the warm worker pool unless SCPOWER_POOL_SIZE=0
+def compute_power_study(args, timeout=None, cancel_event=None):
+    if POOL_SIZE > 0:
+        with result_transport(args) as (transport_args, read_transported):
+            with measure_r_run("pool"):
+                records = get_worker_pool().run(transport_args, timeout, cancel_event,
+                                                affinity=stage_affinity_key(args))
+            with span("parse"):
+                result = read_transported()
+                return result if result is not None else AnalysisResult.from_records(records)
+    return run_collector(args, timeout or REQUEST_TIMEOUT, cancel_event)
+
+
+# Function to compute a whole grid, sharded across the workers when it is large
+def compute_grid(args, timeout=None, cancel_event=None):
+    if grid_size(args) <= SHARD_SIZE:
+        return compute_power_study(args, timeout, cancel_event)
+    return run_sharded(args, lambda shard: compute_power_study(shard, timeout, cancel_event))
+
+
+# Generator yielding partial results of one grid as soon as they are computed
+def stream_grid(args, timeout=None, cancel_event=None):
+    if grid_size(args) > SHARD_SIZE:
+        yield from stream_sharded(args, lambda shard: compute_power_study(shard, timeout, cancel_event))
+    elif POOL_SIZE > 0:
+        with measure_r_run("pool"):
+            for records in get_worker_pool().stream(args, timeout, cancel_event,
+                                                    affinity=stage_affinity_key(args)):
+                with span("parse"):
+                    chunk = AnalysisResult.from_records(records)
+                yield chunk
+    else:
+        yield from stream_collector(args, timeout or REQUEST_TIMEOUT, cancel_event)
+
+
+# Generator yielding the stored points of a grid first, then the missing points as they
+# are computed, in rectangular batches. Computed points are added to the point store,
+# so that a rerun with a wider range or more steps only computes the new points.
+def stream_incremental(args, timeout=None, cancel_event=None):
+    store = get_point_store()
+    if store is None or len(grid_ranges(args)) != 2:
+        yield from stream_grid(args, timeout, cancel_event)
+        return
+
+    stored, missing = store.lookup(args)
+    if len(stored):
+        yield stored
+    batches = point_batches(args, missing)
+    if len(batches) == 1:
+        chunks = []
+        for chunk in stream_grid(batches[0], timeout, cancel_event):
+            chunks.append(chunk)
+            yield chunk
+        store.put(batches[0], AnalysisResult.concat(chunks))
+    else:
+        for batch, result in stream_batches(batches, lambda batch: compute_grid(batch, timeout, cancel_event)):
+            store.put(batch, result)
+            yield result
+
+
+# Function to compute a grid from the stored points and the missing ones
+def compute_incremental(args, timeout=None, cancel_event=None):
+    return merge_shards(args, list(stream_incremental(args, timeout, cancel_event)))
+
+
+# Function to look a result up in the precomputed power atlas first, then in the result cache
+def find_stored_result(key):
+    with span("lookup"):
+        result = lookup_atlas(key)
+        if result is not None:
+            requests_total.inc(source="atlas")
+            return result
+        result = get_result_cache().get(key)
+    if result is not None:
+        requests_total.inc(source="cache")
+    return result
+
+
+# Function to record the latency and size of one analysis request
+def observe_analysis(started, result):
+    analysis_seconds.observe(time.perf_counter() - started)
+    result_rows.observe(len(result))
+
+
+# Function to run one analysis, serving repeated parameter sets from the atlas or the result cache.
+# Stored results are shared between sessions and must not be modified.
+def run_power_study(args, timeout=None, use_cache=True, cancel_event=None):
+    started = time.perf_counter()
+    if not use_cache:
+        result = compute_grid(args, timeout, cancel_event)
+        requests_total.inc(source="computed")
+        observe_analysis(started, result)
+        return result
+
+    key = args_hash(args)
+    result = find_stored_result(key)
+    if result is None:
+        result = compute_incremental(args, timeout, cancel_event)
+        requests_total.inc(source="computed")
+        get_result_cache().put(key, result)
+    observe_analysis(started, result)
+    return result
+
+
+# Generator version of run_power_study yielding partial AnalysisResults as they arrive.
+# The chunks come in completion order; merge_shards(args, chunks) restores the row order.
+def stream_power_study(args, timeout=None, use_cache=True, cancel_event=None):
+    started = time.perf_counter()
+    key = args_hash(args) if use_cache else None
+    if use_cache:
+        result = find_stored_result(key)
+        if result is not None:
+            observe_analysis(started, result)
+            yield result
+            return
+
+    chunks = []
+    for chunk in (stream_incremental if use_cache else stream_grid)(args, timeout, cancel_event):
+        chunks.append(chunk)
+        yield chunk
+
+    requests_total.inc(source="computed")
+    result = merge_shards(args, chunks)
+    observe_analysis(started, result)
+    if use_cache:
+        get_result_cache().put(key, result)
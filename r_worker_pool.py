@@ -0,0 +1,347 @@
+import atexit
+import itertools
+from collections import OrderedDict
+import json
+import logging
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+
+from metrics import REGISTRY
+
+RSCRIPT = os.environ.get("SCPOWER_RSCRIPT", "Rscript")
+WORKER_SCRIPT = "scpower_worker.R"
+# One warm R worker per core by default
+POOL_SIZE = int(os.environ.get("SCPOWER_POOL_SIZE", str(os.cpu_count() or 2)))
+REQUEST_TIMEOUT = float(os.environ.get("SCPOWER_REQUEST_TIMEOUT", "600"))
+STARTUP_TIMEOUT = float(os.environ.get("SCPOWER_STARTUP_TIMEOUT", "120"))
+HEALTH_CHECK_INTERVAL = float(os.environ.get("SCPOWER_HEALTH_CHECK_INTERVAL", "30"))
+PING_TIMEOUT = 5
+# Number of affinity keys remembered by the pool
+AFFINITY_KEYS = 4096
+CANCEL_POLL_INTERVAL = 0.2
+
+# Every protocol line written by scpower_worker.R starts with this prefix
+PROTOCOL_PREFIX = "@@scpower "
+
+
+class RWorkerError(RuntimeError):
+    """The R worker process crashed, timed out or could not be started."""
+
+
+class RWorkerTimeout(RWorkerError):
+    """The R worker did not answer within the allowed time."""
+
+
+class RWorkerCancelled(RWorkerError):
+    """The request was cancelled and the worker running it was killed."""
+
+
+class RAnalysisError(RuntimeError):
+    """scPower raised an error for the given parameters; the worker is still usable."""
+
+
+# Function to kill a process started with start_new_session=True together with its children
+def kill_process_tree(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+class RWorker:
+    def __init__(self, script=WORKER_SCRIPT):
+        self.script = script
+        self.process = None
+        self.messages = None
+        self.request_ids = itertools.count(1)
+        self.scpower_version = None
+        # scPower functions the worker memoized, see memoize_stages() in scpower_engine.R
+        self.memoized_stages = []
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process else None
+
+    def start(self, timeout=STARTUP_TIMEOUT):
+        self.messages = queue.Queue()
+        # A new session makes the worker the leader of its own process group,
+        # so kill() also takes down anything R spawned itself
+        self.process = subprocess.Popen(
+            [RSCRIPT, self.script],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            start_new_session=True,
+        )
+        threading.Thread(target=self._read_stdout, args=(self.process, self.messages), daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(self.process,), daemon=True).start()
+
+        reply = self._wait_for_reply(None, timeout)
+        self.scpower_version = reply.get("scpower_version")
+        self.memoized_stages = reply.get("memoized_stages") or []
+        logging.info(f"R worker {self.pid} ready (scPower {self.scpower_version}, "
+                     f"{len(self.memoized_stages)} memoized stage functions)")
+        if reply.get("missing_stages"):
+            logging.warning(f"R worker {self.pid}: scPower {self.scpower_version} has no function "
+                            f"{', '.join(reply['missing_stages'])}; these stages are not memoized")
+
+    def _read_stdout(self, process, messages):
+        for line in process.stdout:
+            if line.startswith(PROTOCOL_PREFIX):
+                try:
+                    messages.put(json.loads(line[len(PROTOCOL_PREFIX):]))
+                except json.JSONDecodeError:
+                    logging.error(f"R worker {process.pid} sent a malformed reply")
+            else:
+                logging.debug("R worker %d stdout: %s", process.pid, line.rstrip())
+        # End of stream: the worker has exited
+        messages.put(None)
+
+    def _read_stderr(self, process):
+        for line in process.stderr:
+            logging.debug("R worker %d stderr: %s", process.pid, line.rstrip())
+
+    def _wait_for_reply(self, request_id, timeout, cancel_event=None):
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.kill()
+                raise RWorkerTimeout(f"R worker {self.pid} did not answer within {timeout:g} seconds")
+            if cancel_event is not None and cancel_event.is_set():
+                self.kill()
+                raise RWorkerCancelled(f"Request to R worker {self.pid} was cancelled")
+            try:
+                # Wake up regularly to notice cancellation
+                reply = self.messages.get(timeout=min(remaining, CANCEL_POLL_INTERVAL))
+            except queue.Empty:
+                continue
+            if reply is None:
+                raise RWorkerError(f"R worker {self.pid} exited with status {self.process.wait()}")
+            # Skip replies that belong to an earlier, abandoned request
+            if reply.get("id") != request_id:
+                continue
+            if reply.get("status") == "error":
+                raise RAnalysisError(reply.get("message", "Unknown error in R worker"))
+            return reply
+
+    def _send(self, message):
+        request_id = next(self.request_ids)
+        try:
+            self.process.stdin.write(json.dumps(dict(message, id=request_id)) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise RWorkerError(f"Could not send request to R worker {self.pid}: {e}")
+        return request_id
+
+    def request(self, message, timeout=REQUEST_TIMEOUT, cancel_event=None):
+        return self._wait_for_reply(self._send(message), timeout, cancel_event)
+
+    # Generator yielding the "partial" replies of a streaming request until its final reply
+    def request_stream(self, message, timeout=REQUEST_TIMEOUT, cancel_event=None):
+        request_id = self._send(message)
+        deadline = time.monotonic() + timeout
+        while True:
+            reply = self._wait_for_reply(request_id, deadline - time.monotonic(), cancel_event)
+            if reply.get("status") != "partial":
+                return
+            yield reply
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def ping(self, timeout=PING_TIMEOUT):
+        if not self.is_alive():
+            return False
+        try:
+            self.request({"cmd": "ping"}, timeout)
+        except (RWorkerError, RAnalysisError):
+            return False
+        return True
+
+    def kill(self):
+        if self.is_alive():
+            kill_process_tree(self.process)
+
+    def stop(self, timeout=5):
+        if not self.is_alive():
+            return
+        try:
+            self.process.stdin.write(json.dumps({"cmd": "quit"}) + "\n")
+            self.process.stdin.flush()
+            self.process.wait(timeout)
+        except (BrokenPipeError, OSError, subprocess.TimeoutExpired):
+            self.kill()
+
+
+class RWorkerPool:
+    def __init__(self, size=POOL_SIZE, request_timeout=REQUEST_TIMEOUT,
+                 health_check_interval=HEALTH_CHECK_INTERVAL):
+        self.size = size
+        self.request_timeout = request_timeout
+        self.idle = queue.Queue()
+        self.workers = [RWorker() for _ in range(size)]
+        self.failed = set()
+        # Why the last worker start failed; reported when no worker is alive or starting
+        self.start_error = None
+        self.closed = threading.Event()
+        # Affinity key -> worker that last served it; its memoized R stages make it the best pick
+        self.affinity = OrderedDict()
+        self.affinity_lock = threading.Lock()
+
+        # Workers start in the background; run() waits until one is idle
+        for worker in self.workers:
+            self._restart(worker)
+
+        if health_check_interval > 0:
+            threading.Thread(target=self._health_check_loop, args=(health_check_interval,), daemon=True).start()
+
+    def _restart(self, worker):
+        def restart():
+            worker.kill()
+            try:
+                worker.start()
+            except (RWorkerError, RAnalysisError, OSError) as e:
+                logging.error(f"Could not start R worker: {e}")
+                # The health check loop retries failed workers
+                self.start_error = e
+                self.failed.add(worker)
+                return
+            if self.closed.is_set():
+                worker.stop()
+            else:
+                self.idle.put(worker)
+
+        threading.Thread(target=restart, daemon=True).start()
+
+    # Function to take the given worker out of the idle queue if it is idle right now
+    def _take_idle(self, worker):
+        with self.idle.mutex:
+            try:
+                self.idle.queue.remove(worker)
+            except ValueError:
+                return False
+            self.idle.not_full.notify()
+            return True
+
+    def _remember(self, affinity, worker):
+        if affinity is None:
+            return
+        with self.affinity_lock:
+            self.affinity[affinity] = worker
+            self.affinity.move_to_end(affinity)
+            while len(self.affinity) > AFFINITY_KEYS:
+                self.affinity.popitem(last=False)
+
+    # Function to wait for an idle worker, preferring the one that last served the same
+    # affinity key when it is idle; a busy preferred worker is not waited for. When every
+    # worker has failed to start (e.g. Rscript is missing), there is nothing to wait for.
+    def _acquire(self, timeout, cancel_event=None, affinity=None):
+        if affinity is not None:
+            with self.affinity_lock:
+                preferred = self.affinity.get(affinity)
+            if preferred is not None and self._take_idle(preferred):
+                return preferred
+
+        deadline = time.monotonic() + timeout
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise RWorkerCancelled("Request was cancelled while waiting for an R worker")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RWorkerTimeout(f"No R worker became available within {timeout:g} seconds")
+            try:
+                return self.idle.get(timeout=min(remaining, CANCEL_POLL_INTERVAL))
+            except queue.Empty:
+                if len(self.failed) >= len(self.workers):
+                    raise RWorkerError(f"No R worker could be started: {self.start_error}")
+
+    def run(self, args, timeout=None, cancel_event=None, affinity=None):
+        timeout = timeout or self.request_timeout
+        worker = self._acquire(timeout, cancel_event, affinity)
+        try:
+            reply = worker.request({"cmd": "run", "args": args}, timeout, cancel_event)
+        except RAnalysisError:
+            self.idle.put(worker)
+            raise
+        except RWorkerError:
+            logging.error(f"R worker {worker.pid} failed, restarting it")
+            self._restart(worker)
+            raise
+        self._remember(affinity, worker)
+        self.idle.put(worker)
+        # No records when the worker wrote the result to the args' Arrow transport file
+        return reply.get("result")
+
+    # Generator yielding partial results as the worker evaluates the grid row by row
+    def stream(self, args, timeout=None, cancel_event=None, affinity=None):
+        timeout = timeout or self.request_timeout
+        worker = self._acquire(timeout, cancel_event, affinity)
+        reusable = False
+        try:
+            for reply in worker.request_stream({"cmd": "stream", "args": args}, timeout, cancel_event):
+                yield reply["result"]
+            reusable = True
+        except RAnalysisError:
+            reusable = True
+            raise
+        finally:
+            # A worker that crashed, timed out or was abandoned mid-stream is replaced
+            if reusable:
+                self._remember(affinity, worker)
+                self.idle.put(worker)
+            else:
+                logging.error(f"R worker {worker.pid} did not finish its stream, restarting it")
+                self._restart(worker)
+
+    def health_check(self):
+        # Ping every idle worker once; busy workers are checked by their request
+        healthy = 0
+        for _ in range(self.idle.qsize()):
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            if worker.ping():
+                healthy += 1
+                self.idle.put(worker)
+            else:
+                logging.error(f"R worker {worker.pid} failed its health check, restarting it")
+                self._restart(worker)
+        return healthy
+
+    def _health_check_loop(self, interval):
+        while not self.closed.wait(interval):
+            self.health_check()
+            # Retry workers whose start failed earlier
+            while self.failed:
+                self._restart(self.failed.pop())
+
+    def close(self):
+        self.closed.set()
+        for worker in self.workers:
+            worker.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Function to get the process-wide worker pool, starting it on first use
+def get_worker_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RWorkerPool()
+            atexit.register(_pool.close)
+            REGISTRY.callback("scpower_memoized_stages", "scPower stage functions memoized per R worker",
+                              lambda: [({"pid": str(worker.pid)}, len(worker.memoized_stages))
+                                       for worker in _pool.workers if worker.pid is not None])
+        return _pool
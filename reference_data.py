@@ -0,0 +1,104 @@
+import argparse
+import functools
+import json
+import logging
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+from logging_setup import configure_logging
+
+REFERENCE_DIR = os.environ.get("SCPOWER_REFERENCE_DIR", "reference_data")
+
+# Reference tables, the CSV export each one is converted from and the column it is indexed by
+REFERENCE_TABLES = {
+    "disp.fun.param": ("df.disp.fun.param.csv", "ct"),
+    "gamma.mixed.fits": ("df.gamma.mixed.fits.csv", "ct"),
+    "ref.study": ("df.ref.study.csv", "name"),
+    "read.umi.fit": ("df.read.umi.fit.csv", "type"),
+}
+
+
+# Function to turn one decoded JSON column into a typed Arrow array. Repeated strings
+# become dictionary arrays and R's "NA" strings in numeric columns become nulls.
+def to_arrow_column(values):
+    if not isinstance(values, list):
+        values = [values]
+    if all(isinstance(v, str) for v in values):
+        return pa.array(values, type=pa.string()).dictionary_encode()
+
+    values = [None if v == "NA" else v for v in values]
+    if all(v is None or isinstance(v, int) for v in values):
+        return pa.array(values, type=pa.int64())
+    return pa.array([float("nan") if v is None else v for v in values], type=pa.float64())
+
+
+# Function to decode a two-column name,value CSV export with one JSON string per column
+def read_csv_table(file_path):
+    df = pd.read_csv(file_path)
+    columns = {name: to_arrow_column(json.loads(value)) for name, value in zip(df['name'], df['value'])}
+    return pa.table(columns)
+
+
+def table_path(name, directory=REFERENCE_DIR):
+    return os.path.join(directory, f"{name}.arrow")
+
+
+# Function to convert the CSV exports into uncompressed Arrow IPC files that can be memory-mapped
+def convert_reference_data(source_dir=".", directory=REFERENCE_DIR):
+    os.makedirs(directory, exist_ok=True)
+    for name, (file_name, _) in REFERENCE_TABLES.items():
+        table = read_csv_table(os.path.join(source_dir, file_name))
+        path = table_path(name, directory)
+        with pa.OSFile(f"{path}.tmp", 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(f"{path}.tmp", path)
+        logging.info(f"Converted {file_name} to {path} ({table.num_rows} rows)")
+    load_reference_table.cache_clear()
+
+
+# Function to open one reference table as a pandas frame indexed by cell type, study
+# name or fit type. Numeric columns are read-only views of the memory-mapped file.
+@functools.lru_cache(maxsize=None)
+def load_reference_table(name, directory=REFERENCE_DIR):
+    file_name, index_column = REFERENCE_TABLES[name]
+    path = table_path(name, directory)
+    if os.path.exists(path):
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    else:
+        logging.warning(f"{path} not found, decoding {file_name} instead; run `python reference_data.py convert`")
+        table = read_csv_table(file_name)
+
+    df = table.to_pandas(split_blocks=True)
+    # Assigning the index keeps the column blocks as they are
+    df.index = pd.Index(df[index_column], name=None)
+    return df
+
+
+# Function to list the cell types with dispersion fits, in file order
+def reference_celltypes():
+    return list(dict.fromkeys(load_reference_table("disp.fun.param")["ct"]))
+
+
+# Function to list the reference studies, in file order
+def reference_studies():
+    return list(dict.fromkeys(load_reference_table("ref.study")["name"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the reference data CSV exports into memory-mappable Arrow files.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert = subparsers.add_parser('convert', help="Write <table>.arrow files")
+    convert.add_argument('--source', default=".", help="Directory holding the df.*.csv files")
+    convert.add_argument('--out', default=REFERENCE_DIR, help="Output directory")
+    options = parser.parse_args()
+
+    configure_logging()
+    if options.command == 'convert':
+        convert_reference_data(options.source, options.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import functools
+import gzip
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+
+from analysis_result import AnalysisResult
+from metrics import REGISTRY
+from r_worker_pool import RSCRIPT
+
+CACHE_DIR = os.environ.get("SCPOWER_CACHE_DIR", ".scpower_cache")
+CACHE_MEMORY_ITEMS = int(os.environ.get("SCPOWER_CACHE_MEMORY_ITEMS", "128"))
+CACHE_DISK_BYTES = int(os.environ.get("SCPOWER_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+
+REFERENCE_DATA_FILES = ["disp.fun.param.RData", "gamma.mixed.fits.RData", "read.umi.fit.RData", "ref.study.RData"]
+
+
+# Function to bring a value into a canonical form: sorted keys, floats rounded to
+# 12 significant digits and integral floats written as ints. One-element lists
+# are unboxed because jsonlite reads [10] and 10 as the same R value.
+def canonicalize(value):
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, float):
+        value = float(f"{value:.12g}")
+        return int(value) if value.is_integer() else value
+    if isinstance(value, int):
+        return value
+    if isinstance(value, dict):
+        return {str(k): canonicalize(value[k]) for k in sorted(value, key=str)}
+    if isinstance(value, (list, tuple)):
+        if len(value) == 1:
+            return canonicalize(value[0])
+        return [canonicalize(v) for v in value]
+    return value
+
+
+# Function to hash the reference data files the R side loads
+@functools.lru_cache(maxsize=None)
+def data_version():
+    digest = hashlib.sha256()
+    for file_name in REFERENCE_DATA_FILES:
+        with open(file_name, 'rb') as file:
+            digest.update(hashlib.sha256(file.read()).digest())
+    return digest.hexdigest()[:16]
+
+
+# Function to ask R for the installed scPower version (SCPOWER_VERSION overrides it)
+@functools.lru_cache(maxsize=None)
+def scpower_version():
+    if os.environ.get("SCPOWER_VERSION"):
+        return os.environ["SCPOWER_VERSION"]
+    try:
+        result = subprocess.run([RSCRIPT, '-e', 'cat(as.character(packageVersion("scPower")))'],
+                                capture_output=True, text=True, timeout=60)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logging.warning(f"Could not determine the scPower version: {e}")
+        return "unknown"
+    return result.stdout.strip() or "unknown"
+
+
+# Function to compute the content address of an args dict
+def args_hash(args):
+    payload = {
+        "args": canonicalize(args),
+        "data_version": data_version(),
+        "scpower_version": scpower_version(),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+# Two-tier cache of AnalysisResult objects: an in-process LRU in front of a
+# size-capped directory of gzip JSON files
+class ResultCache:
+    def __init__(self, directory=CACHE_DIR, memory_items=CACHE_MEMORY_ITEMS, disk_bytes=CACHE_DISK_BYTES):
+        self.directory = directory
+        self.memory_items = memory_items
+        self.disk_bytes = disk_bytes
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return self.memory[key]
+
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rt') as file:
+                value = AnalysisResult.from_json(file.read())
+            # Touch the file so disk eviction sees it as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Dropping unreadable cache entry {path}: {e}")
+            self._remove(path)
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.disk_hits += 1
+            self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        with self.lock:
+            self._remember(key, value)
+
+        # Write to a temporary file first so readers never see a partial entry
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(temp_path, 'wt') as file:
+            file.write(value.to_json())
+        os.replace(temp_path, path)
+        self._evict_disk()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _disk_entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json.gz'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict_disk(self):
+        # Remove the least recently used entries until the store fits its size budget
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.disk_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def invalidate(self, key=None):
+        # Drop one entry, or everything when no key is given
+        with self.lock:
+            if key is None:
+                self.memory.clear()
+            else:
+                self.memory.pop(key, None)
+        if key is None:
+            for _, _, path in self._disk_entries():
+                self._remove(path)
+        else:
+            self._remove(self._path(key))
+
+    def stats(self):
+        with self.lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_items": len(self.memory),
+                "disk_bytes": sum(size for _, size, _ in self._disk_entries()),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Function to get the process-wide result cache
+def get_result_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+            REGISTRY.callback("scpower_cache_lookups_total", "Result cache lookups by outcome", cache_lookups, "counter")
+        return _cache
+
+
+def cache_lookups():
+    stats = get_result_cache().stats()
+    return [({"outcome": "memory_hit"}, stats["memory_hits"]), ({"outcome": "disk_hit"}, stats["disk_hits"]),
+            ({"outcome": "miss"}, stats["misses"])]
+
+
+# Function to call when the RData files or the scPower installation change
+def invalidate_reference_data():
+    data_version.cache_clear()
+    scpower_version.cache_clear()
+    get_result_cache().invalidate()
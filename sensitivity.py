@@ -0,0 +1,147 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+
+import numpy as np
+
+from adaptive_grid import ADAPTIVE_KEY, POWER_COLUMN
+from analysis_args import FRACTION_ARGS, is_number, scenario_args
+from analysis_result import AnalysisResult
+from grid_sharding import RANGE_COLUMNS, SHARD_PARALLELISM, grid_ranges, merge_shards, stream_batches
+from logging_setup import configure_logging
+from power_engine import run_power_study
+
+# Scalar parameters a sensitivity sweep can vary, with the label shown in the app
+SENSITIVITY_PARAMS = {
+    "ct.freq": "Cell type frequency",
+    "ssize.ratio.de": "Sample size ratio",
+    "mappingEfficiency": "Mapping efficiency",
+    "multipletRate": "Multiplet rate",
+    "multipletFactor": "Multiplet factor",
+    "min.UMI.counts": "Minimal UMI per gene",
+    "perc.indiv.expr": "Fraction of individuals",
+    "sign.threshold": "P-value",
+}
+SENSITIVITY_MAX_PARAMS = 2
+# Upper limit on the parameter combinations of one sweep; every one is a full grid
+SENSITIVITY_MAX_COMBINATIONS = int(os.environ.get("SCPOWER_SENSITIVITY_MAX_COMBINATIONS", "100"))
+
+
+# Function to check a sweep {param: [values, ...]}; returns a list of problems, empty
+# when the sweep is valid
+def validate_sweep(sweep):
+    errors = []
+    if not 1 <= len(sweep) <= SENSITIVITY_MAX_PARAMS:
+        errors.append(f"A sweep varies 1 to {SENSITIVITY_MAX_PARAMS} parameters")
+    for name, values in sweep.items():
+        if name not in SENSITIVITY_PARAMS:
+            errors.append(f"{name} cannot be swept, use one of {', '.join(SENSITIVITY_PARAMS)}")
+        elif not values or not all(is_number(value) and value >= 0 for value in values):
+            errors.append(f"{name} must be swept over a list of non-negative numbers")
+        elif name in FRACTION_ARGS and not all(value <= 1 for value in values):
+            errors.append(f"{name} must be swept between 0 and 1")
+    combinations = int(np.prod([len(values) for values in sweep.values()])) if sweep else 0
+    if combinations > SENSITIVITY_MAX_COMBINATIONS:
+        errors.append(f"The sweep has {combinations} combinations, at most {SENSITIVITY_MAX_COMBINATIONS} are allowed")
+    return errors
+
+
+# Function to list the parameter combinations of a sweep, the last parameter varying fastest
+def sweep_combinations(sweep):
+    names = list(sweep)
+    return [dict(zip(names, values)) for values in itertools.product(*(sweep[name] for name in names))]
+
+
+# Function to get the args of one combination: the design grid of args with the swept
+# parameters set. Combinations are plain analyses, so they share the result cache and
+# the point store with the single runs, and the worker affinity of power stage settings.
+def sweep_args(args, combination):
+    args = {key: value for key, value in args.items() if key != ADAPTIVE_KEY}
+    return dict(args, **combination)
+
+
+# Function to label the rows of one combination's result with its parameter values.
+# The stored result is shared and stays unmodified.
+def label_result(result, combination):
+    return AnalysisResult(result.frame.assign(**combination), result.metadata)
+
+
+# Function to merge the labelled combination results into one long-format result: one
+# row per parameter combination and grid point, ordered like the sweep and, within a
+# combination, like a single run. The metadata names the dimensions of the tensor.
+def merge_sweep(args, sweep, results):
+    order = {json.dumps(combination): i for i, combination in enumerate(sweep_combinations(sweep))}
+    results = sorted(results, key=lambda item: order[json.dumps(item[0])])
+    (x_key, _), (y_key, _) = grid_ranges(args)
+    metadata = {"sensitivity": {
+        "params": list(sweep),
+        "values": sweep,
+        "grid": [RANGE_COLUMNS[x_key], RANGE_COLUMNS[y_key]],
+        "combinations": len(results),
+    }}
+    merged = [merge_shards(args, [label_result(result, combination)]) for combination, result in results]
+    return AnalysisResult.concat(merged, metadata)
+
+
+# Generator yielding (combination, result) for every combination of the sweep in
+# completion order, up to `parallelism` grids at once on the worker pool
+def stream_sensitivity(args, sweep, timeout=None, cancel_event=None, parallelism=SHARD_PARALLELISM):
+    errors = validate_sweep(sweep)
+    if errors:
+        raise ValueError("; ".join(errors))
+    combinations = sweep_combinations(sweep)
+    logging.info(f"Sensitivity sweep over {', '.join(sweep)}: {len(combinations)} combinations")
+    batches = [sweep_args(args, combination) for combination in combinations]
+    for batch, result in stream_batches(batches, lambda batch: run_power_study(batch, timeout, cancel_event=cancel_event),
+                                        parallelism):
+        yield {name: batch[name] for name in sweep}, result
+
+
+# Function to evaluate a whole sweep into one long-format result
+def run_sensitivity(args, sweep, timeout=None, cancel_event=None, parallelism=SHARD_PARALLELISM):
+    return merge_sweep(args, sweep, list(stream_sensitivity(args, sweep, timeout, cancel_event, parallelism)))
+
+
+# Function to get the best detection power over the design grid for every combination,
+# as a table indexed by the swept parameters: the surface of the sensitivity heatmap
+def best_power_table(result):
+    params = result.metadata["sensitivity"]["params"]
+    return result.frame.groupby(params)[POWER_COLUMN].max().reset_index()
+
+
+# Function to parse "name=v1,v2,..." or "name=lo:hi:steps" from the command line
+def parse_sweep(text):
+    name, _, values = text.partition("=")
+    if values.count(":") == 2:
+        lo, hi, steps = values.split(":")
+        return name, np.linspace(float(lo), float(hi), int(steps)).round(10).tolist()
+    return name, [float(value) for value in values.split(",") if value]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep one or two scalar parameters over the design grid of a scenario.")
+    parser.add_argument('scenario', help="JSON file with analysis parameters; left out ones take the app defaults")
+    parser.add_argument('--sweep', action='append', required=True, type=parse_sweep,
+                        help="Swept parameter as name=v1,v2,... or name=lo:hi:steps; give it once or twice")
+    parser.add_argument('--out', required=True, help="Parquet file for the long-format result")
+    parser.add_argument('--timeout', type=float, default=None, help="Seconds allowed per R computation")
+    options = parser.parse_args()
+
+    configure_logging()
+    with open(options.scenario) as file:
+        args = scenario_args(json.load(file))
+    sweep = dict(options.sweep)
+    errors = validate_sweep(sweep)
+    if errors:
+        raise SystemExit("; ".join(errors))
+    result = run_sensitivity(args, sweep, options.timeout)
+    data = result.to_parquet()
+    with open(options.out, 'wb') as file:
+        file.write(data)
+    logging.info(f"Sensitivity sweep: {len(result)} rows written to {options.out}")
+
+
+if __name__ == "__main__":
+    main()
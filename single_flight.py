@@ -0,0 +1,118 @@
+import logging
+import threading
+
+from adaptive_grid import stream_analysis
+from metrics import REGISTRY
+from r_worker_pool import CANCEL_POLL_INTERVAL, RWorkerCancelled
+from result_cache import args_hash
+
+
+# One computation shared by every request with the same parameter hash. Chunks
+# are kept so that requests joining late replay what was already streamed.
+class Flight:
+    def __init__(self, key):
+        self.key = key
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.waiters = 0
+        self.cancel_event = threading.Event()
+        self.condition = threading.Condition()
+
+    def follow(self, cancel_event=None):
+        index = 0
+        while True:
+            with self.condition:
+                while index == len(self.chunks) and not self.done:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise RWorkerCancelled("Analysis was cancelled")
+                    self.condition.wait(CANCEL_POLL_INTERVAL)
+                new_chunks = self.chunks[index:]
+                index = len(self.chunks)
+                finished = self.done
+            yield from new_chunks
+            if finished:
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+# Coalesces concurrent identical analyses: the first request starts the
+# computation in a background thread, later ones attach to it and all of them
+# receive the same stream of chunks. The computation is only cancelled when
+# every attached request has gone away.
+class SingleFlight:
+    def __init__(self, compute=stream_analysis):
+        self.compute = compute
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.computations = 0
+        self.coalesced = 0
+
+    def in_flight(self, key):
+        with self.lock:
+            return key in self.flights
+
+    def _run(self, flight, args, timeout):
+        try:
+            for chunk in self.compute(args, timeout, cancel_event=flight.cancel_event):
+                with flight.condition:
+                    flight.chunks.append(chunk)
+                    flight.condition.notify_all()
+        except Exception as e:
+            flight.error = e
+        finally:
+            with self.lock:
+                if self.flights.get(flight.key) is flight:
+                    del self.flights[flight.key]
+            with flight.condition:
+                flight.done = True
+                flight.condition.notify_all()
+
+    def stream(self, args, timeout=None, cancel_event=None, key=None):
+        key = key or args_hash(args)
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = Flight(key)
+                self.computations += 1
+                threading.Thread(target=self._run, args=(flight, args, timeout), daemon=True).start()
+            else:
+                self.coalesced += 1
+                logging.info(f"Attaching to the in-flight analysis {key[:12]} ({flight.waiters} waiting)")
+            flight.waiters += 1
+
+        try:
+            yield from flight.follow(cancel_event)
+        finally:
+            with self.lock:
+                flight.waiters -= 1
+                if flight.waiters == 0 and not flight.done:
+                    # Nobody is interested any more; later requests start afresh
+                    flight.cancel_event.set()
+                    if self.flights.get(key) is flight:
+                        del self.flights[key]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "computations": self.computations,
+                "coalesced": self.coalesced,
+                "in_flight": len(self.flights),
+            }
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+# Function to get the process-wide single-flight group
+def get_single_flight():
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight()
+            REGISTRY.callback("scpower_coalesced_requests_total",
+                              "Analyses that joined an identical running computation instead of starting one",
+                              lambda: [({}, _single_flight.stats()["coalesced"])], "counter")
+        return _single_flight
@@ -0,0 +1,232 @@
+import argparse
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from adaptive_grid import ADAPTIVE_KEY, POWER_COLUMN, TARGET_KEY
+from analysis_args import scenario_args, validate_args
+from analysis_result import AnalysisResult
+from grid_sharding import SHARD_PARALLELISM
+from logging_setup import configure_logging
+from point_store import get_point_store
+from power_engine import run_power_study
+from r_worker_pool import RWorkerCancelled
+from result_cache import args_hash
+
+# Dimensions the solver searches: the args key it sets, the default tolerance, in the
+# dimension's units, at which the search stops, and the smallest value it probes (a
+# differential expression design needs two samples)
+DIMENSIONS = {
+    "totalBudget": {"tolerance": 1000, "minimum": 1000},
+    "sampleSize": {"tolerance": 1, "minimum": 2},
+}
+TARGET_PROBES = int(os.environ.get("SCPOWER_TARGET_PROBES", str(max(SHARD_PARALLELISM, 2))))
+TARGET_MAX_ROUNDS = int(os.environ.get("SCPOWER_TARGET_MAX_ROUNDS", "12"))
+# Times the upper end of the search range is doubled when it does not reach the target
+TARGET_MAX_EXPANSIONS = 4
+
+
+# Function to get the args of one probe: the budget, or a single sample size with the
+# other grid range of args kept
+def probe_args(args, dimension, value):
+    args = {key: item for key, item in args.items() if key not in (ADAPTIVE_KEY, TARGET_KEY)}
+    if dimension == "totalBudget":
+        return dict(args, totalBudget=value)
+    if args.get("nSamplesRange") is None:
+        raise ValueError("A sample size search needs a grid with a sample size range")
+    return dict(args, nSamplesRange=[value])
+
+
+# Function to get the key of a search: the args without the searched dimension. Probes
+# of equal keys are interchangeable between searches, whatever their target power.
+def search_key(args, dimension):
+    fixed = probe_args(args, dimension, None)
+    return args_hash(dict(fixed, targetDimension=dimension))
+
+
+# Function to snap a value to the tolerance lattice, so that probes of different
+# searches coincide and are answered by the result cache
+def snap(value, tolerance):
+    return int(round(value / tolerance) * tolerance)
+
+
+# Function to get the best design of one probe: the grid point with the highest
+# detection power, or None when no design is feasible
+def best_design(result):
+    if not len(result):
+        return None
+    best = result.frame.loc[result.frame[POWER_COLUMN].idxmax()]
+    return {key: (value.item() if hasattr(value, 'item') else value) for key, value in best.items()}
+
+
+# Search for the smallest budget or sample size at which the best design of the args
+# grid reaches the target detection power. Probes spread over [low, high] (widened
+# when none reaches the target, narrowed by earlier probes of the same search) are
+# evaluated in parallel; then every round evaluates `probes` values between the
+# smallest probe that reached the target and the probe below it. Power need not grow
+# with the dimension (under a fixed budget more samples mean fewer cells each), so
+# the answer is the smallest probed value found to reach the target, and
+# "monotonic" tells whether the probes support it being the global minimum. The
+# search does not go below `low`: a target reached there is reported with
+# "atLowerBound" and without convergence. Returns the answer with its design and the trajectory of all probes.
+def solve_target_power(args, target, dimension="totalBudget", low=None, high=None, tolerance=None,
+                       probes=TARGET_PROBES, timeout=None, cancel_event=None):
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"dimension must be one of {', '.join(DIMENSIONS)}")
+    tolerance = tolerance or DIMENSIONS[dimension]["tolerance"]
+    if dimension == "totalBudget":
+        low, high = low or args["totalBudget"] / 4, high or args["totalBudget"] * 4
+    else:
+        samples = args.get("nSamplesRange") or [2]
+        samples = samples if isinstance(samples, list) else [samples]
+        low, high = low or min(samples), high or max(samples) * 4
+    minimum = max(DIMENSIONS[dimension]["minimum"], tolerance)
+    low = max(snap(low, tolerance), minimum)
+    high = max(snap(high, tolerance), low)
+
+    key = search_key(args, dimension)
+    store = get_point_store()
+    history = store.probes(key) if store is not None else {}
+    evaluated = {}
+    trajectory = []
+    lock = threading.Lock()
+
+    def evaluate(value):
+        if value in evaluated:
+            return evaluated[value]
+        if value in history:
+            power, design = history[value]
+            source = "history"
+        else:
+            result = run_power_study(probe_args(args, dimension, value), timeout, cancel_event=cancel_event)
+            design = best_design(result)
+            power = design[POWER_COLUMN] if design is not None else 0.0
+            source = "computed"
+            if store is not None:
+                store.put_probe(key, value, power, design)
+        with lock:
+            evaluated[value] = (power, design)
+            trajectory.append({dimension: value, POWER_COLUMN: power, "round": round_number, "source": source})
+        return power, design
+
+    def evaluate_all(values):
+        values = sorted(set(values) - set(evaluated))
+        with ThreadPoolExecutor(max_workers=max(1, min(probes, len(values) or 1))) as executor:
+            list(executor.map(evaluate, values))
+
+    # Earlier probes of the same search narrow the starting bracket
+    below = [value for value, (power, _) in history.items() if power < target and low <= value]
+    above = [value for value, (power, _) in history.items() if power >= target and value <= high]
+    if below and above and max(below) < min(above):
+        low, high = max(below), min(above)
+
+    round_number = 0
+    interior = [snap(low + (high - low) * (i + 1) / (probes + 1), tolerance) for i in range(max(probes - 2, 0))]
+    evaluate_all([low, high] + [value for value in interior if low < value < high])
+
+    def reached():
+        return sorted(value for value, (power, _) in evaluated.items() if power >= target)
+
+    expansions = 0
+    while not reached() and expansions < TARGET_MAX_EXPANSIONS:
+        if cancel_event is not None and cancel_event.is_set():
+            break
+        expansions += 1
+        round_number += 1
+        evaluate_all([max(evaluated) * 2])
+
+    reachable = bool(reached())
+    low = None
+    if reachable:
+        # The smallest probe that reached the target bounds the answer from above and
+        # the largest probe below it from below, wherever in the range they lie. No
+        # probe below means the target is reached at the lower end of the range.
+        high = reached()[0]
+        below = [value for value in evaluated if value < high]
+        low = max(below) if below else None
+        while low is not None and high - low > tolerance and round_number < TARGET_MAX_ROUNDS:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            round_number += 1
+            step = (high - low) / (probes + 1)
+            evaluate_all([snap(low + step * (i + 1), tolerance) for i in range(probes)])
+            high = min(value for value in evaluated if low < value <= high and evaluated[value][0] >= target)
+            low = max(value for value in evaluated if low <= value < high)
+
+    values = sorted(evaluated)
+    powers = [evaluated[value][0] for value in values]
+    answer = high if reachable else None
+    return {
+        "target": target,
+        "dimension": dimension,
+        "value": answer,
+        "power": evaluated[answer][0] if answer is not None else max(powers),
+        "design": evaluated[answer][1] if answer is not None else None,
+        "reachable": reachable,
+        "converged": reachable and low is not None and high - low <= tolerance,
+        "atLowerBound": reachable and low is None,
+        # With a probe below the power of a smaller one, a value below the answer may reach the target too
+        "monotonic": all(a <= b + 1e-9 for a, b in zip(powers, powers[1:])),
+        "computed": sum(1 for step in trajectory if step["source"] == "computed"),
+        "trajectory": sorted(trajectory, key=lambda step: (step["round"], step[dimension])),
+    }
+
+
+# Function to get the solve_target_power() keyword arguments of the targetPower object of args
+def target_options(args):
+    options = args[TARGET_KEY]
+    return {
+        "target": options["target"],
+        "dimension": options.get("dimension", "totalBudget"),
+        "low": options.get("low"),
+        "high": options.get("high"),
+        "tolerance": options.get("tolerance"),
+        "probes": int(options.get("probes") or TARGET_PROBES),
+    }
+
+
+# Function to get the number of probes a search is planned with: the first round,
+# the widenings of the range and the narrowing rounds
+def planned_probes(args):
+    probes = target_options(args)["probes"]
+    return max(probes, 2) + TARGET_MAX_EXPANSIONS + TARGET_MAX_ROUNDS * probes
+
+
+# Generator used by the job scheduler for args with a targetPower object: one chunk
+# with a row per probe and the solution in its metadata. A search stopped by a cancel
+# or the job timeout raises instead of returning a partial solution.
+def stream_target_power(args, timeout=None, cancel_event=None):
+    solution = solve_target_power(args, timeout=timeout, cancel_event=cancel_event, **target_options(args))
+    if cancel_event is not None and cancel_event.is_set():
+        raise RWorkerCancelled("Analysis was cancelled")
+    yield AnalysisResult.from_records(solution["trajectory"], {TARGET_KEY: solution})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the smallest budget or sample size reaching a target power.")
+    parser.add_argument('scenario', help="JSON file with analysis parameters; left out ones take the app defaults")
+    parser.add_argument('--target', type=float, required=True, help="Required detection power, e.g. 0.8")
+    parser.add_argument('--dimension', choices=list(DIMENSIONS), default="totalBudget")
+    parser.add_argument('--low', type=float, help="Lower end of the search range")
+    parser.add_argument('--high', type=float, help="Upper end of the search range")
+    parser.add_argument('--tolerance', type=float, help="Width of the range the search stops at")
+    parser.add_argument('--probes', type=int, default=TARGET_PROBES, help="Values evaluated in parallel per round")
+    options = parser.parse_args()
+
+    configure_logging()
+    with open(options.scenario) as file:
+        args = scenario_args(json.load(file))
+    errors = validate_args(args)
+    if errors:
+        raise SystemExit("; ".join(errors))
+    solution = solve_target_power(args, options.target, options.dimension, options.low, options.high,
+                                  options.tolerance, options.probes)
+    logging.info(f"Target power {options.target}: {options.dimension} {solution['value']} "
+                 f"after {solution['computed']} computed probes")
+    print(json.dumps(solution, indent=2))
+
+
+if __name__ == "__main__":
+    main()
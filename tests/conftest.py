@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# The tests never start R: they use a scratch cache directory, no point store and a
+# fixed scPower version for args_hash(), which reads the reference data files from
+# the working directory
+os.environ["SCPOWER_CACHE_DIR"] = tempfile.mkdtemp(prefix="scpower-tests-")
+os.environ["SCPOWER_POINT_STORE"] = "off"
+os.environ["SCPOWER_VERSION"] = "test"
+os.chdir(REPO_DIR)
@@ -0,0 +1,67 @@
+import pytest
+
+from analysis_args import DEFAULT_ARGS, scenario_args, validate_args
+
+
+def test_default_args_are_valid():
+    assert validate_args(dict(DEFAULT_ARGS)) == []
+
+
+def test_scenario_args_rejects_unknown_parameters():
+    with pytest.raises(ValueError, match="costKits"):
+        scenario_args({"costKits": 1})
+
+
+@pytest.mark.parametrize("value", [10, [10], 10.0])
+def test_valid_independent_snps(value):
+    assert validate_args(dict(DEFAULT_ARGS, indepSNPs=value)) == []
+
+
+@pytest.mark.parametrize("value", [0, -5, [0], 2.5, "10", [10, 20], None])
+def test_invalid_independent_snps(value):
+    assert "indepSNPs must be a positive integer" in validate_args(dict(DEFAULT_ARGS, indepSNPs=value))
+
+
+@pytest.mark.parametrize("options", [
+    {"steps": 5, "maxEvaluations": 100},
+    {"steps": 7, "maxEvaluations": 49, "tolerance": 0.5},
+    {},
+])
+def test_valid_adaptive_search(options):
+    assert validate_args(dict(DEFAULT_ARGS, adaptiveSearch=options)) == []
+
+
+@pytest.mark.parametrize("options, message", [
+    ({"steps": "x"}, "adaptiveSearch.steps"),
+    ({"steps": 0}, "adaptiveSearch.steps"),
+    ({"steps": 2.5}, "adaptiveSearch.steps"),
+    ({"maxEvaluations": True}, "adaptiveSearch.maxEvaluations"),
+    ({"maxEvaluations": 4}, "adaptiveSearch.maxEvaluations"),
+    ({"tolerance": "1"}, "adaptiveSearch.tolerance"),
+    ({"tolerance": 0}, "adaptiveSearch.tolerance"),
+    ({"step": 5}, "Unknown adaptiveSearch option: step"),
+])
+def test_invalid_adaptive_search(options, message):
+    errors = validate_args(dict(DEFAULT_ARGS, adaptiveSearch=options))
+    assert any(message in error for error in errors), errors
+
+
+def test_adaptive_search_must_be_an_object():
+    assert validate_args(dict(DEFAULT_ARGS, adaptiveSearch=5)) != []
+
+
+@pytest.mark.parametrize("options, message", [
+    ({"target": 1.5}, "targetPower.target"),
+    ({"target": 0.8, "dimension": "readDepth"}, "targetPower.dimension"),
+    ({"target": 0.8, "low": 5000, "high": 1000}, "targetPower.low"),
+    ({"target": 0.8, "probes": 0}, "targetPower.probes"),
+    ({"target": 0.8, "goal": 1}, "Unknown targetPower option: goal"),
+])
+def test_invalid_target_power(options, message):
+    errors = validate_args(dict(DEFAULT_ARGS, targetPower=options))
+    assert any(message in error for error in errors), errors
+
+
+def test_target_power_is_not_combined_with_adaptive_search():
+    assert validate_args(dict(DEFAULT_ARGS, targetPower={"target": 0.8}, adaptiveSearch={})) != []
+    assert validate_args(dict(DEFAULT_ARGS, targetPower={"target": 0.8, "dimension": "sampleSize"})) == []
@@ -0,0 +1,48 @@
+import json
+
+import pyarrow as pa
+
+from analysis_result import ARROW_METADATA_KEY, AnalysisResult, session_memory_usage
+
+RECORDS = [
+    {"name": "study", "Detection.power": 0.694, "sampleSize": 10, "totalCells": 2000, "readDepth": 662951.3628},
+    {"name": "study", "Detection.power": 0.702, "sampleSize": 20, "totalCells": 2000, "readDepth": 331475.6814},
+]
+METADATA = {"adaptive": {"evaluations": 2, "levels": [{"level": 0, "points": 2}]}}
+
+
+def test_arrow_stream_round_trip_keeps_rows_and_metadata():
+    result = AnalysisResult.from_records(RECORDS, METADATA)
+    restored = AnalysisResult.from_arrow_stream(result.to_arrow_stream())
+    assert restored.metadata == METADATA
+    assert restored.to_records() == result.to_records()
+    assert list(restored.frame.dtypes) == list(result.frame.dtypes)
+
+
+def test_to_arrow_keeps_the_pandas_schema_metadata():
+    table = AnalysisResult.from_records(RECORDS, METADATA).to_arrow()
+    assert json.loads(table.schema.metadata[ARROW_METADATA_KEY]) == METADATA
+    assert b"pandas" in table.schema.metadata
+
+
+def test_to_arrow_without_metadata():
+    table = AnalysisResult.from_records(RECORDS).to_arrow()
+    assert ARROW_METADATA_KEY not in table.schema.metadata
+    assert AnalysisResult.from_arrow(table).metadata == {}
+
+
+def test_from_arrow_reads_plain_tables():
+    table = pa.Table.from_pylist(RECORDS)
+    assert AnalysisResult.from_arrow(table).to_records() == AnalysisResult.from_records(RECORDS).to_records()
+
+
+def test_json_has_no_float_noise():
+    text = AnalysisResult.from_records(RECORDS).to_json()
+    assert '"readDepth":662951.3628' in text
+
+
+def test_session_memory_usage_counts_prepared_text():
+    result = AnalysisResult.from_records(RECORDS)
+    csv = result.to_csv()
+    state = {"analysis_result": result, "result_view": {"result": result, "csv": csv, "scatter_axes": None}}
+    assert session_memory_usage(state) == result.memory_usage() + len(csv)
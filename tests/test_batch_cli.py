@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+import batch_cli
+from analysis_result import AnalysisResult
+from batch_cli import load_scenarios, run_batch
+
+
+def write_scenarios(tmp_path, scenarios):
+    path = tmp_path / "scenarios.json"
+    path.write_text(json.dumps(scenarios))
+    return str(path)
+
+
+def test_scenarios_take_the_default_args(tmp_path):
+    path = write_scenarios(tmp_path, [{"totalBudget": 60000}, {"type": "eqtl"}])
+    scenarios = load_scenarios([path])
+    assert [source for source, _ in scenarios] == [f"{path}#0", f"{path}#1"]
+    assert scenarios[0][1]["totalBudget"] == 60000 and scenarios[1][1]["type"] == "eqtl"
+
+
+@pytest.mark.parametrize("scenario, message", [
+    ({"targetPower": {"dimension": "sampleSize"}}, "targetPower.target"),
+    ({"adaptiveSearch": {"steps": "x"}}, "adaptiveSearch.steps"),
+    ({"indepSNPs": 0}, "indepSNPs"),
+    ({"costKits": 1}, "costKits"),
+    (5, "must be an object"),
+])
+def test_invalid_scenarios_stop_the_batch_before_it_runs(tmp_path, scenario, message):
+    path = write_scenarios(tmp_path, [{}, scenario])
+    with pytest.raises(SystemExit, match=message) as exit_info:
+        load_scenarios([path])
+    assert f"{path}#1" in str(exit_info.value)
+
+
+# An unexpected error in one scenario is counted as failed; the others still run
+def test_scenario_errors_do_not_abort_the_batch(tmp_path, monkeypatch):
+    def run_power_study(args, timeout=None):
+        if args["totalBudget"] == 60000:
+            raise KeyError("Detection.power")
+        return AnalysisResult.from_records([{"Detection.power": 0.5, "sampleSize": 10, "totalCells": 2000}])
+
+    monkeypatch.setattr(batch_cli, "run_power_study", run_power_study)
+    path = write_scenarios(tmp_path, [{"totalBudget": 50000}, {"totalBudget": 60000}, {"totalBudget": 70000}])
+    summary = run_batch([path], str(tmp_path / "out"), output_format='csv', workers=2)
+    assert summary["done"] == 2 and summary["failed"] == 1
+    assert len(list((tmp_path / "out" / "results").iterdir())) == 2
@@ -0,0 +1,27 @@
+from adaptive_grid import POWER_COLUMN
+from celltype_comparison import rank_celltypes
+
+
+def test_ranks_by_power_with_failed_cell_types_last():
+    table = rank_celltypes([
+        {"celltype": "B cells", POWER_COLUMN: 0.4},
+        {"celltype": "NK cells", POWER_COLUMN: None, "error": "failed"},
+        {"celltype": "CD4 T cells", POWER_COLUMN: 0.7},
+    ])
+    assert list(table["celltype"]) == ["CD4 T cells", "B cells", "NK cells"]
+    assert list(table["rank"]) == [1, 2, 3]
+
+
+# Cancelling a comparison before any cell type has finished leaves only error rows
+def test_all_cell_types_failed_or_cancelled():
+    table = rank_celltypes([
+        {"celltype": "B cells", "error": "cancelled or expired"},
+        {"celltype": "NK cells", "error": "cancelled or expired"},
+    ])
+    assert list(table["celltype"]) == ["B cells", "NK cells"]
+    assert list(table["rank"]) == [1, 2]
+    assert table[POWER_COLUMN].isna().all()
+
+
+def test_no_cell_types():
+    assert rank_celltypes([]).empty
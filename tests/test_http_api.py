@@ -0,0 +1,28 @@
+import json
+
+from tornado.testing import AsyncHTTPTestCase
+
+from http_api import make_app
+
+
+# Requests that are rejected before an analysis is queued; none of them reaches R
+class InvalidRequestTest(AsyncHTTPTestCase):
+    def get_app(self):
+        return make_app()
+
+    def post_job(self, body):
+        return self.fetch("/jobs", method="POST", body=json.dumps(body))
+
+    def test_invalid_adaptive_search_is_a_bad_request(self):
+        response = self.post_job({"adaptiveSearch": {"steps": "x"}})
+        assert response.code == 400
+        assert "adaptiveSearch.steps" in json.loads(response.body)["error"]
+
+    def test_unknown_parameter_is_a_bad_request(self):
+        assert self.post_job({"costKits": 1}).code == 400
+
+    def test_body_must_be_an_object(self):
+        assert self.post_job([1, 2]).code == 400
+
+    def test_unknown_job(self):
+        assert self.fetch("/jobs/0123abcd").code == 404
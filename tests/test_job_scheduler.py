@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+
+from analysis_args import DEFAULT_ARGS
+from analysis_result import AnalysisResult
+from job_scheduler import JobScheduler
+from r_worker_pool import RWorkerCancelled
+from single_flight import SingleFlight
+
+
+# Stand-in for stream_analysis: every analysis blocks until the test releases it and
+# then yields one row; the budgets of the started analyses are recorded in order
+class FakeAnalyses:
+    def __init__(self):
+        self.started = []
+        self.released = threading.Semaphore(0)
+
+    def __call__(self, args, timeout=None, cancel_event=None):
+        self.started.append(args["totalBudget"])
+        while not self.released.acquire(timeout=0.01):
+            if cancel_event.is_set():
+                raise RWorkerCancelled("Analysis was cancelled")
+        yield AnalysisResult.from_records([{"Detection.power": 0.5, "sampleSize": 10, "totalCells": 2000,
+                                            "totalBudget": args["totalBudget"]}])
+
+    def release(self, count=1):
+        for _ in range(count):
+            self.released.release()
+
+
+@pytest.fixture
+def analyses():
+    return FakeAnalyses()
+
+
+def make_scheduler(analyses, **kwargs):
+    return JobScheduler(max_concurrent=1, timeout=30, single_flight=SingleFlight(analyses), **kwargs)
+
+
+def submit(scheduler, budget, user):
+    return scheduler.submit(dict(DEFAULT_ARGS, totalBudget=budget), user=user)
+
+
+def wait_until(condition):
+    for _ in range(500):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+def state(scheduler, job_id):
+    return scheduler.status(job_id)["state"]
+
+
+# A burst of submissions from one user does not make another user wait behind all of it
+def test_queued_jobs_are_served_round_robin(analyses):
+    scheduler = make_scheduler(analyses)
+    first = submit(scheduler, 10000, "a")
+    wait_until(lambda: analyses.started == [10000])
+    jobs = [submit(scheduler, 20000, "a"), submit(scheduler, 30000, "a"), submit(scheduler, 40000, "b")]
+    assert [scheduler.status(job_id)["queue_position"] for job_id in jobs] == [1, 3, 2]
+
+    analyses.release(4)
+    wait_until(lambda: all(state(scheduler, job_id) == "done" for job_id in [first] + jobs))
+    assert analyses.started == [10000, 20000, 40000, 30000]
+    assert scheduler.result(jobs[2]).frame["totalBudget"].tolist() == [40000]
+
+
+# An identical analysis joins the running one without taking a slot or computing again
+def test_identical_job_follows_the_running_one(analyses):
+    scheduler = make_scheduler(analyses)
+    first = submit(scheduler, 10000, "a")
+    wait_until(lambda: analyses.started == [10000])
+    second = submit(scheduler, 10000, "b")
+    assert state(scheduler, second) == "running"
+    assert scheduler.running == 1
+
+    wait_until(lambda: scheduler.single_flight.stats()["coalesced"] == 1)
+    analyses.release()
+    wait_until(lambda: state(scheduler, first) == state(scheduler, second) == "done")
+    assert analyses.started == [10000]
+    assert scheduler.result(second).to_records() == scheduler.result(first).to_records()
+
+
+def test_cancel_queued_and_running_jobs(analyses):
+    scheduler = make_scheduler(analyses)
+    running = submit(scheduler, 10000, "a")
+    wait_until(lambda: analyses.started == [10000])
+    queued = submit(scheduler, 20000, "a")
+
+    assert scheduler.cancel(queued)
+    assert state(scheduler, queued) == "cancelled"
+    # The cancelled job no longer counts as waiting
+    waiting = submit(scheduler, 30000, "b")
+    assert scheduler.status(waiting)["queue_length"] == scheduler.queue_depth() == 1
+    assert scheduler.cancel(waiting)
+    assert scheduler.cancel(running)
+    wait_until(lambda: scheduler.running == 0)
+    assert state(scheduler, running) == "cancelled"
+    assert scheduler.result(running) is None
+    # The cancelled queued job is never started
+    assert analyses.started == [10000]
+    assert not scheduler.cancel(running)
+
+
+def test_finished_jobs_are_purged_after_the_retention(analyses):
+    scheduler = make_scheduler(analyses, retention=0)
+    running = submit(scheduler, 10000, "a")
+    wait_until(lambda: analyses.started == [10000])
+    scheduler.cancel(running)
+    # The job is cancelled but its thread has not stopped yet: it has no finished_at
+    finished = submit(scheduler, 20000, "a")
+    assert scheduler.status(running) is not None
+
+    # The cancelled analysis may still take a release before it notices the cancel
+    analyses.release(2)
+    wait_until(lambda: state(scheduler, finished) == "done")
+    time.sleep(0.01)
+    submit(scheduler, 30000, "a")
+    assert scheduler.status(running) is None
+    assert scheduler.status(finished) is None
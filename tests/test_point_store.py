@@ -0,0 +1,78 @@
+import pytest
+
+from analysis_args import DEFAULT_ARGS
+from analysis_result import AnalysisResult
+from point_store import PointStore, snap_to_lattice
+
+ARGS = dict(DEFAULT_ARGS, nSamplesRange=[10, 20], nCellsRange=[2000, 4000])
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PointStore(str(tmp_path / "points.sqlite"))
+
+
+# Function to get the result R would return for args, without the points in `infeasible`
+def grid_result(args, infeasible=()):
+    return AnalysisResult.from_records([
+        {"Detection.power": samples / 100 + cells / 100000, "sampleSize": samples, "totalCells": cells}
+        for cells in args["nCellsRange"] for samples in args["nSamplesRange"]
+        if (samples, cells) not in infeasible])
+
+
+def test_empty_store_misses_every_point(store):
+    result, missing = store.lookup(ARGS)
+    assert len(result) == 0
+    assert missing == [(10, 2000), (20, 2000), (10, 4000), (20, 4000)]
+
+
+def test_stored_points_are_reused_by_an_overlapping_grid(store):
+    store.put(ARGS, grid_result(ARGS, infeasible={(20, 4000)}))
+    wider = dict(ARGS, nSamplesRange=[10, 20, 30])
+    result, missing = store.lookup(wider)
+    # The point R returned no row for is known and not asked for again
+    assert missing == [(30, 2000), (30, 4000)]
+    assert sorted(zip(result.frame["sampleSize"], result.frame["totalCells"])) == [(10, 2000), (10, 4000), (20, 2000)]
+    assert store.stats() == {"reused": 4, "computed": 4}
+
+
+def test_points_of_other_parameters_are_not_reused(store):
+    store.put(ARGS, grid_result(ARGS))
+    _, missing = store.lookup(dict(ARGS, totalBudget=60000))
+    assert len(missing) == 4
+
+
+def test_probes_round_trip(store):
+    design = {"sampleSize": 20, "totalCells": 4000}
+    store.put_probe("search", 30000, 0.75, design)
+    store.put_probe("search", 10000.0, 0.2, None)
+    assert store.probes("search") == {30000: (0.75, design), 10000: (0.2, None)}
+    assert store.probes("other") == {}
+
+
+def test_invalidate(store):
+    store.put(ARGS, grid_result(ARGS))
+    store.put_probe("search", 30000, 0.75, None)
+    store.invalidate()
+    assert len(store.lookup(ARGS)[1]) == 4
+    assert store.probes("search") == {}
+
+
+def test_snap_to_lattice_uses_nice_steps():
+    assert list(snap_to_lattice(10, 50, 5)) == [10, 20, 30, 40, 50]
+    # A step of 3000 is rounded to 2500; values stay within the range
+    assert list(snap_to_lattice(1000, 10000, 4)) == [2500, 5000, 7500, 10000]
+    assert list(snap_to_lattice(3, 997, 8)) == [200, 400, 600, 800]
+
+
+# Widening a range keeps the values evaluated before, so the store can reuse them
+def test_snap_to_lattice_is_stable_when_widening():
+    narrow = set(snap_to_lattice(2000, 10000, 5))
+    wide = set(snap_to_lattice(2000, 14000, 7))
+    assert narrow <= wide
+
+
+def test_snap_to_lattice_degenerate_ranges():
+    assert list(snap_to_lattice(30, 30, 5)) == [30]
+    assert list(snap_to_lattice(30, 10, 1)) == [10]
+    assert snap_to_lattice(10, 50, 5).dtype.kind == "i"
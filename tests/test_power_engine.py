@@ -0,0 +1,44 @@
+import sys
+
+import pytest
+
+import power_engine
+from power_engine import run_collector, stream_collector
+from r_worker_pool import RAnalysisError
+
+# Stand-in for scpower_collector.R: a lot of warnings on stderr, then the result rows,
+# or the collector's error message and a non-zero exit
+FAKE_COLLECTOR = """
+import json, sys
+args = json.load(open(sys.argv[1]))
+sys.stderr.write("Warning message: package loaded\\n" * 20000)
+if args["totalBudget"] < 0:
+    print("Error in optimize.constant.budget.restrictedDoublets:  budget too small")
+    sys.exit(1)
+for samples in (10, 20):
+    print(json.dumps({"Detection.power": 0.5, "sampleSize": samples}), flush=True)
+"""
+
+
+@pytest.fixture(autouse=True)
+def fake_collector(tmp_path, monkeypatch):
+    script = tmp_path / "collector.py"
+    script.write_text(FAKE_COLLECTOR)
+    monkeypatch.setattr(power_engine, "RSCRIPT", sys.executable)
+    monkeypatch.setattr(power_engine, "COLLECTOR_SCRIPT", str(script))
+    monkeypatch.setattr(power_engine, "TRANSPORT", "json")
+
+
+# More than a pipe buffer of stderr must not block the run until its timeout
+def test_stream_collector_drains_stderr():
+    chunks = list(stream_collector({"totalBudget": 50000}, timeout=20))
+    assert [chunk.to_records()[0]["sampleSize"] for chunk in chunks] == [10, 20]
+
+
+def test_streamed_and_single_runs_report_the_same_error():
+    with pytest.raises(RAnalysisError) as streamed:
+        list(stream_collector({"totalBudget": -1}, timeout=20))
+    with pytest.raises(RAnalysisError) as single:
+        run_collector({"totalBudget": -1}, timeout=20)
+    assert "budget too small" in str(streamed.value)
+    assert str(streamed.value) == str(single.value)
@@ -0,0 +1,22 @@
+import time
+
+import pytest
+
+import r_worker_pool
+from r_worker_pool import RWorkerError, RWorkerPool, RWorkerTimeout
+
+
+# Without Rscript no worker can start; requests fail with the start error right away
+# instead of waiting for the request timeout
+def test_missing_rscript_fails_requests_right_away(monkeypatch):
+    monkeypatch.setattr(r_worker_pool, "RSCRIPT", "/nonexistent/Rscript")
+    pool = RWorkerPool(size=2, request_timeout=60, health_check_interval=0)
+    try:
+        started = time.monotonic()
+        with pytest.raises(RWorkerError, match="No R worker could be started") as error:
+            pool.run({}, timeout=60)
+        assert not isinstance(error.value, RWorkerTimeout)
+        assert "/nonexistent/Rscript" in str(error.value)
+        assert time.monotonic() - started < 10
+    finally:
+        pool.close()
@@ -0,0 +1,29 @@
+from analysis_args import DEFAULT_ARGS
+from result_cache import args_hash, canonicalize
+
+
+def test_canonicalize_numbers():
+    assert canonicalize(1.0) == 1 and isinstance(canonicalize(1.0), int)
+    assert canonicalize(0.1 + 0.2) == 0.3
+    assert canonicalize(True) is True
+
+
+# R unboxes vectors of length one, so [10] and 10 are the same argument
+def test_canonicalize_unwraps_single_values():
+    assert canonicalize([10]) == 10
+    assert canonicalize((1.0, 2.5)) == [1, 2.5]
+
+
+def test_canonicalize_sorts_keys():
+    assert list(canonicalize({"b": 1, "a": 2})) == ["a", "b"]
+
+
+def test_equivalent_args_have_the_same_hash():
+    reordered = dict(reversed(list(DEFAULT_ARGS.items())))
+    assert args_hash(reordered) == args_hash(dict(DEFAULT_ARGS))
+    assert args_hash(dict(DEFAULT_ARGS, totalBudget=50000.0, indepSNPs=10)) == args_hash(dict(DEFAULT_ARGS))
+
+
+def test_different_args_have_different_hashes():
+    assert args_hash(dict(DEFAULT_ARGS, totalBudget=50001)) != args_hash(dict(DEFAULT_ARGS))
+    assert args_hash(dict(DEFAULT_ARGS, adaptiveSearch={})) != args_hash(dict(DEFAULT_ARGS))
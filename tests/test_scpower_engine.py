@@ -0,0 +1,58 @@
+import logging
+import re
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import r_worker_pool
+from r_worker_pool import RWorker
+
+
+# Function to read the scPower function names of MEMOIZED_STAGES from scpower_engine.R
+def memoized_stage_names():
+    with open("scpower_engine.R") as file:
+        block = re.search(r"MEMOIZED_STAGES <- list\((.*?)\n\)", file.read(), re.S).group(1)
+    return re.findall(r'"([^"]+)"', block)
+
+
+def scpower_installed():
+    if shutil.which(r_worker_pool.RSCRIPT) is None:
+        return False
+    check = subprocess.run([r_worker_pool.RSCRIPT, "-e", 'quit(status = !requireNamespace("scPower", quietly = TRUE))'],
+                           capture_output=True)
+    return check.returncode == 0
+
+
+def test_memoized_stages_are_listed():
+    names = memoized_stage_names()
+    assert "power.general.restrictedDoublets" in names
+    assert len(names) == len(set(names))
+
+
+@pytest.mark.skipif(not scpower_installed(), reason="R with scPower is not installed")
+def test_memoized_stages_exist_in_scpower():
+    listing = subprocess.run([r_worker_pool.RSCRIPT, "-e", 'cat(ls(asNamespace("scPower"), all.names = TRUE), sep = "\\n")'],
+                             capture_output=True, text=True, check=True)
+    missing = set(memoized_stage_names()) - set(listing.stdout.split())
+    assert not missing, f"scPower has no function {', '.join(sorted(missing))}"
+
+
+# A worker reporting stage functions scPower does not have is logged loudly
+def test_worker_reports_missing_stages(tmp_path, monkeypatch, caplog):
+    script = tmp_path / "worker.py"
+    script.write_text(
+        "import json, sys\n"
+        "print('@@scpower ' + json.dumps({'status': 'ready', 'pid': 1, 'scpower_version': '1.0',"
+        " 'memoized_stages': ['design/budgetCalculation'], 'missing_stages': ['umi.gamma.relation']}), flush=True)\n"
+        "sys.stdin.readline()\n")
+    monkeypatch.setattr(r_worker_pool, "RSCRIPT", sys.executable)
+    worker = RWorker(str(script))
+    with caplog.at_level(logging.WARNING):
+        worker.start(timeout=30)
+    try:
+        assert worker.memoized_stages == ["design/budgetCalculation"]
+        assert "umi.gamma.relation" in caplog.text
+    finally:
+        worker.kill()
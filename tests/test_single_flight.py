@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from analysis_args import DEFAULT_ARGS
+from analysis_result import AnalysisResult
+from r_worker_pool import RWorkerCancelled
+from single_flight import SingleFlight
+
+
+# Stand-in for stream_analysis yielding one chunk per budget step once it is let through
+class FakeAnalysis:
+    def __init__(self, chunks=3):
+        self.chunks = chunks
+        self.calls = 0
+        self.cancelled = threading.Event()
+        self.gates = [threading.Event() for _ in range(chunks)]
+
+    def __call__(self, args, timeout=None, cancel_event=None):
+        self.calls += 1
+        for index, gate in enumerate(self.gates):
+            while not gate.wait(0.01):
+                if cancel_event.is_set():
+                    self.cancelled.set()
+                    raise RWorkerCancelled("Analysis was cancelled")
+            yield AnalysisResult.from_records([{"Detection.power": 0.5, "sampleSize": 10 * (index + 1)}])
+
+    def open(self, index):
+        self.gates[index].set()
+
+
+def sample_sizes(chunks):
+    return [row["sampleSize"] for chunk in chunks for row in chunk.to_records()]
+
+
+def test_identical_requests_share_one_computation():
+    analysis = FakeAnalysis()
+    flight = SingleFlight(analysis)
+    first = flight.stream(dict(DEFAULT_ARGS))
+    analysis.open(0)
+    received = [next(first)]
+
+    # A request joining late replays the chunks streamed so far
+    second = flight.stream(dict(DEFAULT_ARGS))
+    late = [next(second)]
+    analysis.open(1)
+    analysis.open(2)
+    received += list(first)
+    late += list(second)
+
+    assert sample_sizes(received) == sample_sizes(late) == [10, 20, 30]
+    assert analysis.calls == 1
+    assert flight.stats() == {"computations": 1, "coalesced": 1, "in_flight": 0}
+
+
+def test_different_requests_are_computed_separately():
+    analysis = FakeAnalysis(chunks=1)
+    analysis.open(0)
+    flight = SingleFlight(analysis)
+    list(flight.stream(dict(DEFAULT_ARGS)))
+    list(flight.stream(dict(DEFAULT_ARGS, totalBudget=60000)))
+    assert analysis.calls == 2
+    assert flight.stats()["coalesced"] == 0
+
+
+# The computation goes on while one request is still attached, and stops after the last
+def test_computation_is_cancelled_when_every_request_has_gone():
+    analysis = FakeAnalysis()
+    flight = SingleFlight(analysis)
+    first_cancel, second_cancel = threading.Event(), threading.Event()
+    first = flight.stream(dict(DEFAULT_ARGS), cancel_event=first_cancel)
+    second = flight.stream(dict(DEFAULT_ARGS), cancel_event=second_cancel)
+    analysis.open(0)
+    next(first)
+    next(second)
+
+    first_cancel.set()
+    with pytest.raises(RWorkerCancelled):
+        next(first)
+    assert not analysis.cancelled.wait(0.1)
+
+    second_cancel.set()
+    with pytest.raises(RWorkerCancelled):
+        next(second)
+    assert analysis.cancelled.wait(5)
+    assert flight.stats()["in_flight"] == 0
@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+import target_power
+from adaptive_grid import TARGET_KEY
+from analysis_args import DEFAULT_ARGS
+from analysis_result import AnalysisResult
+from job_scheduler import JobScheduler
+from single_flight import SingleFlight
+from target_power import planned_probes, solve_target_power, stream_target_power
+
+
+# Function to replace the engine with a synthetic power curve over the searched dimension
+def use_curve(monkeypatch, dimension, curve):
+    calls = []
+
+    def run_power_study(args, timeout=None, use_cache=True, cancel_event=None):
+        value = args["totalBudget"] if dimension == "totalBudget" else args["nSamplesRange"][0]
+        calls.append(value)
+        return AnalysisResult.from_records([{"Detection.power": curve(value), "sampleSize": 10, "totalCells": 2000}])
+
+    monkeypatch.setattr(target_power, "run_power_study", run_power_study)
+    return calls
+
+
+def test_budget_search_on_a_monotone_curve(monkeypatch):
+    use_curve(monkeypatch, "totalBudget", lambda budget: min(budget / 100000, 1.0))
+    solution = solve_target_power(dict(DEFAULT_ARGS), 0.7, "totalBudget", 10000, 200000, probes=4)
+    assert solution["reachable"] and solution["converged"] and solution["monotonic"]
+    assert not solution["atLowerBound"]
+    assert 70000 <= solution["value"] < 70000 + 1000
+    assert solution["power"] >= 0.7
+
+
+# Under a fixed budget, more samples mean fewer cells per sample: power peaks and falls
+def test_sample_size_search_on_a_non_monotone_curve(monkeypatch):
+    calls = use_curve(monkeypatch, "sampleSize", lambda samples: 0.9 - abs(samples - 40) / 100)
+    solution = solve_target_power(dict(DEFAULT_ARGS), 0.8, "sampleSize", 10, 200, probes=4)
+    assert solution["reachable"] and solution["converged"]
+    assert solution["value"] == 30
+    assert not solution["monotonic"]
+    # The upper end did not reach the target, but an interior probe did: no widening
+    assert max(calls) <= 200
+
+
+# The search does not probe below the requested range
+def test_target_reached_at_the_lower_end(monkeypatch):
+    calls = use_curve(monkeypatch, "totalBudget", lambda budget: 0.9)
+    solution = solve_target_power(dict(DEFAULT_ARGS), 0.8, "totalBudget", 8000, 16000, probes=2)
+    assert solution["reachable"] and solution["atLowerBound"] and not solution["converged"]
+    assert solution["value"] == 8000
+    assert min(calls) == 8000
+
+
+# A differential expression design needs two samples
+def test_sample_size_search_starts_at_two_samples(monkeypatch):
+    calls = use_curve(monkeypatch, "sampleSize", lambda samples: 0.9)
+    solution = solve_target_power(dict(DEFAULT_ARGS), 0.8, "sampleSize", 1, 50, probes=3)
+    assert solution["value"] == 2 and solution["atLowerBound"] and not solution["converged"]
+    assert min(calls) == 2
+
+
+def test_unreachable_target(monkeypatch):
+    calls = use_curve(monkeypatch, "totalBudget", lambda budget: 0.5)
+    solution = solve_target_power(dict(DEFAULT_ARGS), 0.8, "totalBudget", 10000, 20000, probes=2)
+    assert not solution["reachable"]
+    assert solution["value"] is None and solution["design"] is None
+    assert solution["power"] == 0.5
+    assert len(calls) == 2 + target_power.TARGET_MAX_EXPANSIONS
+
+
+def test_sample_size_search_needs_a_sample_size_range():
+    with pytest.raises(ValueError):
+        solve_target_power(dict(DEFAULT_ARGS, nSamplesRange=None, readDepthRange=[1000, 2000]), 0.8, "sampleSize")
+
+
+# A targetPower request is a job like a grid analysis; its result holds the probes
+# and the solution
+def test_target_power_job(monkeypatch):
+    use_curve(monkeypatch, "totalBudget", lambda budget: min(budget / 100000, 1.0))
+    scheduler = JobScheduler(max_concurrent=1, single_flight=SingleFlight())
+    options = {"target": 0.7, "low": 10000, "high": 200000, "probes": 4}
+    job_id = scheduler.submit(dict(DEFAULT_ARGS, **{TARGET_KEY: options}))
+    for _ in range(200):
+        if scheduler.status(job_id)["state"] not in ("queued", "running"):
+            break
+        time.sleep(0.05)
+    assert scheduler.status(job_id)["state"] == "done"
+    result = scheduler.result(job_id)
+    solution = result.metadata[TARGET_KEY]
+    assert solution["reachable"] and 70000 <= solution["value"] < 71000
+    assert len(result) == len(solution["trajectory"])
+
+
+def test_planned_probes_bound_the_search(monkeypatch):
+    calls = use_curve(monkeypatch, "totalBudget", lambda budget: min(budget / 100000, 1.0))
+    args = dict(DEFAULT_ARGS, **{TARGET_KEY: {"target": 0.7, "low": 10000, "high": 200000, "probes": 4}})
+    next(stream_target_power(args))
+    assert len(calls) <= planned_probes(args)